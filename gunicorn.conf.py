@@ -0,0 +1,38 @@
+"""
+Gunicorn settings for the production server (python main.py).
+
+Gunicorn manages uvicorn workers (uvloop event loop, httptools parser). The
+app is imported once in the master and forked; importing it opens no
+connections, each worker creates its own engine and Redis clients in the
+lifespan startup.
+"""
+import multiprocessing
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from src.config import settings
+
+worker_class = "src.worker.TaskAppWorker"
+workers = settings.web_concurrency or multiprocessing.cpu_count()
+bind = f"{settings.host}:{settings.port}"
+preload_app = True
+
+# SIGTERM stops accepting connections and drains in-flight requests for up
+# to graceful_timeout before workers are killed
+graceful_timeout = settings.graceful_timeout
+timeout = settings.worker_timeout
+keepalive = settings.keepalive
+
+max_requests = settings.max_requests
+max_requests_jitter = settings.max_requests_jitter
+
+accesslog = "-"
+errorlog = "-"
+loglevel = "debug" if settings.debug else "info"
+
+
+def post_fork(server, worker):
+    # Connection pools are split across the final worker count (command line included)
+    settings.web_concurrency = server.cfg.workers
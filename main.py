@@ -1,13 +1,17 @@
-from fastapi import FastAPI
+"""
+Production entrypoint.
 
-app = FastAPI()
+    python main.py                  # gunicorn with one uvicorn worker per core
+    python main.py --workers 4      # any gunicorn command line option
 
+For development use `uvicorn src.main:app --reload`.
+"""
+import os
+import sys
 
-@app.get("/")
-async def root():
-    return {"message": "Hello World"}
+from gunicorn.app.wsgiapp import run
 
-
-@app.get("/hello/{name}")
-async def say_hello(name: str):
-    return {"message": f"Hello {name}"}
+if __name__ == "__main__":
+    config = os.path.join(os.path.dirname(os.path.abspath(__file__)), "gunicorn.conf.py")
+    sys.argv = [sys.argv[0], "--config", config, *sys.argv[1:], "src.main:app"]
+    sys.exit(run())
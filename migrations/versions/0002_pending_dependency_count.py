@@ -0,0 +1,60 @@
+"""pending dependency count
+
+Revision ID: 0002
+Revises: 0001
+Create Date: 2026-10-19
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = "0002"
+down_revision = "0001"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column(
+        "tasks",
+        sa.Column("pending_dependency_count", sa.Integer(), server_default="0", nullable=False)
+    )
+    op.create_index(
+        "ix_tasks_pending_dependencies", "tasks", ["pending_dependency_count", "status"]
+    )
+
+    # Backfill from the existing dependency graph. MySQL can't update a table
+    # its own subquery reads (error 1093), there the counts come from a
+    # derived table, which GROUP BY keeps materialized
+    if op.get_bind().dialect.name == "mysql":
+        op.execute(
+            """
+            UPDATE tasks
+            JOIN (
+                SELECT task_dependencies.task_id, COUNT(*) AS pending
+                FROM task_dependencies
+                JOIN tasks AS depends_on ON depends_on.id = task_dependencies.depends_on_id
+                WHERE depends_on.status != 'COMPLETED'
+                GROUP BY task_dependencies.task_id
+            ) AS counts ON counts.task_id = tasks.id
+            SET tasks.pending_dependency_count = counts.pending
+            """
+        )
+    else:
+        op.execute(
+            """
+            UPDATE tasks SET pending_dependency_count = (
+                SELECT COUNT(*) FROM task_dependencies
+                JOIN tasks AS depends_on ON depends_on.id = task_dependencies.depends_on_id
+                WHERE task_dependencies.task_id = tasks.id AND depends_on.status != 'COMPLETED'
+            )
+            """
+        )
+
+
+def downgrade():
+    with op.batch_alter_table("tasks") as batch_op:
+        batch_op.drop_index("ix_tasks_pending_dependencies")
+        batch_op.drop_column("pending_dependency_count")
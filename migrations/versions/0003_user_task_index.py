@@ -0,0 +1,23 @@
+"""user task index
+
+Revision ID: 0003
+Revises: 0002
+Create Date: 2026-10-19
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = "0003"
+down_revision = "0002"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_index("ix_tasks_user_created", "tasks", ["user_id", "created_at", "id"])
+
+
+def downgrade():
+    op.drop_index("ix_tasks_user_created", table_name="tasks")
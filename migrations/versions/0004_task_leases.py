@@ -0,0 +1,34 @@
+"""task leases
+
+Revision ID: 0004
+Revises: 0003
+Create Date: 2026-10-19
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = "0004"
+down_revision = "0003"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column("tasks", sa.Column("lease_owner", sa.String(length=64), nullable=True))
+    op.add_column("tasks", sa.Column("lease_expires_at", sa.DateTime(timezone=True), nullable=True))
+    op.create_index("ix_tasks_lease_expires", "tasks", ["status", "lease_expires_at"])
+    op.create_index(
+        "ix_tasks_claim", "tasks",
+        ["status", "pending_dependency_count", sa.text("priority DESC"), "id"]
+    )
+
+
+def downgrade():
+    with op.batch_alter_table("tasks") as batch_op:
+        batch_op.drop_index("ix_tasks_claim")
+        batch_op.drop_index("ix_tasks_lease_expires")
+        batch_op.drop_column("lease_expires_at")
+        batch_op.drop_column("lease_owner")
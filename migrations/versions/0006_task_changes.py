@@ -0,0 +1,37 @@
+"""task change log
+
+Revision ID: 0006
+Revises: 0005
+Create Date: 2026-10-19
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = "0006"
+down_revision = "0005"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        "task_changes",
+        sa.Column("seq", sa.BigInteger().with_variant(sa.Integer(), "sqlite"), autoincrement=True, nullable=False),
+        sa.Column("task_id", sa.Integer(), nullable=False),
+        sa.Column("user_id", sa.Integer(), nullable=True),
+        sa.Column("deleted", sa.Boolean(), nullable=False),
+        sa.Column("changed_at", sa.DateTime(timezone=True), nullable=False),
+        sa.PrimaryKeyConstraint("seq"),
+        sqlite_autoincrement=True
+    )
+    op.create_index("ix_task_changes_user_seq", "task_changes", ["user_id", "seq"])
+    op.create_index("ix_task_changes_changed_at", "task_changes", ["changed_at", "seq"])
+
+
+def downgrade():
+    op.drop_index("ix_task_changes_changed_at", table_name="task_changes")
+    op.drop_index("ix_task_changes_user_seq", table_name="task_changes")
+    op.drop_table("task_changes")
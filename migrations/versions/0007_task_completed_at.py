@@ -0,0 +1,29 @@
+"""task completed_at
+
+Revision ID: 0007
+Revises: 0006
+Create Date: 2026-10-19
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = "0007"
+down_revision = "0006"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column("tasks", sa.Column("completed_at", sa.DateTime(timezone=True), nullable=True))
+    # The last write is the best guess for tasks completed before the column existed
+    op.execute(
+        "UPDATE tasks SET completed_at = COALESCE(updated_at, created_at) WHERE status = 'COMPLETED'"
+    )
+
+
+def downgrade():
+    with op.batch_alter_table("tasks") as batch_op:
+        batch_op.drop_column("completed_at")
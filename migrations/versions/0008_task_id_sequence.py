@@ -0,0 +1,31 @@
+"""task id sequence
+
+Revision ID: 0008
+Revises: 0007
+Create Date: 2026-10-19
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = "0008"
+down_revision = "0007"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        "task_id_sequence",
+        sa.Column("id", sa.Integer(), autoincrement=True, nullable=False),
+        sa.PrimaryKeyConstraint("id"),
+        sqlite_autoincrement=True
+    )
+    # Ids allocated for shards continue after the tasks that already exist
+    op.execute("INSERT INTO task_id_sequence (id) SELECT id FROM tasks ORDER BY id DESC LIMIT 1")
+
+
+def downgrade():
+    op.drop_table("task_id_sequence")
@@ -0,0 +1,36 @@
+"""lead the claim and lease indexes with user_id
+
+Revision ID: 0009
+Revises: 0008
+Create Date: 2026-10-19
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = "0009"
+down_revision = "0008"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.drop_index("ix_tasks_claim", table_name="tasks")
+    op.drop_index("ix_tasks_lease_expires", table_name="tasks")
+    op.create_index("ix_tasks_lease_expires", "tasks", ["user_id", "status", "lease_expires_at"])
+    op.create_index(
+        "ix_tasks_claim", "tasks",
+        ["user_id", "status", "pending_dependency_count", sa.text("priority DESC"), "id"]
+    )
+
+
+def downgrade():
+    op.drop_index("ix_tasks_claim", table_name="tasks")
+    op.drop_index("ix_tasks_lease_expires", table_name="tasks")
+    op.create_index("ix_tasks_lease_expires", "tasks", ["status", "lease_expires_at"])
+    op.create_index(
+        "ix_tasks_claim", "tasks",
+        ["status", "pending_dependency_count", sa.text("priority DESC"), "id"]
+    )
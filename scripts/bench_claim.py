@@ -0,0 +1,151 @@
+#!/usr/bin/env python3
+"""
+Contention benchmark for POST /tasks/claim.
+
+Seeds ready tasks, then lets many concurrent workers drain them through
+TaskCRUD.claim_tasks (FOR UPDATE SKIP LOCKED) and reports throughput, claim
+latency and double claims. --mode locked runs the same loop with a plain
+FOR UPDATE to show the lock convoy SKIP LOCKED avoids. Needs MySQL 8 or
+PostgreSQL (SQLite serializes writers); run it against a scratch database,
+the workers claim every ready task in it.
+
+    python scripts/bench_claim.py --workers 200 --tasks 20000 --batch 10
+    python scripts/bench_claim.py --workers 200 --tasks 20000 --batch 10 --mode locked
+"""
+import argparse
+import statistics
+import sys
+import os
+import threading
+import time
+from collections import Counter
+from datetime import datetime, timedelta
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+
+from sqlalchemy import insert, update, delete
+from src.config import settings
+from src.crud.task import TaskCRUD
+from src.database import new_session
+from src.models.task import Task, TaskStatus, TaskPriority
+from src.models.user import User  # noqa: F401, target of tasks.user_id
+
+TITLE_PREFIX = "bench-claim-"
+
+
+def seed(count: int):
+    priorities = list(TaskPriority)
+    db = new_session()
+    try:
+        db.execute(insert(Task), [
+            {
+                "title": f"{TITLE_PREFIX}{i}",
+                "status": TaskStatus.PENDING,
+                "priority": priorities[i % len(priorities)],
+                "tags": [],
+                "pending_dependency_count": 0
+            }
+            for i in range(count)
+        ])
+        db.commit()
+    finally:
+        db.close()
+
+
+def cleanup():
+    db = new_session()
+    try:
+        db.execute(delete(Task).where(Task.title.like(f"{TITLE_PREFIX}%")))
+        db.commit()
+    finally:
+        db.close()
+
+
+def claim_locked(db, worker_id: str, n: int, lease_seconds: int):
+    """The same claim with a plain FOR UPDATE: concurrent claims queue on the same rows"""
+    now = datetime.now()
+    task_ids = [row[0] for row in db.query(Task.id).filter(
+        Task.status == TaskStatus.PENDING,
+        Task.pending_dependency_count == 0
+    ).order_by(*TaskCRUD._claim_order(db)).limit(n).with_for_update().all()]
+    if task_ids:
+        db.execute(
+            update(Task).where(Task.id.in_(task_ids)).values(
+                status=TaskStatus.IN_PROGRESS,
+                lease_owner=worker_id,
+                lease_expires_at=now + timedelta(seconds=lease_seconds)
+            )
+        )
+    db.commit()
+    return task_ids
+
+
+def worker(worker_id: str, args, claimed: Counter, latencies: list, lock: threading.Lock, errors: list):
+    db = new_session()
+    try:
+        while True:
+            started = time.perf_counter()
+            try:
+                if args.mode == "skip":
+                    tasks, _ = TaskCRUD.claim_tasks(db, worker_id, args.batch, 300)
+                    task_ids = [task.id for task in tasks]
+                else:
+                    task_ids = claim_locked(db, worker_id, args.batch, 300)
+            except Exception as e:
+                db.rollback()
+                errors.append(repr(e))
+                continue
+            elapsed = time.perf_counter() - started
+            with lock:
+                latencies.append(elapsed)
+                claimed.update(task_ids)
+            if not task_ids:
+                return
+    finally:
+        db.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark concurrent task claims")
+    parser.add_argument("--workers", type=int, default=100)
+    parser.add_argument("--tasks", type=int, default=10000)
+    parser.add_argument("--batch", type=int, default=10, help="Tasks per claim")
+    parser.add_argument("--mode", choices=["skip", "locked"], default="skip")
+    parser.add_argument("--keep", action="store_true", help="Keep the seeded tasks")
+    args = parser.parse_args()
+
+    # One connection per worker, or the workers queue on the pool instead of the rows
+    settings.db_pool_size = max(settings.db_pool_size or 0, args.workers)
+    print(f"Database: {settings.database_url.split('@')[-1]}")
+    seed(args.tasks)
+    claimed: Counter = Counter()
+    latencies: list = []
+    errors: list = []
+    lock = threading.Lock()
+    threads = [
+        threading.Thread(target=worker, args=(f"bench-{i}", args, claimed, latencies, lock, errors))
+        for i in range(args.workers)
+    ]
+
+    try:
+        started = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - started
+    finally:
+        if not args.keep:
+            cleanup()
+
+    latencies.sort()
+    doubles = sum(1 for count in claimed.values() if count > 1)
+    print(f"Mode: {args.mode}, {args.workers} workers, {args.batch} tasks per claim")
+    print(f"Claimed {len(claimed)} of {args.tasks} tasks in {elapsed:.2f}s ({len(claimed) / elapsed:.0f} tasks/s)")
+    print(f"Claims: {len(latencies)}, p50 {statistics.median(latencies) * 1000:.1f}ms, "
+          f"p99 {latencies[int(len(latencies) * 0.99) - 1] * 1000:.1f}ms, max {latencies[-1] * 1000:.1f}ms")
+    print(f"Double claims: {doubles}, errors (deadlocks, timeouts): {len(errors)}")
+
+
+if __name__ == "__main__":
+    main()
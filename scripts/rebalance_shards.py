@@ -0,0 +1,50 @@
+#!/usr/bin/env python3
+"""
+Move users' tasks to the shard the hash ring assigns them to.
+
+Run after changing SHARD_DATABASE_URLS, or move a single user explicitly:
+
+    python scripts/rebalance_shards.py
+    python scripts/rebalance_shards.py --user 42 --to shard2
+"""
+import argparse
+import sys
+import os
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+
+from src.crud.shard import ShardedTaskCRUD, get_shard_router
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Rebalance tasks across shards")
+    parser.add_argument("--user", type=int, help="Move a single user")
+    parser.add_argument("--to", help="Target shard name (defaults to the ring owner)")
+    args = parser.parse_args()
+
+    router = get_shard_router()
+    if router is None:
+        print("Sharding is disabled (SHARD_DATABASE_URLS is empty)")
+        return
+
+    crud = ShardedTaskCRUD(router)
+
+    try:
+        if args.user is not None:
+            target = args.to or router.shard_for_user(args.user)
+            router.reserve_existing_ids()
+            moved = 0
+            for shard in router.shard_names:
+                moved += crud.move_user(args.user, shard, target)
+            print(f"Moved {moved} tasks of user {args.user} to {target}")
+        else:
+            moved = crud.rebalance()
+            for user_id, target in moved.items():
+                print(f"User {user_id} -> {target}")
+            print(f"Rebalanced {len(moved)} users")
+    finally:
+        router.dispose()
+
+
+if __name__ == "__main__":
+    main()
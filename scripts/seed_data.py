@@ -8,7 +8,7 @@ import os
 sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
 
 from sqlalchemy.orm import Session
-from src.database import SessionLocal
+from src.database import new_session
 from src.models.task import Task, TaskStatus, TaskPriority
 from src.models.user import User
 from src.utils.security import get_password_hash
@@ -16,7 +16,7 @@ from src.utils.security import get_password_hash
 
 def seed_data():
     """Seed sample data."""
-    db = SessionLocal()
+    db = new_session()
 
     try:
         # Create admin user
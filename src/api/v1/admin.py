@@ -0,0 +1,85 @@
+from fastapi import APIRouter, Depends, HTTPException, Path, Query, status
+from fastapi.responses import PlainTextResponse
+from typing import Optional
+from src.api.v1.users import get_current_admin
+from src.database import get_redis, get_redis_raw
+from src.crud.cache import CacheManager
+from src.crud.shard import task_sessions
+from src.crud.suggest import TaskSuggestIndex
+from src.utils.profiling import ProfileStore, ContinuousProfiler
+from redis import Redis
+
+router = APIRouter(prefix="/admin", tags=["admin"], dependencies=[Depends(get_current_admin)])
+
+
+@router.get("/cache")
+async def cache_report(
+        sample: int = Query(10000, ge=1, le=1000000, description="Maximum number of keys to scan"),
+        redis: Redis = Depends(get_redis),
+        raw_redis: Redis = Depends(get_redis_raw)
+):
+    """
+    Redis key counts and bytes per keyspace, from a SCAN sample.
+    """
+    report = CacheManager(redis, raw_redis).keyspace_report(sample)
+    if report is None:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Redis is unavailable"
+        )
+    return report
+
+
+@router.post("/suggest/rebuild")
+async def rebuild_suggest_index(redis: Redis = Depends(get_redis)):
+    """
+    Rebuild the /tasks/suggest prefix index from the database (every shard).
+    """
+    with task_sessions() as dbs:
+        return {"indexed": TaskSuggestIndex(redis).rebuild(*dbs)}
+
+
+@router.get("/profiles")
+async def list_profiles(
+        route: Optional[str] = Query(None, description="Only profiles of this route, e.g. 'GET list_tasks'"),
+        limit: int = Query(100, ge=1, le=500),
+        redis: Redis = Depends(get_redis)
+):
+    """
+    Recent request profiles, newest first.
+    """
+    return ProfileStore(redis).list(route, limit)
+
+
+@router.get("/profiles/continuous")
+async def continuous_profile(
+        format: str = Query("summary", pattern="^(summary|collapsed)$"),
+        top: int = Query(50, ge=1, le=1000),
+        redis: Redis = Depends(get_redis)
+):
+    """
+    Hot TaskService/TaskCRUD functions from the continuous profiler, across workers.
+    """
+    if format == "collapsed":
+        return PlainTextResponse(ContinuousProfiler.collapsed(redis))
+    return ContinuousProfiler.report(redis, top)
+
+
+@router.get("/profiles/{profile_id}")
+async def download_profile(
+        profile_id: str = Path(..., pattern="^[0-9a-f]{32}$"),
+        redis: Redis = Depends(get_redis)
+):
+    """
+    One request profile as collapsed stacks (flamegraph.pl, speedscope).
+    """
+    stacks = ProfileStore(redis).get(profile_id)
+    if stacks is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Profile not found"
+        )
+    return PlainTextResponse(
+        stacks,
+        headers={"Content-Disposition": f'attachment; filename="{profile_id}.collapsed"'}
+    )
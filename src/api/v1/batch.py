@@ -0,0 +1,17 @@
+from fastapi import APIRouter, Request
+from src.schemas.batch import BatchRequest, BatchResponse
+from src.services.batch_service import BatchExecutor
+from src.utils.tracing import TracedRoute
+
+router = APIRouter(prefix="/batch", tags=["batch"], route_class=TracedRoute)
+
+
+@router.post("", response_model=BatchResponse)
+async def run_batch(batch: BatchRequest, request: Request):
+    """
+    Run several API requests in one round trip, responses in request order.
+
+    Sub-requests inherit the Authorization header. With atomic=true they run
+    in one transaction that is rolled back at the first failed request.
+    """
+    return await BatchExecutor(request.app, request.scope).run(batch.requests, batch.atomic)
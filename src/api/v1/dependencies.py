@@ -0,0 +1,31 @@
+from fastapi import APIRouter, Depends, HTTPException, status
+from src.api.v1.tasks import get_task_service, owner_id
+from src.crud.task import DependencyCycleError
+from src.services.task_service import TaskService
+from src.schemas.task import DependencyBatchRequest, DependencyBatchResponse
+from src.utils.tracing import TracedRoute
+
+router = APIRouter(prefix="/dependencies", tags=["dependencies"], route_class=TracedRoute)
+
+
+@router.post("/batch", response_model=DependencyBatchResponse)
+async def apply_dependency_batch(
+        batch: DependencyBatchRequest,
+        user_id: int = Depends(owner_id),
+        service: TaskService = Depends(get_task_service)
+):
+    """
+    Add and remove many task dependencies atomically.
+    """
+    try:
+        return service.apply_dependency_batch(batch.add, batch.remove, user_id)
+    except LookupError as e:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=str(e)
+        )
+    except DependencyCycleError as e:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail={"message": str(e), "cycle": e.cycle}
+        )
@@ -0,0 +1,53 @@
+from fastapi import APIRouter, Depends, HTTPException, Query, status
+from sqlalchemy.orm import Session
+from typing import Optional
+from src.api.v1.tasks import owner_id
+from src.api.v1.users import get_current_admin
+from src.database import get_db, get_redis
+from src.crud.stats import TaskStats
+from src.services.stats_service import StatsService
+from src.schemas.stats import TaskStatsResponse
+from redis import Redis
+
+router = APIRouter(prefix="/stats", tags=["stats"])
+
+
+def get_stats_service(
+        db: Session = Depends(get_db),
+        redis: Redis = Depends(get_redis)
+) -> StatsService:
+    return StatsService(db, TaskStats(redis))
+
+
+def stats_response(service: StatsService, user_id: Optional[int], days: Optional[int]) -> TaskStatsResponse:
+    stats = service.get_stats(user_id, days)
+    if stats is None:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Redis is unavailable"
+        )
+    return stats
+
+
+@router.get("/", response_model=TaskStatsResponse)
+async def get_stats(
+        days: Optional[int] = Query(None, ge=1, le=366, description="Only return completions of the last N days"),
+        user_id: int = Depends(owner_id),
+        service: StatsService = Depends(get_stats_service)
+):
+    """
+    Get the current user's task counts by status and priority plus completions per day.
+    """
+    return stats_response(service, user_id, days)
+
+
+@router.get("/all", response_model=TaskStatsResponse, dependencies=[Depends(get_current_admin)])
+async def get_all_stats(
+        user_id: Optional[int] = Query(None, description="Counters of this user instead of all users"),
+        days: Optional[int] = Query(None, ge=1, le=366, description="Only return completions of the last N days"),
+        service: StatsService = Depends(get_stats_service)
+):
+    """
+    Task counters of all users (or of any one user), for admins.
+    """
+    return stats_response(service, user_id, days)
@@ -1,25 +1,153 @@
-from fastapi import APIRouter, Depends, HTTPException, Query, status
+from fastapi import (
+    APIRouter, Depends, HTTPException, Header, Query, Request, Response,
+    WebSocket, WebSocketDisconnect, WebSocketException, status
+)
+from fastapi.responses import JSONResponse, StreamingResponse
 from sqlalchemy.orm import Session
-from typing import Optional, List
-from src.database import get_db, get_redis
+from typing import Optional, List, Generator
+from contextlib import suppress
+import asyncio
+from src.database import get_db, get_redis, get_redis_raw, new_session
 from src.crud.cache import CacheManager
-from src.services.task_service import TaskService
+from src.crud.shard import get_shard_router, CrossShardError
+from src.services.task_service import TaskService, ChangeTokenExpiredError
+from src.crud.task import VersionConflictError
+from src.services.write_coalescer import get_write_coalescer
+from src.services.task_events import get_event_hub
+from src.services.cache_warmup import get_cache_warmer
+from src.config import settings
 from src.schemas.task import (
-    TaskCreate, TaskUpdate, TaskInDB, TaskListResponse,
-    TaskDependencyCreate, TaskDependencyResponse
+    TaskCreate, TaskUpdate, TaskInDB, TaskListResponse, TaskLookupResponse,
+    TaskDependencyCreate, TaskDependencyResponse, TASK_FIELDS,
+    TaskClaimRequest, TaskClaimResponse, TaskHeartbeatRequest, TaskLeaseResponse, TaskSuggestion,
+    TaskChangesResponse
 )
 from src.models.task import TaskStatus, TaskPriority
+from src.models.user import User
+from src.api.v1.users import get_current_user, oauth2_scheme
+from src.utils.tracing import TracedRoute
+from src.utils.compression import negotiate
 from redis import Redis
 
-router = APIRouter(prefix="/tasks", tags=["tasks"])
+router = APIRouter(prefix="/tasks", tags=["tasks"], route_class=TracedRoute)
+
+
+def parse_fields(fields: Optional[str]) -> Optional[List[str]]:
+    """Parse a comma separated ?fields= projection, id is always included"""
+    if not fields:
+        return None
+
+    requested = [field.strip() for field in fields.split(",") if field.strip()]
+    unknown = [field for field in requested if field not in TASK_FIELDS]
+    if unknown:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Unknown fields: {', '.join(unknown)}"
+        )
+    return [field for field in TASK_FIELDS if field == "id" or field in requested]
+
+
+def parse_ids(ids: str) -> List[int]:
+    """Parse a comma separated ?ids= list"""
+    try:
+        task_ids = [int(task_id) for task_id in ids.split(",") if task_id.strip()]
+    except ValueError:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="ids must be a comma separated list of integers"
+        )
+    if len(task_ids) > settings.multi_get_max_ids:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"At most {settings.multi_get_max_ids} ids can be requested at once"
+        )
+    return task_ids
+
+
+def encoded_response(body: bytes, encoding: Optional[str]) -> Response:
+    """JSON body as encoded by the service; a set Content-Encoding keeps GZipMiddleware out"""
+    headers = {"Vary": "Accept-Encoding"}
+    if encoding:
+        headers["Content-Encoding"] = encoding
+    return Response(content=body, media_type="application/json", headers=headers)
+
+
+def owner_id(current_user: User = Depends(get_current_user)) -> int:
+    """
+    Scope of the request: users only see and change their own tasks (and
+    create tasks they own). Anonymous requests get 401.
+    """
+    return current_user.id
+
+
+async def _resolve_owner(token: str) -> int:
+    # A session of its own, so none stays checked out for a stream's lifetime
+    db = new_session()
+    try:
+        return (await get_current_user(token, db)).id
+    finally:
+        db.close()
+
+
+async def stream_owner_id(token: str = Depends(oauth2_scheme)) -> int:
+    """owner_id for the SSE stream"""
+    return await _resolve_owner(token)
+
+
+async def websocket_owner_id(
+        websocket: WebSocket,
+        token: Optional[str] = Query(None, description="Access token, for clients that can't set an Authorization header")
+) -> int:
+    """owner_id for WebSocket routes, from the Authorization header or ?token="""
+    scheme, _, credentials = websocket.headers.get("authorization", "").partition(" ")
+    if scheme.lower() == "bearer" and credentials:
+        token = credentials
+    try:
+        if not token:
+            raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED)
+        return await _resolve_owner(token)
+    except HTTPException:
+        raise WebSocketException(code=status.WS_1008_POLICY_VIOLATION, reason="Not authenticated")
+
+
+def get_task_db(
+        request: Request,
+        current_user: User = Depends(get_current_user),
+        db: Session = Depends(get_db)
+) -> Generator[Session, None, None]:
+    """
+    Session of the database holding the user's tasks: their shard with
+    sharding enabled, else the request's session
+    """
+    router = get_shard_router()
+    if router is None:
+        yield db
+        return
+    shard = router.shard_for_user(current_user.id)
+    router.ensure_user(shard, current_user)
+    # Task requests of an atomic batch join its transaction
+    transaction = request.scope.get("shard_transaction")
+    if transaction is not None:
+        try:
+            task_db = transaction.session(shard)
+        except CrossShardError as e:
+            raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail=str(e))
+        yield task_db
+        return
+    with router.session(shard) as task_db:
+        yield task_db
 
 
 def get_task_service(
-        db: Session = Depends(get_db),
-        redis: Redis = Depends(get_redis)
+        request: Request,
+        db: Session = Depends(get_task_db),
+        redis: Redis = Depends(get_redis),
+        raw_redis: Redis = Depends(get_redis_raw)
 ) -> TaskService:
-    cache_manager = CacheManager(redis)
-    return TaskService(db, cache_manager)
+    # Sub-requests of an atomic batch see its uncommitted rows, keep them out of the cache
+    cache_manager = CacheManager(redis, raw_redis, bypass=request.scope.get("cache_bypass", False))
+    warmer = get_cache_warmer() if settings.cache_warmup_enabled else None
+    return TaskService(db, cache_manager, warmer=warmer, after_commit=request.scope.get("after_commit"))
 
 
 @router.get("/", response_model=TaskListResponse)
@@ -30,14 +158,22 @@ async def list_tasks(
         priority: Optional[TaskPriority] = Query(None, description="Filter by priority"),
         tags: Optional[List[str]] = Query(None, description="Filter by tags"),
         search: Optional[str] = Query(None, description="Search in title and description"),
+        blocked: Optional[bool] = Query(None, description="Only tasks with (true) or without (false) incomplete dependencies"),
         sort_by: Optional[str] = Query(None, description="Field to sort by"),
         sort_order: str = Query("asc", description="Sort order (asc/desc)"),
+        fields: Optional[str] = Query(
+            None,
+            description="Comma separated fields to return, e.g. id,title,status,priority,description_preview"
+        ),
+        accept_encoding: Optional[str] = Header(None, include_in_schema=False),
+        user_id: int = Depends(owner_id),
         service: TaskService = Depends(get_task_service)
 ):
     """
     Get list of tasks with filtering, sorting, and pagination.
     """
-    filters = {}
+    projection = parse_fields(fields)
+    filters = {"user_id": user_id}
     if status:
         filters["status"] = status
     if priority:
@@ -46,43 +182,230 @@ async def list_tasks(
         filters["tags"] = tags
     if search:
         filters["search"] = search
+    if blocked is not None:
+        filters["blocked"] = blocked
 
-    return service.get_tasks(
+    # The page is returned as serialized and compressed by the service (straight
+    # from the cache on a hit), so response_model validation and encoding are
+    # skipped; sparse pages were stored with exclude_unset and stay sparse
+    content, encoding = service.get_tasks_encoded(
+        negotiate(accept_encoding),
+        skip=skip,
+        limit=limit,
+        filters=filters,
+        sort_by=sort_by,
+        sort_order=sort_order,
+        fields=projection
+    )
+    return encoded_response(content, encoding)
+
+
+@router.get("/lookup", response_model=TaskLookupResponse)
+async def lookup_tasks(
+        ids: str = Query(..., description="Comma separated task ids, tasks are returned in this order"),
+        fields: Optional[str] = Query(None, description="Comma separated fields to return"),
+        user_id: int = Depends(owner_id),
+        service: TaskService = Depends(get_task_service)
+):
+    """
+    Get many tasks by id in one request, unknown ids are listed under missing.
+    """
+    # Assembled from the cached task bodies without re-validation
+    content = service.get_tasks_by_ids_json(parse_ids(ids), parse_fields(fields), user_id)
+    return Response(content=content, media_type="application/json")
+
+
+@router.get("/changes", response_model=TaskChangesResponse)
+async def get_task_changes(
+        since: Optional[str] = Query(None, description="next_token of the previous call, omit to get a starting token"),
+        limit: int = Query(500, ge=1, le=1000, description="Maximum number of changes per chunk"),
+        user_id: int = Depends(owner_id),
+        service: TaskService = Depends(get_task_service)
+):
+    """
+    Tasks created or updated and ids of tasks deleted since a sync token.
+    """
+    try:
+        return service.get_changes(since, limit, user_id)
+    except ChangeTokenExpiredError as e:
+        raise HTTPException(
+            status_code=status.HTTP_410_GONE,
+            detail=str(e)
+        )
+    except ValueError as e:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=str(e)
+        )
+
+
+@router.get("/suggest", response_model=List[TaskSuggestion])
+async def suggest_tasks(
+        q: str = Query(..., min_length=1, max_length=100, description="What the user typed so far"),
+        limit: int = Query(10, ge=1, le=50),
+        user_id: int = Depends(owner_id),
+        service: TaskService = Depends(get_task_service)
+):
+    """
+    Tasks whose title words or tags start with every word of q, by priority then recency.
+    """
+    return service.suggest_tasks(q, user_id, limit)
+
+
+@router.get("/ready", response_model=TaskListResponse)
+async def list_ready_tasks(
+        skip: int = Query(0, ge=0, description="Number of items to skip"),
+        limit: int = Query(100, ge=1, le=1000, description="Number of items to return"),
+        priority: Optional[TaskPriority] = Query(None, description="Filter by priority"),
+        sort_by: Optional[str] = Query(None, description="Field to sort by"),
+        sort_order: str = Query("asc", description="Sort order (asc/desc)"),
+        accept_encoding: Optional[str] = Header(None, include_in_schema=False),
+        user_id: int = Depends(owner_id),
+        service: TaskService = Depends(get_task_service)
+):
+    """
+    Get tasks that can be worked on now: not completed and with every dependency completed.
+    """
+    filters = {"ready": True, "user_id": user_id}
+    if priority:
+        filters["priority"] = priority
+
+    content, encoding = service.get_tasks_encoded(
+        negotiate(accept_encoding),
         skip=skip,
         limit=limit,
         filters=filters,
         sort_by=sort_by,
         sort_order=sort_order
     )
+    return encoded_response(content, encoding)
+
+
+@router.post("/claim", response_model=TaskClaimResponse)
+async def claim_tasks(
+        claim: TaskClaimRequest,
+        n: int = Query(1, ge=1, description="Maximum number of tasks to claim"),
+        user_id: int = Depends(owner_id),
+        service: TaskService = Depends(get_task_service)
+):
+    """
+    Lease up to n ready tasks (highest priority first) to a worker and mark them in progress.
+
+    The worker keeps a task by sending heartbeats before the lease expires;
+    tasks of expired leases are handed out again.
+    """
+    return service.claim_tasks(claim.worker_id, min(n, settings.task_claim_max), claim.lease_seconds, user_id)
+
+
+@router.get("/stream")
+async def stream_tasks(
+        request: Request,
+        status: Optional[TaskStatus] = Query(None, description="Only events of tasks with this status"),
+        tags: Optional[List[str]] = Query(None, description="Only events of tasks with any of these tags"),
+        last_event_id: Optional[str] = Header(None, description="Resume after this event id"),
+        user_id: int = Depends(stream_owner_id)
+):
+    """
+    Server-sent events feed of changes to the user's tasks.
+    """
+    events = get_event_hub().listen(
+        user_id, status.value if status else None, tags, last_event_id,
+        keepalive=settings.event_keepalive_seconds
+    )
+
+    async def event_source():
+        try:
+            async for event in events:
+                if await request.is_disconnected():
+                    break
+                yield ": keepalive\n\n" if event is None else event.to_sse()
+        finally:
+            await events.aclose()
+
+    return StreamingResponse(
+        event_source(),
+        media_type="text/event-stream",
+        # identity keeps GZipMiddleware from buffering the stream
+        headers={"Cache-Control": "no-cache", "Content-Encoding": "identity"}
+    )
+
+
+@router.websocket("/stream/ws")
+async def stream_tasks_ws(
+        websocket: WebSocket,
+        status: Optional[TaskStatus] = Query(None),
+        tags: Optional[List[str]] = Query(None),
+        last_event_id: Optional[str] = Query(None),
+        user_id: int = Depends(websocket_owner_id)
+):
+    """
+    WebSocket feed of task changes, same filters and resume semantics as /stream.
+    """
+    await websocket.accept()
+    events = get_event_hub().listen(
+        user_id, status.value if status else None, tags, last_event_id,
+        keepalive=settings.event_keepalive_seconds
+    )
+
+    async def pump():
+        async for event in events:
+            if event is None:
+                await websocket.send_json({"type": "keepalive"})
+            else:
+                await websocket.send_json(event.to_dict())
+        await websocket.close()
+
+    sender = asyncio.create_task(pump())
+    try:
+        # Idle subscribers only ever send a close frame
+        while (await websocket.receive())["type"] != "websocket.disconnect":
+            pass
+    except (WebSocketDisconnect, RuntimeError):
+        pass
+    finally:
+        sender.cancel()
+        with suppress(asyncio.CancelledError, WebSocketDisconnect, RuntimeError):
+            await sender
+        await events.aclose()
 
 
 @router.get("/{task_id}", response_model=TaskInDB)
 async def get_task(
         task_id: int,
+        fields: Optional[str] = Query(None, description="Comma separated fields to return"),
+        user_id: int = Depends(owner_id),
         service: TaskService = Depends(get_task_service)
 ):
     """
-    Get a specific task by ID.
+    Get a specific task by ID, with its version as ETag (for If-Match).
     """
-    task = service.get_task(task_id)
-    if not task:
+    projection = parse_fields(fields)
+    loaded = service.load_task(task_id, user_id)
+    if loaded is None:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Task not found"
         )
-    return task
+    data, task = loaded
+    version = task["version"]
+    headers = {"ETag": f'"{version}"'}
+    if projection:
+        content = service.project_task(task, projection).model_dump(mode="json", exclude_unset=True)
+        return JSONResponse(content=content, headers=headers)
+    return Response(content=data, media_type="application/json", headers=headers)
 
 
 @router.post("/", response_model=TaskInDB, status_code=status.HTTP_201_CREATED)
 async def create_task(
         task_data: TaskCreate,
+        user_id: int = Depends(owner_id),
         service: TaskService = Depends(get_task_service)
 ):
     """
     Create a new task.
     """
     try:
-        return service.create_task(task_data)
+        return service.create_task(task_data, user_id)
     except ValueError as e:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
@@ -90,47 +413,140 @@ async def create_task(
         )
 
 
+def parse_if_match(if_match: Optional[str]) -> Optional[int]:
+    """Version from an If-Match header, None for no header or *"""
+    if not if_match or if_match.strip() == "*":
+        return None
+    tag = if_match.split(",")[0].strip()
+    if tag.startswith("W/"):
+        tag = tag[2:]
+    try:
+        return int(tag.strip('"'))
+    except ValueError:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="If-Match must be a task version ETag"
+        )
+
+
 @router.put("/{task_id}", response_model=TaskInDB)
 async def update_task(
         task_id: int,
         task_data: TaskUpdate,
+        response: Response,
+        coalesce: bool = Query(
+            False,
+            description="Buffer status/priority changes and write them in a batch (202 Accepted)"
+        ),
+        if_match: Optional[str] = Header(None),
+        user_id: int = Depends(owner_id),
         service: TaskService = Depends(get_task_service)
 ):
     """
     Update an existing task.
+
+    With an If-Match ETag or a version in the body, the update only applies
+    if the task is still at that version, 412 otherwise.
     """
-    task = service.update_task(task_id, task_data)
+    expected_version = parse_if_match(if_match)
+    if task_data.version is not None:
+        if expected_version is not None and expected_version != task_data.version:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="If-Match and version disagree"
+            )
+        expected_version = task_data.version
+
+    try:
+        if coalesce and expected_version is None and get_write_coalescer().accepts(task_data.dict(exclude_unset=True)):
+            response.status_code = status.HTTP_202_ACCEPTED
+            task = service.submit_update(task_id, task_data, user_id)
+        else:
+            task = service.update_task(task_id, task_data, user_id, expected_version)
+    except VersionConflictError as e:
+        raise HTTPException(
+            status_code=status.HTTP_412_PRECONDITION_FAILED,
+            detail=str(e),
+            headers={"ETag": f'"{e.current_version}"'}
+        )
+    except ValueError as e:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=str(e)
+        )
     if not task:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Task not found"
         )
+    if response.status_code != status.HTTP_202_ACCEPTED:
+        response.headers["ETag"] = f'"{task.version}"'
     return task
 
 
 @router.delete("/{task_id}", status_code=status.HTTP_204_NO_CONTENT)
 async def delete_task(
         task_id: int,
+        user_id: int = Depends(owner_id),
         service: TaskService = Depends(get_task_service)
 ):
     """
     Delete a task.
     """
-    if not service.delete_task(task_id):
+    if not service.delete_task(task_id, user_id):
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Task not found"
         )
 
 
+@router.post("/{task_id}/heartbeat", response_model=TaskLeaseResponse)
+async def heartbeat(
+        task_id: int,
+        heartbeat_data: TaskHeartbeatRequest,
+        user_id: int = Depends(owner_id),
+        service: TaskService = Depends(get_task_service)
+):
+    """
+    Extend the lease of a claimed task.
+    """
+    lease = service.renew_lease(task_id, heartbeat_data.worker_id, heartbeat_data.lease_seconds, user_id)
+    if not lease:
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail="Task is not leased to this worker"
+        )
+    return lease
+
+
 @router.get("/{task_id}/dependencies")
 async def get_task_dependencies(
         task_id: int,
+        format: str = Query(
+            "tree",
+            pattern="^(tree|graph)$",
+            description="tree: nested dependencies; graph: each task once as nodes with depth, plus edges"
+        ),
+        user_id: int = Depends(owner_id),
         service: TaskService = Depends(get_task_service)
 ):
     """
     Get dependency tree for a task.
     """
+    if service.get_task_json(task_id, user_id) is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Task not found"
+        )
+    if format == "graph":
+        content = service.get_dependency_graph_json(task_id)
+        if content is None:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="Task not found"
+            )
+        return Response(content=content, media_type="application/json")
+
     tree = service.get_dependency_tree(task_id)
     if not tree:
         raise HTTPException(
@@ -144,12 +560,13 @@ async def get_task_dependencies(
 async def add_dependency(
         task_id: int,
         dependency_data: TaskDependencyCreate,
+        user_id: int = Depends(owner_id),
         service: TaskService = Depends(get_task_service)
 ):
     """
     Add a dependency to a task.
     """
-    dependency = service.add_dependency(task_id, dependency_data.depends_on_id)
+    dependency = service.add_dependency(task_id, dependency_data.depends_on_id, user_id)
     if not dependency:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
@@ -162,12 +579,13 @@ async def add_dependency(
 async def remove_dependency(
         task_id: int,
         depends_on_id: int,
+        user_id: int = Depends(owner_id),
         service: TaskService = Depends(get_task_service)
 ):
     """
     Remove a dependency from a task.
     """
-    if not service.remove_dependency(task_id, depends_on_id):
+    if not service.remove_dependency(task_id, depends_on_id, user_id):
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Dependency not found"
@@ -3,7 +3,7 @@ from fastapi.security import OAuth2PasswordBearer, OAuth2PasswordRequestForm
 from sqlalchemy.orm import Session
 from datetime import datetime, timedelta
 from typing import Optional
-from src.database import get_db
+from src.database import get_db, new_session
 from src.schemas.user import UserCreate, UserInDB, Token
 from src.models.user import User
 from src.utils.security import (
@@ -108,6 +108,33 @@ async def get_current_user(
     return user
 
 
+async def get_current_admin(current_user: User = Depends(get_current_user)) -> User:
+    """
+    Get current user, who must be an admin.
+    """
+    if not current_user.is_admin:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Admin privileges required"
+        )
+    return current_user
+
+
+def is_admin_token(token: str) -> bool:
+    """
+    Whether a bearer token belongs to an admin, for checks outside a route.
+    """
+    payload = decode_access_token(token)
+    if payload is None or payload.get("sub") is None:
+        return False
+    db = new_session()
+    try:
+        user = db.query(User).filter(User.username == payload["sub"]).first()
+        return user is not None and bool(user.is_admin)
+    finally:
+        db.close()
+
+
 @router.get("/me", response_model=UserInDB)
 async def get_current_user_info(current_user: User = Depends(get_current_user)):
     """
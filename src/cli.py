@@ -0,0 +1,37 @@
+"""
+Explicit schema management for local and scratch databases.
+
+    python -m src.cli init-db      # create missing tables from the models
+    python -m src.cli drop-db      # drop all tables
+
+Both also run on every shard when SHARD_DATABASE_URLS is set.
+
+Deployed databases are migrated with `alembic upgrade head` instead.
+"""
+import argparse
+from src.database import Base, get_engine
+from src.crud.shard import get_shard_router
+from src.models import task, user  # noqa: F401  (register the tables)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Task management schema commands")
+    parser.add_argument("command", choices=["init-db", "drop-db"])
+    args = parser.parse_args()
+
+    router = get_shard_router()
+    engines = [get_engine(), *(router.engines.values() if router else [])]
+    if args.command == "init-db":
+        for engine in engines:
+            Base.metadata.create_all(bind=engine)
+        if router:
+            router.reserve_existing_ids()
+        print("Tables created")
+    elif args.command == "drop-db":
+        for engine in engines:
+            Base.metadata.drop_all(bind=engine)
+        print("Tables dropped")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,53 +1,365 @@
 from redis import Redis
-from typing import Optional, Any
+from redis.exceptions import ResponseError
+from typing import Optional, Any, List, Dict, Callable, Iterable, Tuple
+from collections import defaultdict
+from datetime import timedelta
+from src.config import settings
+from src.utils.circuit_breaker import redis_breaker
+from src.utils.local_cache import LocalCache
+from src.utils.metrics import metrics
+from src.utils.tracing import trace_methods
 import json
+import logging
+import orjson
 import pickle
-from datetime import timedelta
+import threading
+import zlib
+
+logger = logging.getLogger(__name__)
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+try:
+    import lz4.frame
+except ImportError:
+    lz4 = None
+
+
+# Compressed values start with a NUL byte (never the first byte of JSON or a
+# pickle) followed by the codec
+COMPRESSED_MARKER = b"\x00"
+CODECS = {
+    b"z": (
+        lambda data: zstandard.ZstdCompressor(level=3).compress(data),
+        lambda data: zstandard.ZstdDecompressor().decompress(data)
+    ) if zstandard else None,
+    b"l": (lz4.frame.compress, lz4.frame.decompress) if lz4 else None,
+    b"d": (lambda data: zlib.compress(data, 6), zlib.decompress),
+}
+CODEC_IDS = {"zstd": b"z", "lz4": b"l", "zlib": b"d"}
+
+# Returned by redis_breaker when Redis could not be used
+UNAVAILABLE = object()
+
+# Stands in for Redis while the breaker is open
+local_cache = LocalCache(settings.local_cache_max_entries, settings.local_cache_ttl)
+
+
+def keyspace_of(key: str) -> str:
+    """Keyspace a key is accounted to: its first two segments if configured, else the first"""
+    parts = key.split(":")
+    prefix = ":".join(parts[:2])
+    if len(parts) > 2 and (prefix in settings.cache_keyspace_ttl or prefix in settings.cache_keyspace_max_bytes):
+        return prefix
+    return parts[0]
+
+
+def list_namespace(user_id: Optional[int]) -> str:
+    """Namespace of list caches (tasks:ids:{ns}:..., tasks:resp:{ns}:...): one per owner, all for unscoped lists"""
+    return f"u{user_id}" if user_id is not None else "all"
 
 
+@trace_methods
 class CacheManager:
-    def __init__(self, redis_client: Redis):
+    """
+    Redis cache of tasks and task lists.
+
+    Every Redis call goes through redis_breaker: when Redis is slow or down
+    reads miss (and fall back to the database), values are kept in the
+    per-worker local_cache instead, and invalidations that could not reach
+    Redis make the first call after recovery drop all task caches.
+
+    With bypass=True (a session holding uncommitted changes, e.g. an atomic
+    batch) reads miss and nothing is stored, so other clients never see the
+    uncommitted rows; invalidations still go through.
+    """
+
+    # Called after task list caches are wiped (e.g. to schedule a warm-up)
+    invalidation_listeners: List[Callable[[], None]] = []
+    # An invalidation was lost while Redis was unavailable
+    _missed_invalidations = False
+    _missed_lock = threading.Lock()
+
+    def __init__(self, redis_client: Redis, raw_client: Optional[Redis] = None, bypass: bool = False):
         self.redis = redis_client
+        # Client without response decoding for values served as raw bytes
+        self.raw = raw_client if raw_client is not None else redis_client
+        self.bypass = bypass
+
+    @classmethod
+    def add_invalidation_listener(cls, listener: Callable[[], None]):
+        if listener not in cls.invalidation_listeners:
+            cls.invalidation_listeners.append(listener)
+
+    def _notify_invalidation(self):
+        for listener in self.invalidation_listeners:
+            listener()
+
+    def _call(self, operation: Callable[[], Any], invalidation: bool = False) -> Any:
+        """Run a Redis operation through the breaker, UNAVAILABLE if it was skipped or failed"""
+        if CacheManager._missed_invalidations and not self._drop_stale_entries():
+            result = UNAVAILABLE
+        else:
+            result = redis_breaker.call(operation, UNAVAILABLE)
+        if result is UNAVAILABLE and invalidation:
+            CacheManager._missed_invalidations = True
+        return result
+
+    def _drop_stale_entries(self) -> bool:
+        """
+        Drop the task caches after invalidations were lost during an outage,
+        True once Redis can be trusted again
+        """
+        with CacheManager._missed_lock:
+            if not CacheManager._missed_invalidations:
+                return True
+            for pattern in ("task:*", "task_dependencies:*", "tasks:*"):
+                if redis_breaker.call(lambda: self._delete_matching(pattern), UNAVAILABLE) is UNAVAILABLE:
+                    return False
+            CacheManager._missed_invalidations = False
+        logger.warning("Redis is reachable again, dropped task caches that missed invalidations")
+        metrics.inc("cache_flushes_after_outage")
+        return True
+
+    def _delete_matching(self, pattern: str):
+        keys = self.redis.keys(pattern)
+        if keys:
+            self.redis.delete(*keys)
+
+    @staticmethod
+    def _compress(data: bytes) -> bytes:
+        if len(data) < settings.cache_compress_threshold:
+            return data
+        codec = CODEC_IDS.get(settings.cache_compression, b"d")
+        if CODECS.get(codec) is None:
+            codec = b"d"  # library not installed
+        compressed = COMPRESSED_MARKER + codec + CODECS[codec][0](data)
+        return compressed if len(compressed) < len(data) else data
+
+    @staticmethod
+    def _decompress(data: Optional[bytes]) -> Optional[bytes]:
+        if isinstance(data, str):
+            data = data.encode()
+        if data and data[:1] == COMPRESSED_MARKER:
+            return CODECS[data[1:2]][1](data[2:])
+        return data
+
+    @staticmethod
+    def _encode(key: str, data: bytes, compress: bool = True) -> Optional[bytes]:
+        """Stored form of a value, None if it is too large to cache"""
+        if compress:
+            data = CacheManager._compress(data)
+        keyspace = keyspace_of(key)
+        if len(data) > settings.cache_keyspace_max_bytes.get(keyspace, settings.cache_max_value_bytes):
+            metrics.inc(f"cache_oversized_skipped:{keyspace}")
+            return None
+        return data
+
+    @staticmethod
+    def _ttl(key: str, ttl: Optional[int]) -> timedelta:
+        if ttl is None:
+            ttl = settings.cache_keyspace_ttl.get(keyspace_of(key), settings.cache_ttl)
+        return timedelta(seconds=ttl)
 
     def get(self, key: str) -> Optional[Any]:
         """Get value from cache"""
-        data = self.redis.get(key)
+        data = self.get_raw(key)
         if data:
             try:
                 return json.loads(data)
-            except json.JSONDecodeError:
+            except (json.JSONDecodeError, UnicodeDecodeError):
                 return pickle.loads(data)
         return None
 
-    def set(self, key: str, value: Any, ttl: int = 300):
-        """Set value in cache with TTL"""
+    def set(self, key: str, value: Any, ttl: Optional[int] = None):
+        """Set value in cache with TTL (the keyspace TTL by default)"""
         try:
-            data = json.dumps(value)
-        except (TypeError, OverflowError):
+            data = orjson.dumps(value)
+        except TypeError:
             data = pickle.dumps(value)
 
-        self.redis.setex(key, timedelta(seconds=ttl), data)
+        self.set_raw(key, data, ttl)
+
+    @staticmethod
+    def _local_get(key: str) -> Optional[bytes]:
+        data = local_cache.get(key)
+        metrics.inc("cache_local_hits" if data is not None else "cache_local_misses")
+        return data
+
+    def get_raw(self, key: str) -> Optional[bytes]:
+        """Get the stored bytes, decompressed but not decoded"""
+        if self.bypass:
+            return None
+        data = self._call(lambda: self.raw.get(key))
+        if data is UNAVAILABLE:
+            return self._local_get(key)
+        return self._decompress(data)
+
+    def set_raw(self, key: str, data: bytes, ttl: Optional[int] = None):
+        """Store already encoded bytes, compressed above the size threshold"""
+        if self.bypass:
+            return
+        encoded = self._encode(key, data)
+        if encoded is not None:
+            if self._call(lambda: self.raw.setex(key, self._ttl(key, ttl), encoded)) is UNAVAILABLE:
+                local_cache.set(key, data, ttl)
+
+    def mget_raw(self, keys: List[str]) -> List[Optional[bytes]]:
+        """Get many stored values in one round trip, None for missing keys"""
+        if not keys:
+            return []
+        if self.bypass:
+            return [None] * len(keys)
+        values = self._call(lambda: self.raw.mget(keys))
+        if values is UNAVAILABLE:
+            return [self._local_get(key) for key in keys]
+        return [self._decompress(data) for data in values]
+
+    def set_many_raw(self, items: Dict[str, bytes], ttl: Optional[int] = None):
+        """Store many encoded values in one round trip"""
+        if self.bypass:
+            return
+        pipe = self.raw.pipeline(transaction=False)
+        for key, data in items.items():
+            data = self._encode(key, data)
+            if data is not None:
+                pipe.setex(key, self._ttl(key, ttl), data)
+        if len(pipe) and self._call(pipe.execute) is UNAVAILABLE:
+            for key, data in items.items():
+                local_cache.set(key, data, ttl)
+
+    def get_encoded(self, key: str, encoding: Optional[str]) -> Tuple[Optional[bytes], Optional[bytes]]:
+        """Plain body under key and, if encoding is given, its encoded form under key:{encoding}"""
+        if encoding is None or self.bypass:
+            return self.get_raw(key), None
+        values = self._call(lambda: self.raw.mget([key, f"{key}:{encoding}"]))
+        if values is UNAVAILABLE:
+            return self._local_get(key), self._local_get(f"{key}:{encoding}")
+        body, encoded = values
+        # Already compressed, stored and returned as is
+        return self._decompress(body), encoded
+
+    def set_encoded(self, key: str, body: Optional[bytes], encoded: Dict[str, bytes], ttl: Optional[int] = None):
+        """Store a plain body (if given) and its encodings (key:{encoding}) in one round trip"""
+        if self.bypass:
+            return
+        pipe = self.raw.pipeline(transaction=False)
+        items = [(key, body, True)] if body is not None else []
+        items += [(f"{key}:{encoding}", data, False) for encoding, data in encoded.items()]
+        for item_key, data, compress in items:
+            data = self._encode(item_key, data, compress)
+            if data is not None:
+                pipe.setex(item_key, self._ttl(key, ttl), data)
+        if len(pipe) and self._call(pipe.execute) is UNAVAILABLE:
+            for item_key, data, _ in items:
+                local_cache.set(item_key, data, ttl)
+
+    def keyspace_report(self, sample: int = 10000) -> Optional[Dict[str, Any]]:
+        """
+        Key count and bytes per keyspace from a SCAN sample of at most sample keys,
+        None while Redis is unavailable.
+
+        Bytes are MEMORY USAGE where the server supports it and value length
+        otherwise; counts and bytes are scaled up to DBSIZE when the scan was cut short.
+        """
+        report = self._call(lambda: self._keyspace_report(sample))
+        return None if report is UNAVAILABLE else report
+
+    def _keyspace_report(self, sample: int) -> Dict[str, Any]:
+        keys = []
+        cursor = 0
+        while len(keys) < sample:
+            cursor, batch = self.raw.scan(cursor, count=min(1000, sample))
+            keys.extend(batch[:sample - len(keys)])
+            if cursor == 0:
+                break
+
+        # MEMORY USAGE isn't available on every server (fakeredis), fall back to STRLEN
+        measure = "memory_usage"
+        if keys:
+            try:
+                self.raw.memory_usage(keys[0])
+            except ResponseError:
+                measure = "strlen"
+
+        pipe = self.raw.pipeline(transaction=False)
+        for key in keys:
+            getattr(pipe, measure)(key)
+        sizes = pipe.execute(raise_on_error=False) if keys else []
+
+        keyspaces = defaultdict(lambda: {"keys": 0, "bytes": 0})
+        for key, size in zip(keys, sizes):
+            entry = keyspaces[keyspace_of(key.decode() if isinstance(key, bytes) else key)]
+            entry["keys"] += 1
+            entry["bytes"] += size if isinstance(size, int) else 0
+
+        total_keys = self.raw.dbsize()
+        try:
+            used_memory = self.raw.info("memory").get("used_memory")
+        except ResponseError:
+            used_memory = None  # INFO disabled (e.g. behind a proxy)
+        scale = total_keys / len(keys) if keys and cursor != 0 else 1
+        return {
+            "sampled_keys": len(keys),
+            "complete": cursor == 0,
+            "total_keys": total_keys,
+            "used_memory": used_memory,
+            "keyspaces": {
+                name: {
+                    "keys": round(entry["keys"] * scale),
+                    "bytes": round(entry["bytes"] * scale),
+                    "avg_bytes": round(entry["bytes"] / entry["keys"]),
+                    "ttl": settings.cache_keyspace_ttl.get(name),
+                    "max_bytes": settings.cache_keyspace_max_bytes.get(name)
+                }
+                for name, entry in sorted(keyspaces.items(), key=lambda item: -item[1]["bytes"])
+            }
+        }
 
     def delete(self, key: str):
         """Delete value from cache"""
-        self.redis.delete(key)
+        local_cache.delete(key)
+        self._call(lambda: self.redis.delete(key), invalidation=True)
 
     def delete_pattern(self, pattern: str):
         """Delete all keys matching pattern"""
-        keys = self.redis.keys(pattern)
-        if keys:
-            self.redis.delete(*keys)
+        local_cache.delete_pattern(pattern)
+        self._call(lambda: self._delete_matching(pattern), invalidation=True)
 
-    def clear_task_cache(self, task_id: Optional[int] = None):
-        """Clear task-related cache"""
+    def _clear_lists(self, owners: Optional[Iterable[Optional[int]]]):
+        if owners is None:
+            self.delete_pattern("tasks:*")
+        else:
+            # Unscoped lists and the owners' lists can hold the tasks, other
+            # users' lists can't; graphs may reach tasks of any owner
+            namespaces = {list_namespace(None)} | {list_namespace(owner) for owner in owners if owner is not None}
+            for namespace in sorted(namespaces):
+                self.delete_pattern(f"tasks:*:{namespace}:*")
+            self.delete_pattern("tasks:graph:*")
+        self._notify_invalidation()
+
+    def clear_task_cache(self, task_id: Optional[int] = None, owners: Optional[Iterable[Optional[int]]] = None):
+        """Clear task-related cache, list caches only of the given task owners if known"""
         if task_id:
             # Clear specific task cache
             self.delete(f"task:{task_id}")
             self.delete(f"task_dependencies:{task_id}")
         # Clear task list cache
-        self.delete_pattern("tasks:*")
+        self._clear_lists(owners)
+
+    def clear_tasks_cache(self, task_ids: List[int], owners: Optional[Iterable[Optional[int]]] = None):
+        """Clear cache for many tasks with a single list cache sweep"""
+        keys = [f"task:{task_id}" for task_id in task_ids]
+        keys += [f"task_dependencies:{task_id}" for task_id in task_ids]
+        if keys:
+            local_cache.delete(*keys)
+            self._call(lambda: self.redis.delete(*keys), invalidation=True)
+        self._clear_lists(owners)
 
-    def get_or_set(self, key: str, func, ttl: int = 300) -> Any:
+    def get_or_set(self, key: str, func, ttl: Optional[int] = None) -> Any:
         """Get from cache or set using function"""
         cached = self.get(key)
         if cached is not None:
@@ -0,0 +1,410 @@
+from sqlalchemy import event, insert, delete, func, inspect
+from sqlalchemy.engine import Connection, Engine, RootTransaction
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session, sessionmaker
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from typing import List, Optional, Dict, Any, Iterator, Callable, Set, Tuple
+from src.config import settings
+from src.crud.task import task_crud
+from src.database import Base, create_database_engine, get_engine, new_session
+from src.models.task import Task, TaskDependency, TaskChange, TaskIdSequence
+from src.models.user import User
+import bisect
+import enum
+import hashlib
+import heapq
+import itertools
+
+
+class CrossShardError(ValueError):
+    """An operation would span tasks or a transaction across shards"""
+
+
+class HashRing:
+    """Consistent hash ring mapping keys to shard names"""
+
+    def __init__(self, nodes: List[str], virtual_nodes: int = 100):
+        self._ring: Dict[int, str] = {}
+        for node in nodes:
+            for i in range(virtual_nodes):
+                self._ring[self._hash(f"{node}#{i}")] = node
+        self._points = sorted(self._ring)
+
+    @staticmethod
+    def _hash(key: str) -> int:
+        return int(hashlib.md5(key.encode()).hexdigest()[:16], 16)
+
+    def get_node(self, key: str) -> str:
+        """Get the node owning the key (first point clockwise)"""
+        index = bisect.bisect(self._points, self._hash(key)) % len(self._points)
+        return self._ring[self._points[index]]
+
+
+def allocate_task_ids(count: int) -> List[int]:
+    """Take count new task ids from the main database's task_id_sequence"""
+    db = new_session()
+    try:
+        task_ids = [db.execute(insert(TaskIdSequence)).inserted_primary_key[0] for _ in range(count)]
+        db.execute(delete(TaskIdSequence).where(TaskIdSequence.id < max(task_ids)))
+        db.commit()
+        return task_ids
+    finally:
+        db.close()
+
+
+def reserve_task_ids(task_id: int):
+    """Make sure task_id_sequence only hands out ids above task_id"""
+    db = new_session()
+    try:
+        if (db.query(func.max(TaskIdSequence.id)).scalar() or 0) < task_id:
+            db.add(TaskIdSequence(id=task_id))
+            db.flush()
+            db.execute(delete(TaskIdSequence).where(TaskIdSequence.id < task_id))
+            db.commit()
+    finally:
+        db.close()
+
+
+@event.listens_for(Session, "before_flush")
+def _allocate_shard_task_ids(session: Session, flush_context, instances):
+    # Shards don't number their own tasks, a task id has to be unique across
+    # all of them (cache keys, events) and survive a move to another shard
+    if session.info.get("shard") is None:
+        return
+    new_tasks = [obj for obj in session.new if isinstance(obj, Task) and obj.id is None]
+    if new_tasks:
+        for task, task_id in zip(new_tasks, allocate_task_ids(len(new_tasks))):
+            task.id = task_id
+
+
+class ShardRouter:
+    """
+    Routes task data to one of N databases by user_id.
+
+    Every task of a user lives on the same shard, so per-user reads and
+    writes touch a single database and dependencies (which only link tasks
+    of one owner) stay shard-local. Users, and the task id sequence, stay in
+    the main database; a user's row is copied to their shard on first use,
+    for the tasks' foreign key.
+    """
+
+    def __init__(self, database_urls: List[str], virtual_nodes: int = 100):
+        if not database_urls:
+            raise ValueError("At least one shard database URL is required")
+
+        self.engines: Dict[str, Engine] = {}
+        self.sessions: Dict[str, sessionmaker] = {}
+        for index, url in enumerate(database_urls):
+            name = f"shard{index}"
+            # Every shard server sees the pools of all workers
+            self.engines[name] = create_database_engine(url)
+            self.sessions[name] = sessionmaker(
+                autocommit=False,
+                autoflush=False,
+                bind=self.engines[name],
+                info={"shard": name}
+            )
+
+        self.ring = HashRing(list(self.engines), virtual_nodes)
+        self._executor = ThreadPoolExecutor(max_workers=len(self.engines), thread_name_prefix="shard-scatter")
+        self._users: Set[Tuple[str, int]] = set()
+
+    @property
+    def shard_names(self) -> List[str]:
+        return list(self.engines)
+
+    def shard_for_user(self, user_id: Optional[int]) -> str:
+        return self.ring.get_node(f"user:{user_id}")
+
+    @contextmanager
+    def session(self, shard: str) -> Iterator[Session]:
+        db = self.sessions[shard]()
+        try:
+            yield db
+        finally:
+            db.close()
+
+    def session_for_user(self, user_id: Optional[int]):
+        return self.session(self.shard_for_user(user_id))
+
+    def scatter(self, func: Callable[[Session], Any]) -> List[Any]:
+        """Run func against every shard in parallel, results in shard order"""
+        def run(shard: str):
+            with self.session(shard) as db:
+                return func(db)
+
+        return list(self._executor.map(run, self.shard_names))
+
+    def ensure_user(self, shard: str, user: User):
+        """Copy a user's row to their shard once (credentials stay in the main database)"""
+        if (shard, user.id) in self._users:
+            return
+        with self.session(shard) as db:
+            if db.query(User.id).filter(User.id == user.id).first() is None:
+                db.add(User(id=user.id, username=user.username, email=user.email, hashed_password=""))
+                try:
+                    db.commit()
+                except IntegrityError:
+                    # Copied by a concurrent request
+                    db.rollback()
+        self._users.add((shard, user.id))
+
+    def reserve_existing_ids(self):
+        """Move the task id sequence past the tasks already on the shards (e.g. a former single database)"""
+        highest = self.scatter(lambda db: db.query(func.max(Task.id)).scalar())
+        reserve_task_ids(max((task_id or 0) for task_id in highest))
+
+    def create_all(self):
+        """Create tables on every shard (local development and tests)"""
+        for engine in self.engines.values():
+            Base.metadata.create_all(bind=engine)
+
+    def dispose(self):
+        self._executor.shutdown(wait=False)
+        for engine in self.engines.values():
+            engine.dispose()
+
+
+class ShardTransaction:
+    """
+    One transaction on the first shard a unit of work asks for, for atomic
+    batches; CRUD commits inside it become savepoints. A transaction can't
+    span databases, asking for another shard raises CrossShardError. Without
+    a router it runs on the main database.
+    """
+
+    def __init__(self, router: Optional[ShardRouter]):
+        self.router = router
+        self.shard: Optional[str] = None
+        self.db: Optional[Session] = None
+        self._connection: Optional[Connection] = None
+        self._transaction: Optional[RootTransaction] = None
+
+    def session(self, shard: Optional[str] = None) -> Session:
+        if self.db is None:
+            engine = self.router.engines[shard] if self.router else get_engine()
+            self.shard = shard
+            self._connection = engine.connect()
+            self._transaction = self._connection.begin()
+            self.db = Session(
+                bind=self._connection,
+                autoflush=False,
+                join_transaction_mode="create_savepoint",
+                info={"shard": shard}
+            )
+        elif shard != self.shard:
+            raise CrossShardError(
+                f"The transaction runs on {self.shard}, tasks on {shard} can't join it; "
+                f"an atomic batch can only change the tasks of users on one shard"
+            )
+        return self.db
+
+    def commit(self):
+        if self._transaction is not None:
+            self._transaction.commit()
+
+    def rollback(self):
+        if self._transaction is not None:
+            self._transaction.rollback()
+
+    def close(self):
+        if self.db is not None:
+            self.db.close()
+            self._connection.close()
+
+
+class ShardedTaskCRUD:
+    """
+    TaskCRUD reads across every shard, for callers not scoped to a user
+    (with a user_id filter only that user's shard is read), and moves
+    between shards.
+
+    The read methods take TaskCRUD's arguments, so TaskService can call
+    either; db is not used, each shard is read with a session of its own.
+    """
+
+    def __init__(self, router: ShardRouter):
+        self.router = router
+        # As in TaskCRUD._claim_order: native enums sort by declaration, SQLite's strings by name
+        dialect = next(iter(router.engines.values())).dialect.name
+        self._enums_by_declaration = dialect in ("mysql", "postgresql")
+
+    def get_task(self, db: Optional[Session], task_id: int) -> Optional[Task]:
+        return next(filter(None, self.router.scatter(lambda shard_db: task_crud.get_task(shard_db, task_id))), None)
+
+    def get_tasks_by_ids(self, db: Optional[Session], task_ids: List[int]) -> List[Task]:
+        if not task_ids:
+            return []
+        return [
+            task for tasks in self.router.scatter(lambda shard_db: task_crud.get_tasks_by_ids(shard_db, task_ids))
+            for task in tasks
+        ]
+
+    def get_tasks_projected_by_ids(
+            self,
+            db: Optional[Session],
+            task_ids: List[int],
+            fields: List[str],
+            preview_length: int = 0
+    ) -> Dict[int, Dict[str, Any]]:
+        rows = {}
+        if task_ids:
+            for shard_rows in self.router.scatter(
+                lambda shard_db: task_crud.get_tasks_projected_by_ids(shard_db, task_ids, fields, preview_length)
+            ):
+                rows.update(shard_rows)
+        return rows
+
+    def get_tasks_count(self, db: Optional[Session], filters: Optional[Dict[str, Any]] = None) -> int:
+        filters = filters or {}
+        if filters.get("user_id") is not None:
+            with self.router.session_for_user(filters["user_id"]) as shard_db:
+                return task_crud.get_tasks_count(shard_db, filters)
+
+        return sum(self.router.scatter(lambda shard_db: task_crud.get_tasks_count(shard_db, filters)))
+
+    def get_task_ids(
+            self,
+            db: Optional[Session],
+            skip: int = 0,
+            limit: int = 100,
+            filters: Optional[Dict[str, Any]] = None,
+            sort_by: Optional[str] = None,
+            sort_order: str = "asc"
+    ) -> List[int]:
+        filters = filters or {}
+        if filters.get("user_id") is not None:
+            with self.router.session_for_user(filters["user_id"]) as shard_db:
+                return task_crud.get_task_ids(shard_db, skip, limit, filters, sort_by, sort_order)
+
+        column = getattr(Task, sort_by, Task.created_at) if sort_by else Task.created_at
+        descending = not sort_by or sort_order.lower() == "desc"
+
+        # Every shard returns its own first skip + limit rows in the query's
+        # order (ties broken by id), so the global page is a k-way merge of
+        # the shard pages
+        def page(shard_db: Session) -> List[Tuple[Tuple, int]]:
+            query = task_crud._apply_filters(shard_db.query(Task.id, column), filters)
+            query = task_crud._apply_sorting(query, sort_by, sort_order)
+            return [(self._sort_key(value), task_id) for task_id, value in query.limit(skip + limit).all()]
+
+        merged = heapq.merge(*self.router.scatter(page), reverse=descending)
+        return [task_id for _, task_id in itertools.islice(merged, skip, skip + limit)]
+
+    def _sort_key(self, value: Any) -> Tuple:
+        # NULLs sort first, as on MySQL and SQLite
+        if value is None:
+            return (False, None)
+        if isinstance(value, enum.Enum):
+            value = list(type(value)).index(value) if self._enums_by_declaration else value.name
+        return (True, value)
+
+    def move_user(self, user_id: Optional[int], source: str, target: str) -> int:
+        """
+        Move all tasks of a user from one shard to another.
+
+        Tasks keep their ids (they are unique across shards), so caches,
+        events and clients' references stay valid; the user's change log
+        entries stay behind and their sync tokens, which name the shard,
+        expire. The target is committed before the source is cleaned up, so
+        a failure in between leaves a copy rather than losing data. Returns
+        the number of moved tasks.
+        """
+        if source == target:
+            return 0
+
+        with self.router.session(source) as src, self.router.session(target) as dst:
+            tasks = src.query(Task).filter(Task.user_id == user_id).all()
+            if not tasks:
+                return 0
+
+            task_ids = [task.id for task in tasks]
+            edges = src.query(TaskDependency).filter(
+                (TaskDependency.task_id.in_(task_ids)) | (TaskDependency.depends_on_id.in_(task_ids))
+            ).all()
+
+            owned = set(task_ids)
+            for edge in edges:
+                if edge.task_id not in owned or edge.depends_on_id not in owned:
+                    raise CrossShardError(
+                        f"Cannot move user {user_id}: dependency {edge.task_id} -> {edge.depends_on_id} "
+                        f"links tasks of another user on {source}"
+                    )
+
+            if user_id is not None:
+                main = new_session()
+                try:
+                    self.router.ensure_user(target, main.query(User).filter(User.id == user_id).one())
+                finally:
+                    main.close()
+
+            columns = [attribute.key for attribute in inspect(Task).column_attrs]
+            dst.add_all([Task(**{column: getattr(task, column) for column in columns}) for task in tasks])
+            dst.flush()
+            dst.add_all([
+                TaskDependency(task_id=edge.task_id, depends_on_id=edge.depends_on_id, created_at=edge.created_at)
+                for edge in edges
+            ])
+            dst.commit()
+
+            src.query(TaskDependency).filter(
+                TaskDependency.id.in_([edge.id for edge in edges])
+            ).delete(synchronize_session=False)
+            src.query(TaskChange).filter(TaskChange.user_id == user_id).delete(synchronize_session=False)
+            src.query(Task).filter(Task.id.in_(task_ids)).delete(synchronize_session=False)
+            src.commit()
+
+            return len(tasks)
+
+    def rebalance(self) -> Dict[Optional[int], str]:
+        """Move every user whose ring owner differs from the shard holding their tasks"""
+        self.router.reserve_existing_ids()
+        moved = {}
+        for shard in self.router.shard_names:
+            with self.router.session(shard) as db:
+                user_ids = [row[0] for row in db.query(Task.user_id).distinct().all()]
+
+            for user_id in user_ids:
+                target = self.router.shard_for_user(user_id)
+                if target != shard and self.move_user(user_id, shard, target):
+                    moved[user_id] = target
+        return moved
+
+
+_shard_router: Optional[ShardRouter] = None
+
+
+def get_shard_router() -> Optional[ShardRouter]:
+    """Shared router built from settings, None when sharding is disabled"""
+    global _shard_router
+    if _shard_router is None and settings.shard_database_urls:
+        _shard_router = ShardRouter(settings.shard_database_urls, settings.shard_virtual_nodes)
+    return _shard_router
+
+
+@contextmanager
+def task_session(user_id: Optional[int] = None) -> Iterator[Session]:
+    """Session of the database holding user_id's tasks, for code running outside a request"""
+    router = get_shard_router()
+    if router is not None:
+        with router.session_for_user(user_id) as db:
+            yield db
+        return
+    db = new_session()
+    try:
+        yield db
+    finally:
+        db.close()
+
+
+@contextmanager
+def task_sessions() -> Iterator[List[Session]]:
+    """A session per database holding tasks (every shard, or the main database), for jobs covering all tasks"""
+    router = get_shard_router()
+    dbs = [router.sessions[shard]() for shard in router.shard_names] if router else [new_session()]
+    try:
+        yield dbs
+    finally:
+        for db in dbs:
+            db.close()
@@ -0,0 +1,145 @@
+from redis import Redis
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+from typing import Optional, Dict, Any, List
+from datetime import datetime
+from src.models.task import Task, TaskStatus
+from src.utils.circuit_breaker import redis_guarded
+
+
+class TaskStats:
+    """
+    Dashboard counters kept in Redis hashes.
+
+    stats:{scope}             -> total, status:<status>, priority:<priority>
+    stats:completions:{scope} -> <YYYY-MM-DD>: completed tasks, by completed_at
+
+    scope is "global" or "user:<id>". Counters are adjusted incrementally
+    from the old and new values of each write and rebuilt by reconcile().
+    """
+
+    def __init__(self, redis_client: Redis):
+        self.redis = redis_client
+
+    @staticmethod
+    def snapshot(task: Task) -> Dict[str, Any]:
+        """Copy the fields the counters depend on"""
+        return {
+            "user_id": task.user_id,
+            "status": task.status,
+            "priority": task.priority,
+            "created_at": task.created_at,
+            "updated_at": task.updated_at,
+            "completed_at": task.completed_at
+        }
+
+    @staticmethod
+    def _scopes(user_id: Optional[int]) -> List[str]:
+        return ["global"] if user_id is None else ["global", f"user:{user_id}"]
+
+    @staticmethod
+    def _value(value: Any) -> str:
+        return value.value if hasattr(value, "value") else str(value)
+
+    @staticmethod
+    def _completion_day(values: Dict[str, Any]) -> str:
+        # A change that completes the task carries no completed_at yet, it happens now
+        moment = values.get("completed_at") or values.get("updated_at") or values.get("created_at") or datetime.now()
+        return moment.date().isoformat()
+
+    def _apply(self, values: Dict[str, Any], delta: int, pipe):
+        for scope in self._scopes(values["user_id"]):
+            pipe.hincrby(f"stats:{scope}", "total", delta)
+            pipe.hincrby(f"stats:{scope}", f"status:{self._value(values['status'])}", delta)
+            pipe.hincrby(f"stats:{scope}", f"priority:{self._value(values['priority'])}", delta)
+            if values["status"] == TaskStatus.COMPLETED:
+                pipe.hincrby(f"stats:completions:{scope}", self._completion_day(values), delta)
+
+    @redis_guarded()
+    def record_create(self, new: Dict[str, Any]):
+        pipe = self.redis.pipeline(transaction=False)
+        self._apply(new, 1, pipe)
+        pipe.execute()
+
+    @redis_guarded()
+    def record_change(self, old: Dict[str, Any], new: Dict[str, Any]):
+        if all(old[field] == new[field] for field in ("user_id", "status", "priority")):
+            return
+
+        pipe = self.redis.pipeline(transaction=False)
+        self._apply(old, -1, pipe)
+        self._apply(new, 1, pipe)
+        pipe.execute()
+
+    @redis_guarded()
+    def record_delete(self, old: Dict[str, Any]):
+        pipe = self.redis.pipeline(transaction=False)
+        self._apply(old, -1, pipe)
+        pipe.execute()
+
+    @redis_guarded()
+    def get(self, user_id: Optional[int] = None) -> Optional[Dict[str, Any]]:
+        """Counters of the user (or all users), None while Redis is unavailable"""
+        scope = self._scopes(user_id)[-1]
+        counters = self.redis.hgetall(f"stats:{scope}")
+        completions = self.redis.hgetall(f"stats:completions:{scope}")
+
+        by_status = {status.value: 0 for status in TaskStatus}
+        by_priority = {}
+        for field, count in counters.items():
+            kind, _, name = field.partition(":")
+            if kind == "status":
+                by_status[name] = int(count)
+            elif kind == "priority":
+                by_priority[name] = int(count)
+
+        return {
+            "scope": scope,
+            "total": int(counters.get("total", 0)),
+            "by_status": by_status,
+            "by_priority": by_priority,
+            "completions_per_day": {
+                day: int(count) for day, count in sorted(completions.items()) if int(count)
+            }
+        }
+
+    @redis_guarded(default=0)
+    def reconcile(self, *dbs: Session) -> int:
+        """
+        Rebuild every counter from the database (the sum over all given ones,
+        e.g. shards), returns the number of hashes written (0 while Redis is
+        unavailable)
+        """
+        hashes: Dict[str, Dict[str, int]] = {}
+
+        def add(scopes: List[str], field: str, count: int, prefix: str = "stats"):
+            for scope in scopes:
+                counters = hashes.setdefault(f"{prefix}:{scope}", {})
+                counters[field] = counters.get(field, 0) + count
+
+        day = func.date(func.coalesce(Task.completed_at, Task.updated_at, Task.created_at))
+        for db in dbs:
+            rows = db.query(Task.user_id, Task.status, Task.priority, func.count(Task.id)).group_by(
+                Task.user_id, Task.status, Task.priority
+            ).all()
+            for user_id, status, priority, count in rows:
+                scopes = self._scopes(user_id)
+                add(scopes, "total", count)
+                add(scopes, f"status:{self._value(status)}", count)
+                add(scopes, f"priority:{self._value(priority)}", count)
+
+            rows = db.query(Task.user_id, day, func.count(Task.id)).filter(
+                Task.status == TaskStatus.COMPLETED
+            ).group_by(Task.user_id, day).all()
+            for user_id, completed_on, count in rows:
+                add(self._scopes(user_id), str(completed_on), count, prefix="stats:completions")
+
+        pipe = self.redis.pipeline(transaction=True)
+        for key in self.redis.scan_iter(match="stats:*"):
+            if key not in hashes:
+                pipe.delete(key)
+        for key, counters in hashes.items():
+            pipe.delete(key)
+            pipe.hset(key, mapping=counters)
+        pipe.execute()
+        return len(hashes)
@@ -0,0 +1,156 @@
+from redis import Redis
+from sqlalchemy.orm import Session
+from typing import Optional, Dict, Any, List, Iterable, Set
+from datetime import datetime
+from src.config import settings
+from src.crud.cache import list_namespace
+from src.models.task import Task, TaskPriority
+from src.utils.circuit_breaker import redis_guarded
+import json
+import re
+
+WORD = re.compile(r"\w+")
+
+# Score = rank * RANK_WEIGHT + timestamp, so priority wins and recency breaks ties
+PRIORITY_RANK = {TaskPriority.HIGH.value: 2, TaskPriority.MEDIUM.value: 1, TaskPriority.LOW.value: 0}
+RANK_WEIGHT = 1e10
+
+
+class TaskSuggestIndex:
+    """
+    Prefix index over task titles and tags for search-as-you-type.
+
+    suggest:{ns}:{prefix} -> sorted set of task ids, scored by priority then recency
+    suggest:docs          -> task id: {"id", "title", "tags", "priority", "user_id", "ts"}
+
+    ns is "all" plus the owner's "u<id>" (list_namespace). A lookup is one
+    ZREVRANGE and one HMGET, independent of the number of tasks. Kept
+    current by every write and rebuilt by rebuild().
+    """
+
+    DOCS_KEY = "suggest:docs"
+
+    def __init__(self, redis_client: Redis):
+        self.redis = redis_client
+
+    @staticmethod
+    def _value(value: Any) -> Any:
+        return value.value if hasattr(value, "value") else value
+
+    @staticmethod
+    def document(task: Any) -> Dict[str, Any]:
+        """Indexed fields of a task (model or schema)"""
+        moment = task.updated_at or task.created_at or datetime.now()
+        return {
+            "id": task.id,
+            "title": task.title,
+            "tags": list(task.tags or []),
+            "priority": TaskSuggestIndex._value(task.priority),
+            "user_id": task.user_id,
+            "ts": moment.timestamp()
+        }
+
+    @staticmethod
+    def _words(doc: Dict[str, Any]) -> List[str]:
+        return WORD.findall(doc["title"].lower()) + [tag.lower() for tag in doc["tags"]]
+
+    @staticmethod
+    def _prefixes(doc: Dict[str, Any]) -> Set[str]:
+        return {
+            word[:length]
+            for word in TaskSuggestIndex._words(doc)
+            for length in range(1, min(len(word), settings.suggest_max_prefix) + 1)
+        }
+
+    @staticmethod
+    def _namespaces(doc: Dict[str, Any]) -> List[str]:
+        namespaces = [list_namespace(None)]
+        if doc["user_id"] is not None:
+            namespaces.append(list_namespace(doc["user_id"]))
+        return namespaces
+
+    def _keys(self, doc: Dict[str, Any], prefixes: Iterable[str]) -> List[str]:
+        return [f"suggest:{ns}:{prefix}" for ns in self._namespaces(doc) for prefix in prefixes]
+
+    @redis_guarded()
+    def index(self, doc: Dict[str, Any], pipe=None, replace: bool = True):
+        """Add or refresh a task, dropping the prefixes of its previous title and tags"""
+        doc = {**doc, "priority": self._value(doc["priority"])}
+        previous = self.redis.hget(self.DOCS_KEY, doc["id"]) if replace else None
+        stale = set()
+        if previous:
+            old = json.loads(previous)
+            stale = set(self._keys(old, self._prefixes(old)))
+
+        score = PRIORITY_RANK.get(doc["priority"], 0) * RANK_WEIGHT + doc["ts"]
+        keys = self._keys(doc, self._prefixes(doc))
+        own = pipe is None
+        pipe = pipe if pipe is not None else self.redis.pipeline(transaction=False)
+        for key in stale.difference(keys):
+            pipe.zrem(key, doc["id"])
+        for key in keys:
+            pipe.zadd(key, {doc["id"]: score})
+        pipe.hset(self.DOCS_KEY, doc["id"], json.dumps(doc))
+        if own:
+            pipe.execute()
+
+    @redis_guarded()
+    def remove(self, task_id: int):
+        previous = self.redis.hget(self.DOCS_KEY, task_id)
+        if not previous:
+            return
+        old = json.loads(previous)
+        pipe = self.redis.pipeline(transaction=False)
+        for key in self._keys(old, self._prefixes(old)):
+            pipe.zrem(key, task_id)
+        pipe.hdel(self.DOCS_KEY, task_id)
+        pipe.execute()
+
+    def suggest(self, q: str, user_id: Optional[int] = None, limit: int = 10) -> List[Dict[str, Any]]:
+        """
+        Tasks with a title word or tag starting with every word of q, best first.
+
+        The longest word picks the candidate set; further words filter it.
+        """
+        words = WORD.findall(q.lower())
+        if not words:
+            return []
+
+        lookup = max(words, key=len)[:settings.suggest_max_prefix]
+        fetch = limit if len(words) == 1 else limit * 5
+        ids = self.redis.zrevrange(f"suggest:{list_namespace(user_id)}:{lookup}", 0, fetch - 1)
+        if not ids:
+            return []
+
+        results = []
+        for entry in self.redis.hmget(self.DOCS_KEY, ids):
+            if not entry:
+                continue
+            doc = json.loads(entry)
+            doc_words = self._words(doc)
+            if all(any(word.startswith(prefix) for word in doc_words) for prefix in words):
+                doc.pop("ts", None)
+                results.append(doc)
+                if len(results) >= limit:
+                    break
+        return results
+
+    def rebuild(self, *dbs: Session, batch_size: int = 1000) -> int:
+        """Re-index every task from the databases (e.g. all shards), returns the number of tasks indexed"""
+        pipe = self.redis.pipeline(transaction=False)
+        for key in self.redis.scan_iter(match="suggest:*", count=1000):
+            pipe.delete(key)
+        pipe.execute()
+
+        count = 0
+        for db in dbs:
+            query = db.query(
+                Task.id, Task.title, Task.tags, Task.priority, Task.user_id, Task.created_at, Task.updated_at
+            )
+            for task in query.yield_per(batch_size):
+                self.index(self.document(task), pipe, replace=False)
+                count += 1
+                if count % batch_size == 0:
+                    pipe.execute()
+        pipe.execute()
+        return count
@@ -1,11 +1,32 @@
-from sqlalchemy.orm import Session, joinedload
-from sqlalchemy import or_, and_, desc, asc
-from typing import List, Optional, Dict, Any
-from src.models.task import Task, TaskDependency, TaskStatus, TaskPriority
+from sqlalchemy.orm import Session, joinedload, load_only
+from sqlalchemy import (
+    or_, and_, desc, asc, update, select, insert, delete, tuple_, bindparam, func, case, literal, Boolean, DateTime
+)
+from typing import List, Optional, Dict, Any, Iterable, Set, Tuple
+from collections import defaultdict
+from src.models.task import Task, TaskDependency, TaskStatus, TaskPriority, TaskChange
 from src.schemas.task import TaskCreate, TaskUpdate
-from datetime import datetime
+from src.utils.tracing import trace_methods
+from datetime import datetime, timedelta
 
 
+class DependencyCycleError(ValueError):
+    """Adding dependencies would create a cycle; cycle lists the task ids around it"""
+
+    def __init__(self, cycle: List[int]):
+        self.cycle = cycle
+        super().__init__("Circular dependency detected: " + " -> ".join(str(task_id) for task_id in cycle))
+
+
+class VersionConflictError(Exception):
+    """A conditional update found the task at another version"""
+
+    def __init__(self, current_version: int):
+        self.current_version = current_version
+        super().__init__(f"Task was modified, current version is {current_version}")
+
+
+@trace_methods
 class TaskCRUD:
     @staticmethod
     def get_task(db: Session, task_id: int) -> Optional[Task]:
@@ -19,17 +40,7 @@ class TaskCRUD:
         ).filter(Task.id == task_id).first()
 
     @staticmethod
-    def get_tasks(
-            db: Session,
-            skip: int = 0,
-            limit: int = 100,
-            filters: Optional[Dict[str, Any]] = None,
-            sort_by: Optional[str] = None,
-            sort_order: str = "asc"
-    ) -> List[Task]:
-        query = db.query(Task)
-
-        # Apply filters
+    def _apply_filters(query, filters: Optional[Dict[str, Any]]):
         if filters:
             if status := filters.get("status"):
                 query = query.filter(Task.status == status)
@@ -51,49 +62,119 @@ class TaskCRUD:
                 )
             if user_id := filters.get("user_id"):
                 query = query.filter(Task.user_id == user_id)
+            blocked = filters.get("blocked")
+            if blocked is not None:
+                query = query.filter(
+                    Task.pending_dependency_count > 0 if blocked else Task.pending_dependency_count == 0
+                )
+            if filters.get("ready"):
+                # Not completed and nothing left to wait for
+                query = query.filter(
+                    Task.pending_dependency_count == 0,
+                    Task.status != TaskStatus.COMPLETED
+                )
+        return query
 
-        # Apply sorting
+    @staticmethod
+    def _apply_sorting(query, sort_by: Optional[str], sort_order: str):
+        # Ties are broken by id so pages of the same query never overlap
         if sort_by:
             sort_column = getattr(Task, sort_by, Task.created_at)
             if sort_order.lower() == "desc":
-                query = query.order_by(desc(sort_column))
-            else:
-                query = query.order_by(asc(sort_column))
-        else:
-            query = query.order_by(desc(Task.created_at))
+                return query.order_by(desc(sort_column), desc(Task.id))
+            return query.order_by(asc(sort_column), asc(Task.id))
+        return query.order_by(desc(Task.created_at), desc(Task.id))
+
+    @staticmethod
+    def get_tasks(
+            db: Session,
+            skip: int = 0,
+            limit: int = 100,
+            filters: Optional[Dict[str, Any]] = None,
+            sort_by: Optional[str] = None,
+            sort_order: str = "asc"
+    ) -> List[Task]:
+        query = TaskCRUD._apply_filters(db.query(Task), filters)
+        query = TaskCRUD._apply_sorting(query, sort_by, sort_order)
 
         # Apply pagination
         return query.offset(skip).limit(limit).all()
 
     @staticmethod
-    def get_tasks_count(db: Session, filters: Optional[Dict[str, Any]] = None) -> int:
-        query = db.query(Task)
+    def get_task_ids(
+            db: Session,
+            skip: int = 0,
+            limit: int = 100,
+            filters: Optional[Dict[str, Any]] = None,
+            sort_by: Optional[str] = None,
+            sort_order: str = "asc"
+    ) -> List[int]:
+        """Ids of a page of get_tasks, in the same order"""
+        query = TaskCRUD._apply_filters(db.query(Task.id), filters)
+        query = TaskCRUD._apply_sorting(query, sort_by, sort_order)
+        return [row[0] for row in query.offset(skip).limit(limit).all()]
 
-        if filters:
-            if status := filters.get("status"):
-                query = query.filter(Task.status == status)
-            if priority := filters.get("priority"):
-                query = query.filter(Task.priority == priority)
-            if tags := filters.get("tags"):
-                conditions = []
-                for tag in tags:
-                    conditions.append(Task.tags.contains([tag]))
-                query = query.filter(or_(*conditions))
-            if search := filters.get("search"):
-                search_term = f"%{search}%"
-                query = query.filter(
-                    or_(
-                        Task.title.ilike(search_term),
-                        Task.description.ilike(search_term)
-                    )
-                )
-            if user_id := filters.get("user_id"):
-                query = query.filter(Task.user_id == user_id)
+    @staticmethod
+    def get_tasks_by_ids(db: Session, task_ids: List[int]) -> List[Task]:
+        """Tasks with the given ids in one IN query, in no particular order"""
+        if not task_ids:
+            return []
+        return db.query(Task).filter(Task.id.in_(task_ids)).all()
+
+    @staticmethod
+    def get_tasks_projected_by_ids(
+            db: Session,
+            task_ids: List[int],
+            fields: List[str],
+            preview_length: int = 0
+    ) -> Dict[int, Dict[str, Any]]:
+        """
+        Only the requested columns of the tasks with the given ids, by id;
+        description_preview is truncated in SQL
+        """
+        if not task_ids:
+            return {}
+        columns = [getattr(Task, field) for field in fields if field != "description_preview"]
+        query = db.query(Task).options(load_only(Task.id, *columns))
+        with_preview = "description_preview" in fields
+        if with_preview:
+            query = query.add_columns(
+                func.substr(Task.description, 1, preview_length).label("description_preview")
+            )
+
+        rows = {}
+        for row in query.filter(Task.id.in_(task_ids)).all():
+            task, preview = row if with_preview else (row, None)
+            data = {column.key: getattr(task, column.key) for column in columns}
+            if with_preview:
+                data["description_preview"] = preview
+            rows[task.id] = data
+        return rows
 
-        return query.count()
+    @staticmethod
+    def get_task_owners(db: Session, task_ids: Iterable[int]) -> Dict[int, Optional[int]]:
+        """user_id of each existing task, in one query"""
+        task_ids = list(task_ids)
+        if not task_ids:
+            return {}
+        return dict(db.query(Task.id, Task.user_id).filter(Task.id.in_(task_ids)).all())
+
+    @staticmethod
+    def get_tasks_count(db: Session, filters: Optional[Dict[str, Any]] = None) -> int:
+        return TaskCRUD._apply_filters(db.query(Task), filters).count()
 
     @staticmethod
     def create_task(db: Session, task_data: TaskCreate, user_id: Optional[int] = None) -> Task:
+        """Raises ValueError if a dependency doesn't exist or (with user_id) isn't the user's"""
+        if task_data.depends_on:
+            owners = TaskCRUD.get_task_owners(db, task_data.depends_on)
+            unknown = sorted({
+                depends_on_id for depends_on_id in task_data.depends_on
+                if depends_on_id not in owners or (user_id is not None and owners[depends_on_id] != user_id)
+            })
+            if unknown:
+                raise ValueError(f"Dependency tasks not found: {', '.join(map(str, unknown))}")
+
         # Create task
         db_task = Task(
             title=task_data.title,
@@ -101,50 +182,414 @@ class TaskCRUD:
             status=task_data.status,
             priority=task_data.priority,
             tags=task_data.tags,
-            user_id=user_id
+            user_id=user_id,
+            completed_at=datetime.now() if task_data.status == TaskStatus.COMPLETED else None
         )
         db.add(db_task)
         db.flush()  # Get the task ID
 
         # Create dependencies
         if task_data.depends_on:
-            for depends_on_id in task_data.depends_on:
-                if depends_on_id != db_task.id:  # Prevent self-dependency
-                    dependency = TaskDependency(
-                        task_id=db_task.id,
-                        depends_on_id=depends_on_id
-                    )
-                    db.add(dependency)
-
+            # Repeated ids would break unique_dependency, self-dependencies are skipped
+            depends_on = [
+                depends_on_id for depends_on_id in dict.fromkeys(task_data.depends_on) if depends_on_id != db_task.id
+            ]
+            for depends_on_id in depends_on:
+                dependency = TaskDependency(
+                    task_id=db_task.id,
+                    depends_on_id=depends_on_id
+                )
+                db.add(dependency)
+            if depends_on:
+                db_task.pending_dependency_count = db.query(func.count(Task.id)).filter(
+                    Task.id.in_(depends_on),
+                    Task.status != TaskStatus.COMPLETED
+                ).scalar()
+
+        TaskCRUD._log_changes(db, [db_task.id])
         db.commit()
         db.refresh(db_task)
         return db_task
 
     @staticmethod
-    def update_task(db: Session, task_id: int, task_data: TaskUpdate) -> Optional[Task]:
-        db_task = TaskCRUD.get_task(db, task_id)
-        if not db_task:
-            return None
+    def update_task(
+            db: Session,
+            task_id: int,
+            task_data: TaskUpdate,
+            expected_version: Optional[int] = None,
+            user_id: Optional[int] = None
+    ) -> Tuple[Optional[Task], Optional[Any]]:
+        """
+        Apply an update as a conditional UPDATE, without reading the task first.
+
+        With expected_version the row must still be at that version, else
+        VersionConflictError is raised. A status change is tried as a
+        completion transition first (shifting the dependents' counts), then as
+        a change within the same side. Returns (None, None) if the task does
+        not exist or does not belong to user_id.
+
+        A status or priority change also returns the fields the stats
+        counters depend on as they were before it, read with the row locked
+        in the same transaction; else None.
+        """
+        values = task_data.dict(exclude_unset=True)
+        values.pop("version", None)
+        status = values.get("status")
+        if status is not None and status != TaskStatus.IN_PROGRESS:
+            # Leaving in_progress ends a work queue lease
+            values["lease_owner"] = values["lease_expires_at"] = None
+        values["updated_at"] = datetime.now()
+        values["version"] = Task.version + 1
+
+        guard = [Task.id == task_id]
+        if expected_version is not None:
+            guard.append(Task.version == expected_version)
+        if user_id is not None:
+            guard.append(Task.user_id == user_id)
+
+        previous = None
+        if "status" in values or "priority" in values:
+            previous = db.query(
+                Task.user_id, Task.status, Task.priority, Task.created_at, Task.updated_at, Task.completed_at
+            ).filter(*guard).with_for_update().first()
+
+        def apply(*conditions, **transition) -> bool:
+            result = db.execute(
+                update(Task)
+                .where(*guard, *conditions)
+                .values(**values, **transition)
+                .execution_options(synchronize_session=False)
+            )
+            return result.rowcount > 0
+
+        if status is None:
+            applied = apply()
+        elif status == TaskStatus.COMPLETED:
+            applied = apply(
+                Task.status != TaskStatus.COMPLETED, Task.pending_dependency_count == 0,
+                completed_at=values["updated_at"]
+            )
+            if applied:
+                TaskCRUD._shift_dependents(db, [task_id], -1)
+            else:
+                applied = apply(Task.status == TaskStatus.COMPLETED)
+        else:
+            applied = apply(Task.status == TaskStatus.COMPLETED, completed_at=None)
+            if applied:
+                TaskCRUD._shift_dependents(db, [task_id], 1)
+            else:
+                applied = apply(Task.status != TaskStatus.COMPLETED)
+
+        if not applied:
+            # Only read on failure, to tell the caller why
+            db.rollback()
+            db_task = TaskCRUD.get_task(db, task_id)
+            if not db_task or (user_id is not None and db_task.user_id != user_id):
+                return None, None
+            if expected_version is not None and db_task.version != expected_version:
+                raise VersionConflictError(db_task.version)
+            if status == TaskStatus.COMPLETED:
+                TaskCRUD.check_can_complete(db, db_task)
+            # Changed between the two attempts
+            raise VersionConflictError(db_task.version)
+
+        TaskCRUD._log_changes(db, [task_id])
+        db.commit()
+        return TaskCRUD.get_task(db, task_id), previous
 
-        update_data = task_data.dict(exclude_unset=True)
+    @staticmethod
+    def check_can_complete(db: Session, db_task: Task):
+        """Raise ValueError if any dependency of the task is not completed"""
+        if not db_task.pending_dependency_count:
+            return
+
+        # Only looked up to name a blocking dependency in the error
+        blocking = db.query(TaskDependency.depends_on_id).join(
+            Task, Task.id == TaskDependency.depends_on_id
+        ).filter(
+            TaskDependency.task_id == db_task.id,
+            Task.status != TaskStatus.COMPLETED
+        ).first()
+        raise ValueError(
+            f"Cannot mark task as completed. "
+            f"Dependency task {blocking[0] if blocking else '?'} is not completed."
+        )
 
-        # Prevent marking task as completed if dependencies aren't done
-        if update_data.get("status") == TaskStatus.COMPLETED:
-            # Check if all dependencies are completed
-            for dependency in db_task.dependencies:
-                if dependency.depends_on_task.status != TaskStatus.COMPLETED:
-                    raise ValueError(
-                        f"Cannot mark task as completed. "
-                        f"Dependency task {dependency.depends_on_id} is not completed."
-                    )
+    @staticmethod
+    def _shift_dependents(db: Session, task_ids: List[int], delta: int):
+        """
+        Add delta to the pending dependency count of every task depending on
+        one of task_ids (once per such dependency), in a single UPDATE.
+        """
+        if not task_ids:
+            return
+
+        edges = select(func.count(TaskDependency.id)).where(
+            TaskDependency.task_id == Task.id,
+            TaskDependency.depends_on_id.in_(task_ids)
+        ).scalar_subquery()
+        dependents = select(TaskDependency.task_id).where(TaskDependency.depends_on_id.in_(task_ids))
+        db.execute(
+            update(Task)
+            .where(Task.id.in_(dependents))
+            .values(pending_dependency_count=Task.pending_dependency_count + delta * edges)
+            .execution_options(synchronize_session=False)
+        )
 
-        for field, value in update_data.items():
-            setattr(db_task, field, value)
+    @staticmethod
+    def bulk_update_fields(db: Session, updates: Dict[int, Dict[str, Any]]) -> Tuple[List[Task], List[int]]:
+        """
+        Apply per-task field updates as one batched UPDATE.
+
+        Returns the written tasks as they were before the update, and the ids
+        of completions rejected because the task has incomplete dependencies
+        (one may have been reopened since the update was accepted); nothing
+        of a rejected task's update is written.
+        """
+        if not updates:
+            return [], []
+
+        previous = db.query(Task).filter(Task.id.in_(list(updates))).all()
+        if not previous:
+            return [], []
+        db.expunge_all()
+
+        now = datetime.now()
+        rows, completions = [], []
+        for task in previous:
+            row = {"id": task.id, **updates[task.id], "updated_at": now}
+            if row.get("status", TaskStatus.IN_PROGRESS) != TaskStatus.IN_PROGRESS:
+                row["lease_owner"] = row["lease_expires_at"] = None
+            if "status" in row and (row["status"] == TaskStatus.COMPLETED) != (task.status == TaskStatus.COMPLETED):
+                row["completed_at"] = now if row["status"] == TaskStatus.COMPLETED else None
+            (completions if row.get("completed_at") else rows).append(row)
+        if rows:
+            db.execute(update(Task), rows)
+        rejected = []
+        if completions:
+            db.execute(
+                update(Task)
+                .where(Task.pending_dependency_count == 0)
+                .execution_options(synchronize_session=None),
+                completions
+            )
+            rejected = [task_id for (task_id,) in db.query(Task.id).filter(
+                Task.id.in_([row["id"] for row in completions]),
+                Task.status != TaskStatus.COMPLETED
+            ).order_by(Task.id)]
+            previous = [task for task in previous if task.id not in rejected]
+        if not previous:
+            db.rollback()
+            return [], rejected
+        db.execute(
+            update(Task)
+            .where(Task.id.in_([task.id for task in previous]))
+            .values(version=Task.version + 1)
+            .execution_options(synchronize_session=False)
+        )
 
-        db_task.updated_at = datetime.now()
+        completed, reopened = [], []
+        for task in previous:
+            status = updates[task.id].get("status")
+            if status is None or (status == TaskStatus.COMPLETED) == (task.status == TaskStatus.COMPLETED):
+                continue
+            (completed if status == TaskStatus.COMPLETED else reopened).append(task.id)
+        TaskCRUD._shift_dependents(db, completed, -1)
+        TaskCRUD._shift_dependents(db, reopened, 1)
+        TaskCRUD._log_changes(db, [task.id for task in previous])
         db.commit()
-        db.refresh(db_task)
-        return db_task
+        return previous, rejected
+
+    @staticmethod
+    def _claim_order(db: Session):
+        """Highest priority first, then oldest; in index order where enums sort by declaration"""
+        if db.get_bind().dialect.name in ("mysql", "postgresql"):
+            return [desc(Task.priority), asc(Task.id)]
+        rank = case((Task.priority == TaskPriority.HIGH, 0), (Task.priority == TaskPriority.MEDIUM, 1), else_=2)
+        return [rank, asc(Task.id)]
+
+    @staticmethod
+    def claim_tasks(
+            db: Session,
+            worker_id: str,
+            n: int,
+            lease_seconds: int,
+            user_id: Optional[int] = None
+    ) -> Tuple[List[Task], Set[int]]:
+        """
+        Lease up to n tasks to worker_id and mark them in progress.
+
+        Tasks whose lease expired are reclaimed first, then ready tasks (pending,
+        no incomplete dependency) by priority. Candidates are locked with
+        FOR UPDATE SKIP LOCKED, so concurrent claims skip each other's rows
+        instead of queueing on them. Returns the claimed tasks and the ids of
+        the reclaimed ones.
+        """
+        now = datetime.now()
+        scope = [Task.user_id == user_id] if user_id is not None else []
+        expired = db.query(Task.id).filter(
+            Task.status == TaskStatus.IN_PROGRESS,
+            Task.lease_expires_at < now,
+            *scope
+        ).order_by(Task.lease_expires_at).limit(n).with_for_update(skip_locked=True).all()
+        reclaimed = {row[0] for row in expired}
+
+        task_ids = list(reclaimed)
+        if len(task_ids) < n:
+            ready = db.query(Task.id).filter(
+                Task.status == TaskStatus.PENDING,
+                Task.pending_dependency_count == 0,
+                *scope
+            ).order_by(*TaskCRUD._claim_order(db)).limit(n - len(task_ids)).with_for_update(skip_locked=True).all()
+            task_ids += [row[0] for row in ready]
+        if not task_ids:
+            db.rollback()
+            return [], set()
+
+        # The claim conditions are checked again, so databases without row
+        # locks (SQLite) can't hand a task to two workers either
+        db.execute(
+            update(Task)
+            .where(
+                Task.id.in_(task_ids),
+                or_(
+                    and_(Task.status == TaskStatus.PENDING, Task.pending_dependency_count == 0),
+                    and_(Task.status == TaskStatus.IN_PROGRESS, Task.lease_expires_at < now)
+                )
+            )
+            .values(
+                status=TaskStatus.IN_PROGRESS,
+                lease_owner=worker_id,
+                lease_expires_at=now + timedelta(seconds=lease_seconds),
+                updated_at=now,
+                version=Task.version + 1
+            )
+            .execution_options(synchronize_session=False)
+        )
+        TaskCRUD._log_changes(db, task_ids, Task.lease_owner == worker_id)
+        db.commit()
+        tasks = db.query(Task).filter(
+            Task.id.in_(task_ids),
+            Task.status == TaskStatus.IN_PROGRESS,
+            Task.lease_owner == worker_id
+        ).all()
+        order = {task_id: position for position, task_id in enumerate(task_ids)}
+        return sorted(tasks, key=lambda task: order[task.id]), reclaimed & {task.id for task in tasks}
+
+    @staticmethod
+    def renew_lease(
+            db: Session,
+            task_id: int,
+            worker_id: str,
+            lease_seconds: int,
+            user_id: Optional[int] = None
+    ) -> Optional[datetime]:
+        """Extend a lease still held by worker_id, None if the task is no longer leased to it (or not user_id's)"""
+        expires_at = datetime.now() + timedelta(seconds=lease_seconds)
+        guard = [Task.id == task_id, Task.status == TaskStatus.IN_PROGRESS, Task.lease_owner == worker_id]
+        if user_id is not None:
+            guard.append(Task.user_id == user_id)
+        result = db.execute(
+            update(Task)
+            .where(*guard)
+            .values(lease_expires_at=expires_at)
+            .execution_options(synchronize_session=False)
+        )
+        db.commit()
+        return expires_at if result.rowcount else None
+
+    @staticmethod
+    def release_expired_leases(db: Session, limit: int = 1000) -> List[Task]:
+        """Return tasks with an expired lease to pending, returns them as they were before"""
+        expired = db.query(Task).filter(
+            Task.status == TaskStatus.IN_PROGRESS,
+            Task.lease_expires_at < datetime.now()
+        ).limit(limit).with_for_update(skip_locked=True).all()
+        if not expired:
+            db.rollback()
+            return []
+        db.expunge_all()
+
+        db.execute(
+            update(Task)
+            .where(Task.id.in_([task.id for task in expired]))
+            .values(
+                status=TaskStatus.PENDING,
+                lease_owner=None,
+                lease_expires_at=None,
+                updated_at=datetime.now(),
+                version=Task.version + 1
+            )
+            .execution_options(synchronize_session=False)
+        )
+        TaskCRUD._log_changes(db, [task.id for task in expired])
+        db.commit()
+        return expired
+
+    @staticmethod
+    def _log_changes(db: Session, task_ids: List[int], *conditions, deleted: bool = False):
+        """Append change log entries for the tasks, in the caller's transaction"""
+        if not task_ids:
+            return
+        db.execute(
+            insert(TaskChange).from_select(
+                ["task_id", "user_id", "deleted", "changed_at"],
+                select(
+                    Task.id, Task.user_id, literal(deleted, Boolean), literal(datetime.now(), DateTime)
+                ).where(Task.id.in_(task_ids), *conditions).order_by(Task.id)
+            )
+        )
+
+    @staticmethod
+    def get_changes(
+            db: Session,
+            since: int,
+            limit: int,
+            user_id: Optional[int] = None,
+            settle_seconds: float = 15
+    ) -> Tuple[List[TaskChange], int]:
+        """
+        Change log entries after since (of user_id's tasks if given), at most
+        limit, and the sequence number the log is known complete up to.
+
+        Sequence numbers are allocated at insert but become visible at
+        commit, so a newer entry can show up before an older one. Entries
+        older than settle_seconds are complete; newer ones only count up to
+        the first gap in the sequence.
+        """
+        complete = TaskCRUD.complete_change_seq(db, since, settle_seconds)
+        query = db.query(TaskChange).filter(TaskChange.seq > since, TaskChange.seq <= complete)
+        if user_id is not None:
+            query = query.filter(TaskChange.user_id == user_id)
+        return query.order_by(TaskChange.seq).limit(limit).all(), complete
+
+    @staticmethod
+    def complete_change_seq(db: Session, since: int = 0, settle_seconds: float = 15) -> int:
+        """Highest sequence number with every entry up to it committed (or rolled back for good)"""
+        settled = db.query(TaskChange.seq).filter(
+            TaskChange.changed_at <= datetime.now() - timedelta(seconds=settle_seconds)
+        ).order_by(desc(TaskChange.changed_at), desc(TaskChange.seq)).limit(1).scalar()
+        complete = max(since, settled or 0)
+        recent = db.query(TaskChange.seq).filter(TaskChange.seq > complete).order_by(TaskChange.seq).limit(10000)
+        for (seq,) in recent:
+            if seq != complete + 1:
+                break
+            complete = seq
+        return complete
+
+    @staticmethod
+    def prune_changes(db: Session, before: datetime, batch_size: int = 10000) -> int:
+        """Delete change log entries older than before, returns the number deleted"""
+        pruned = 0
+        while True:
+            seqs = [row[0] for row in db.query(TaskChange.seq).filter(
+                TaskChange.changed_at < before
+            ).order_by(TaskChange.changed_at).limit(batch_size).all()]
+            if not seqs:
+                return pruned
+            db.execute(delete(TaskChange).where(TaskChange.seq.in_(seqs)))
+            db.commit()
+            pruned += len(seqs)
 
     @staticmethod
     def delete_task(db: Session, task_id: int) -> bool:
@@ -152,6 +597,14 @@ class TaskCRUD:
         if not db_task:
             return False
 
+        # Dependents stop waiting for a deleted task
+        if db_task.status != TaskStatus.COMPLETED:
+            TaskCRUD._shift_dependents(db, [task_id], -1)
+        db.query(TaskDependency).filter(
+            TaskDependency.depends_on_id == task_id
+        ).delete(synchronize_session=False)
+
+        TaskCRUD._log_changes(db, [task_id], deleted=True)
         db.delete(db_task)
         db.commit()
         return True
@@ -183,6 +636,8 @@ class TaskCRUD:
             depends_on_id=depends_on_id
         )
         db.add(dependency)
+        if depends_on_task.status != TaskStatus.COMPLETED:
+            task.pending_dependency_count = Task.pending_dependency_count + 1
         db.commit()
         db.refresh(dependency)
         return dependency
@@ -197,25 +652,198 @@ class TaskCRUD:
         if not dependency:
             return False
 
+        depends_on_status = db.query(Task.status).filter(Task.id == depends_on_id).scalar()
+        if depends_on_status != TaskStatus.COMPLETED:
+            db.execute(
+                update(Task)
+                .where(Task.id == task_id)
+                .values(pending_dependency_count=Task.pending_dependency_count - 1)
+                .execution_options(synchronize_session=False)
+            )
         db.delete(dependency)
         db.commit()
         return True
 
+    @staticmethod
+    def apply_dependency_batch(
+            db: Session,
+            add: List[Tuple[int, int]],
+            remove: List[Tuple[int, int]],
+            user_id: Optional[int] = None
+    ) -> Dict[str, List[Tuple[int, int]]]:
+        """
+        Add and remove many (task_id, depends_on_id) edges in one transaction.
+
+        Removals are applied first. Edges that already exist (or are already
+        absent) are skipped. Raises LookupError for unknown task ids (or, with
+        user_id, tasks of other users) and
+        DependencyCycleError if the resulting graph has a cycle. Returns the
+        edges actually added and removed.
+        """
+        add = list(dict.fromkeys(add))
+        adding = set(add)
+        remove = [edge for edge in dict.fromkeys(remove) if edge not in adding]
+        if not add and not remove:
+            return {"added": [], "removed": []}
+
+        # One query validates every id and loads the statuses the counters need
+        task_ids = {task_id for edge in add + remove for task_id in edge}
+        query = db.query(Task.id, Task.status).filter(Task.id.in_(task_ids))
+        if user_id is not None:
+            query = query.filter(Task.user_id == user_id)
+        statuses = dict(query.all())
+        missing = sorted(task_ids - set(statuses))
+        if missing:
+            raise LookupError(f"Tasks not found: {', '.join(str(task_id) for task_id in missing)}")
+
+        # Existing outgoing edges, loaded per level of the walk with one IN query
+        outgoing: Dict[int, Set[int]] = defaultdict(set)
+        loaded: Set[int] = set()
+
+        def load(node_ids: Iterable[int]):
+            node_ids = [node_id for node_id in node_ids if node_id not in loaded]
+            if node_ids:
+                for task_id, depends_on_id in db.query(
+                        TaskDependency.task_id, TaskDependency.depends_on_id
+                ).filter(TaskDependency.task_id.in_(node_ids)).all():
+                    outgoing[task_id].add(depends_on_id)
+                loaded.update(node_ids)
+
+        load({task_id for task_id, _ in add + remove})
+        remove = [edge for edge in remove if edge[1] in outgoing[edge[0]]]
+        add = [edge for edge in add if edge[1] not in outgoing[edge[0]]]
+
+        # Merged graph: existing edges minus removals plus additions, any new
+        # cycle has to go through one of the added edges
+        for task_id, depends_on_id in remove:
+            outgoing[task_id].discard(depends_on_id)
+        for task_id, depends_on_id in add:
+            outgoing[task_id].add(depends_on_id)
+
+        frontier = {depends_on_id for _, depends_on_id in add}
+        while frontier:
+            load(frontier)
+            frontier = {
+                depends_on_id for node_id in frontier for depends_on_id in outgoing[node_id]
+                if depends_on_id not in loaded
+            }
+
+        cycle = TaskCRUD._find_cycle(outgoing, [task_id for task_id, _ in add])
+        if cycle:
+            raise DependencyCycleError(cycle)
+
+        deltas: Dict[int, int] = defaultdict(int)
+        for task_id, depends_on_id in add:
+            if statuses[depends_on_id] != TaskStatus.COMPLETED:
+                deltas[task_id] += 1
+        for task_id, depends_on_id in remove:
+            if statuses[depends_on_id] != TaskStatus.COMPLETED:
+                deltas[task_id] -= 1
+
+        if remove:
+            db.execute(
+                delete(TaskDependency)
+                .where(tuple_(TaskDependency.task_id, TaskDependency.depends_on_id).in_(remove))
+                .execution_options(synchronize_session=False)
+            )
+        if add:
+            db.execute(
+                insert(TaskDependency),
+                [{"task_id": task_id, "depends_on_id": depends_on_id} for task_id, depends_on_id in add]
+            )
+        deltas = {task_id: delta for task_id, delta in deltas.items() if delta}
+        if deltas:
+            tasks = Task.__table__
+            db.execute(
+                update(tasks)
+                .where(tasks.c.id == bindparam("task_id"))
+                .values(pending_dependency_count=tasks.c.pending_dependency_count + bindparam("delta")),
+                [{"task_id": task_id, "delta": delta} for task_id, delta in deltas.items()]
+            )
+        db.commit()
+        return {"added": add, "removed": remove}
+
+    @staticmethod
+    def _find_cycle(outgoing: Dict[int, Set[int]], starts: List[int]) -> Optional[List[int]]:
+        """Iterative DFS, returns the first cycle found as [a, b, ..., a]"""
+        on_path, done = set(), set()
+        for start in starts:
+            if start in done:
+                continue
+            path = [start]
+            on_path.add(start)
+            stack = [iter(sorted(outgoing.get(start, ())))]
+            while stack:
+                child = next(stack[-1], None)
+                if child is None:
+                    stack.pop()
+                    node = path.pop()
+                    on_path.discard(node)
+                    done.add(node)
+                elif child in on_path:
+                    return path[path.index(child):] + [child]
+                elif child not in done:
+                    path.append(child)
+                    on_path.add(child)
+                    stack.append(iter(sorted(outgoing.get(child, ()))))
+        return None
+
     @staticmethod
     def get_dependency_tree(db: Session, task_id: int) -> Dict[str, Any]:
-        """Get the complete dependency tree for a task"""
+        """Get the complete dependency tree for a task, tasks of other owners left out"""
         task = TaskCRUD.get_task_with_dependencies(db, task_id)
         if not task:
             return {}
+        return TaskCRUD._dependency_subtree(db, task, task.user_id)
 
+    @staticmethod
+    def _dependency_subtree(db: Session, task: Task, owner: Optional[int]) -> Dict[str, Any]:
         return {
             "task": task,
             "dependencies": [
-                TaskCRUD.get_dependency_tree(db, dep.depends_on_id)
+                TaskCRUD._dependency_subtree(db, TaskCRUD.get_task_with_dependencies(db, dep.depends_on_id), owner)
                 for dep in task.dependencies
+                if dep.depends_on_task.user_id == owner
             ]
         }
 
+    @staticmethod
+    def get_dependency_graph(db: Session, task_id: int) -> Dict[str, Any]:
+        """
+        Every task reachable from task_id through dependencies, each loaded once.
+
+        The graph is walked level by level with one IN query per level, so a
+        dependency shared by several tasks is visited once. Depth is the
+        length of the shortest path from task_id. Tasks of other owners than
+        the root's (and what is only reachable through them) are left out.
+        """
+        root = TaskCRUD.get_task(db, task_id)
+        if not root:
+            return {}
+
+        depth = {task_id: 0}
+        edges = []
+        frontier = [task_id]
+        level = 0
+        while frontier:
+            level += 1
+            rows = db.query(TaskDependency.task_id, TaskDependency.depends_on_id).join(
+                Task, Task.id == TaskDependency.depends_on_id
+            ).filter(
+                TaskDependency.task_id.in_(frontier),
+                Task.user_id == root.user_id
+            ).all()
+            frontier = []
+            for dependent_id, depends_on_id in rows:
+                edges.append((dependent_id, depends_on_id))
+                if depends_on_id not in depth:
+                    depth[depends_on_id] = level
+                    frontier.append(depends_on_id)
+
+        others = [node_id for node_id in depth if node_id != task_id]
+        tasks = [root] + (db.query(Task).filter(Task.id.in_(others)).all() if others else [])
+        return {"tasks": tasks, "depth": depth, "edges": sorted(edges)}
+
     @staticmethod
     def _has_circular_dependency(db: Session, task_id: int, depends_on_id: int) -> bool:
         """Check if adding a dependency would create a circular reference"""
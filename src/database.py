@@ -1,32 +1,94 @@
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event
+from sqlalchemy.engine import Engine
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker, Session
-from redis import Redis
-from typing import Generator
-import aioredis
+from redis import Redis, BlockingConnectionPool
+from starlette.requests import HTTPConnection
+from typing import Generator, Optional, Dict
 from src.config import settings
 
-# SQLAlchemy setup
-engine = create_engine(
-    settings.database_url,
-    pool_pre_ping=True,
-    pool_recycle=3600,
-    pool_size=20,
-    max_overflow=10,
-    echo=settings.debug
-)
+# Clients are created on first use (normally during lifespan startup), so
+# importing the application never opens a connection.
+_engine: Optional[Engine] = None
+_redis_client: Optional[Redis] = None
+_redis_raw_client: Optional[Redis] = None
 
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+SessionLocal = sessionmaker(autocommit=False, autoflush=False)
 
 Base = declarative_base()
 
-# Redis setup
-redis_client = Redis.from_url(settings.redis_url, decode_responses=True)
+
+# Pool of a single process; with several workers the connection budget is split
+DEFAULT_POOL_SIZE = 20
+DEFAULT_MAX_OVERFLOW = 10
+
+
+def pool_options() -> Dict[str, int]:
+    """Per-process pool size, so all workers together stay within db_max_connections"""
+    workers = settings.web_concurrency or 1
+    per_worker = min(settings.db_max_connections // workers, DEFAULT_POOL_SIZE + DEFAULT_MAX_OVERFLOW)
+    pool_size = max(1, per_worker * DEFAULT_POOL_SIZE // (DEFAULT_POOL_SIZE + DEFAULT_MAX_OVERFLOW))
+    max_overflow = max(0, per_worker - pool_size)
+    if settings.db_pool_size is not None:
+        pool_size = settings.db_pool_size
+    if settings.db_max_overflow is not None:
+        max_overflow = settings.db_max_overflow
+    return {"pool_size": pool_size, "max_overflow": max_overflow}
+
+
+def create_database_engine(url: str) -> Engine:
+    """Engine with the pool settings of the app, for the main database and every shard"""
+    engine = create_engine(
+        url,
+        pool_pre_ping=True,
+        pool_recycle=3600,
+        echo=settings.debug,
+        **pool_options()
+    )
+    if engine.dialect.name == "sqlite":
+        _enable_sqlite_savepoints(engine)
+    return engine
+
+
+def get_engine() -> Engine:
+    """SQLAlchemy engine, created on first call"""
+    global _engine
+    if _engine is None:
+        _engine = create_database_engine(settings.database_url)
+        SessionLocal.configure(bind=_engine)
+    return _engine
+
+
+def _enable_sqlite_savepoints(engine: Engine):
+    """
+    pysqlite only begins transactions before DML, so a SAVEPOINT opened first
+    becomes the transaction and RELEASE commits it. Emit BEGIN ourselves, as
+    the SQLAlchemy docs recommend, so nested transactions (atomic batches)
+    behave as on MySQL.
+    """
+    @event.listens_for(engine, "connect")
+    def _connect(dbapi_connection, connection_record):
+        dbapi_connection.isolation_level = None
+        # A session's open read transaction would otherwise block every other
+        # connection's commit (e.g. task id allocation during a sharded request)
+        dbapi_connection.execute("PRAGMA journal_mode=WAL")
+
+    @event.listens_for(engine, "begin")
+    def _begin(connection):
+        connection.exec_driver_sql("BEGIN")
+
+
+def new_session() -> Session:
+    """Session for code running outside a request (jobs, scripts)"""
+    get_engine()
+    return SessionLocal()
 
 
 # Async Redis setup
 async def get_async_redis():
-    redis = await aioredis.from_url(
+    from redis.asyncio import Redis as AsyncRedis
+
+    redis = AsyncRedis.from_url(
         settings.redis_url,
         decode_responses=True,
         max_connections=10
@@ -37,13 +99,56 @@ async def get_async_redis():
         await redis.close()
 
 
-def get_db() -> Generator[Session, None, None]:
-    db = SessionLocal()
+def get_db(connection: HTTPConnection) -> Generator[Session, None, None]:
+    # Sub-requests of POST /batch run in the batch's session
+    shared = connection.scope.get("db_session")
+    if shared is not None:
+        yield shared
+        return
+    db = new_session()
     try:
         yield db
     finally:
         db.close()
 
 
+def _create_redis(**kwargs) -> Redis:
+    """
+    Client with timeouts, so a slow Redis fails fast instead of hanging
+    requests. The blocking pool makes bursts wait (up to the socket timeout)
+    for a free connection rather than fail with "Too many connections".
+    """
+    pool = BlockingConnectionPool.from_url(
+        settings.redis_url,
+        max_connections=settings.redis_max_connections,
+        timeout=settings.redis_socket_timeout,
+        socket_connect_timeout=settings.redis_socket_connect_timeout,
+        socket_timeout=settings.redis_socket_timeout,
+        health_check_interval=settings.redis_health_check_interval,
+        **kwargs
+    )
+    return Redis(connection_pool=pool)
+
+
 def get_redis() -> Redis:
-    return redis_client
\ No newline at end of file
+    global _redis_client
+    if _redis_client is None:
+        _redis_client = _create_redis(decode_responses=True)
+    return _redis_client
+
+
+def get_redis_raw() -> Redis:
+    """Redis client returning bytes, for cached response bodies"""
+    global _redis_raw_client
+    if _redis_raw_client is None:
+        _redis_raw_client = _create_redis()
+    return _redis_raw_client
+
+
+def __getattr__(name: str):
+    # Backwards compatible access to the lazily created clients
+    if name == "engine":
+        return get_engine()
+    if name == "redis_client":
+        return get_redis()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
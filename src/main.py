@@ -1,22 +1,38 @@
-from fastapi import FastAPI, Depends, HTTPException, status
-from fastapi.middleware.cors import CORSMiddleware
-from fastapi.middleware.trustedhost import TrustedHostMiddleware
-from fastapi.middleware.gzip import GZipMiddleware
-from fastapi.security import HTTPBearer
-from contextlib import asynccontextmanager
-from sqlalchemy.orm import Session
-from redis import Redis
-from typing import Optional
-import time
-
-from src.database import engine, Base, get_db, get_redis
-from src.config import settings
-from src.api.v1 import tasks, users
-# from src.utils.security import get_current_user
-from src.models.user import User
-
-# Create database tables
-Base.metadata.create_all(bind=engine)
+from src.utils.startup import startup_timer, FirstRequestMiddleware
+
+with startup_timer.phase("import:framework"):
+    from fastapi import FastAPI, Depends, HTTPException, status
+    from fastapi.middleware.cors import CORSMiddleware
+    from fastapi.middleware.trustedhost import TrustedHostMiddleware
+    from fastapi.middleware.gzip import GZipMiddleware
+    from fastapi.responses import JSONResponse
+    from fastapi.security import HTTPBearer
+    from contextlib import asynccontextmanager
+    from sqlalchemy.orm import Session
+    from redis import Redis
+    from typing import Optional
+    import asyncio
+    import time
+
+with startup_timer.phase("import:application"):
+    from src.database import Base, get_engine, get_db, get_redis
+    from src.config import settings
+    from src.api.v1 import tasks, users, stats, dependencies, admin, batch
+    from src.services.stats_service import run_stats_reconciliation
+    from src.services.task_service import run_lease_reclaim, run_change_log_pruning
+    from src.services.write_coalescer import get_write_coalescer
+    from src.services.task_events import get_event_hub
+    from src.services.cache_warmup import get_cache_warmer
+    from src.crud.cache import CacheManager
+    from src.crud.shard import get_shard_router
+    from src.utils.metrics import metrics
+    from src.utils.tracing import tracer, TracingMiddleware
+    from src.utils.profiling import ProfilingMiddleware, get_continuous_profiler
+    # from src.utils.security import get_current_user
+    from src.models.user import User
+
+# Schema changes are applied with `alembic upgrade head` (or `python -m src.cli
+# init-db` for a scratch database), never as a side effect of importing the app.
 
 
 @asynccontextmanager
@@ -26,14 +42,53 @@ async def lifespan(app: FastAPI):
     """
     # Startup
     print("Starting up...")
-    # Initialize database if needed
-    # Perform any other startup operations
+    # Clients are created here rather than at import time; neither call
+    # opens a connection, the pools connect on first use
+    with startup_timer.phase("init:database"):
+        get_engine()
+        shard_router = get_shard_router()
+        if settings.create_tables_on_startup:
+            await asyncio.to_thread(Base.metadata.create_all, bind=get_engine())
+            if shard_router:
+                await asyncio.to_thread(shard_router.create_all)
+        if shard_router:
+            # Tasks of a former single database keep their ids
+            await asyncio.to_thread(shard_router.reserve_existing_ids)
+    with startup_timer.phase("init:redis"):
+        get_redis()
+
+    background = []
+    with startup_timer.phase("init:background"):
+        if settings.cache_warmup_enabled:
+            warmer = get_cache_warmer()
+            CacheManager.add_invalidation_listener(warmer.schedule)
+            background.append(asyncio.create_task(asyncio.to_thread(warmer.start)))
+        if settings.stats_reconcile_interval > 0:
+            background.append(asyncio.create_task(
+                run_stats_reconciliation(settings.stats_reconcile_interval)
+            ))
+        if settings.lease_reclaim_interval > 0:
+            background.append(asyncio.create_task(run_lease_reclaim(settings.lease_reclaim_interval)))
+        if settings.change_log_prune_interval > 0:
+            background.append(asyncio.create_task(run_change_log_pruning(settings.change_log_prune_interval)))
+        if settings.profile_continuous_interval_ms > 0:
+            get_continuous_profiler().start()
+    startup_timer.mark_ready()
 
     yield
 
     # Shutdown
     print("Shutting down...")
     # Cleanup operations
+    for job in background:
+        job.cancel()
+    get_write_coalescer().close()
+    if settings.cache_warmup_enabled:
+        get_cache_warmer().close()
+    await get_event_hub().close()
+    tracer.close()
+    if settings.profile_continuous_interval_ms > 0:
+        get_continuous_profiler().close()
 
 
 app = FastAPI(
@@ -60,7 +115,14 @@ app.add_middleware(
     allowed_hosts=["*"]  # In production, specify actual hosts
 )
 
-app.add_middleware(GZipMiddleware, minimum_size=1000)
+# Cached list pages arrive already encoded (Content-Encoding set) and are
+# passed through; gzip only runs for the remaining responses
+app.add_middleware(GZipMiddleware, minimum_size=settings.response_compress_min_size)
+# Inside tracing, so a traced request's profile is stored under its trace id
+app.add_middleware(ProfilingMiddleware, redis_factory=get_redis, is_admin_token=users.is_admin_token)
+if settings.trace_exporter:
+    app.add_middleware(TracingMiddleware)
+app.add_middleware(FirstRequestMiddleware)
 
 
 # Rate limiting middleware
@@ -92,6 +154,10 @@ async def rate_limit_middleware(request, call_next):
 
 app.include_router(users.router, prefix="/api/v1")
 app.include_router(tasks.router, prefix="/api/v1")
+app.include_router(stats.router, prefix="/api/v1")
+app.include_router(dependencies.router, prefix="/api/v1")
+app.include_router(admin.router, prefix="/api/v1")
+app.include_router(batch.router, prefix="/api/v1")
 
 
 @app.get("/")
@@ -106,7 +172,7 @@ async def root():
 
 
 @app.get("/api/status")
-async def status():
+async def api_status():
     """API status endpoint."""
     return {
         "status": "operational",
@@ -115,18 +181,38 @@ async def status():
     }
 
 
+@app.get("/api/status/startup")
+async def startup_status():
+    """Per-phase startup cost and time to the first served request."""
+    return startup_timer.report(settings.startup_target_ms)
+
+
+@app.get("/api/metrics")
+async def get_metrics():
+    """Process-local metrics (cache hit rates, warm-up timings, ...)."""
+    return metrics.snapshot()
+
+
 # Error handlers
 @app.exception_handler(HTTPException)
 async def http_exception_handler(request, exc):
-    return {
-        "error": exc.detail,
-        "status_code": exc.status_code
-    }
+    return JSONResponse(
+        status_code=exc.status_code,
+        content={
+            "error": exc.detail,
+            "detail": exc.detail,
+            "status_code": exc.status_code
+        },
+        headers=getattr(exc, "headers", None)
+    )
 
 
 @app.exception_handler(Exception)
 async def general_exception_handler(request, exc):
-    return {
-        "error": "Internal server error",
-        "status_code": status.HTTP_500_INTERNAL_SERVER_ERROR
-    }
\ No newline at end of file
+    return JSONResponse(
+        status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+        content={
+            "error": "Internal server error",
+            "status_code": status.HTTP_500_INTERNAL_SERVER_ERROR
+        }
+    )
\ No newline at end of file
@@ -1,4 +1,7 @@
-from sqlalchemy import Column, Integer, String, Text, Enum, DateTime, JSON, ForeignKey, CheckConstraint
+from sqlalchemy import (
+    Column, Integer, BigInteger, Boolean, String, Text, Enum, DateTime, JSON, ForeignKey,
+    CheckConstraint, UniqueConstraint, Index
+)
 from sqlalchemy.sql import func
 from sqlalchemy.orm import relationship
 from src.database import Base
@@ -36,8 +39,18 @@ class Task(Base):
         index=True
     )
     tags = Column(JSON, nullable=True, default=list)
+    # Number of dependencies not completed yet, maintained by TaskCRUD
+    pending_dependency_count = Column(Integer, nullable=False, default=0, server_default="0")
+    # Work queue lease, set by POST /tasks/claim while the task is in progress
+    lease_owner = Column(String(64), nullable=True)
+    lease_expires_at = Column(DateTime(timezone=True), nullable=True)
+    # Incremented by every write, compared by conditional updates (If-Match)
+    version = Column(Integer, nullable=False, default=1, server_default="1")
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     updated_at = Column(DateTime(timezone=True), onupdate=func.now())
+    # Set by the transition to completed, cleared by reopening; edits of a
+    # completed task leave it alone (completions per day are counted by it)
+    completed_at = Column(DateTime(timezone=True), nullable=True)
 
     # Foreign keys
     user_id = Column(Integer, ForeignKey("users.id"), nullable=True)
@@ -55,6 +68,24 @@ class Task(Base):
         back_populates="depends_on_task"
     )
 
+    __table_args__ = (
+        # Serves the ready (count = 0, not completed) and blocked (count > 0) lookups
+        Index("ix_tasks_pending_dependencies", "pending_dependency_count", "status"),
+        # A user's task list in the default order (newest first) is a range of this index
+        Index("ix_tasks_user_created", "user_id", "created_at", "id"),
+        # A user's expired leases, reclaimed before new work is handed out
+        Index("ix_tasks_lease_expires", "user_id", "status", "lease_expires_at"),
+    )
+
+
+# Claim order: a user's ready tasks by priority (MySQL and PostgreSQL sort
+# enums in declaration order), oldest first. Served from the index, so a claim
+# with SKIP LOCKED stops after n unlocked rows instead of locking every candidate.
+Index(
+    "ix_tasks_claim",
+    Task.user_id, Task.status, Task.pending_dependency_count, Task.priority.desc(), Task.id
+)
+
 
 class TaskDependency(Base):
     __tablename__ = "task_dependencies"
@@ -72,5 +103,49 @@ class TaskDependency(Base):
         # Ensure a task cannot depend on itself
         CheckConstraint('task_id != depends_on_id', name='no_self_dependency'),
         # Ensure no duplicate dependencies
-        CheckConstraint('(task_id, depends_on_id) in (select task_id, depends_on_id from task_dependencies)', name='unique_dependency')
-    )
\ No newline at end of file
+        UniqueConstraint('task_id', 'depends_on_id', name='unique_dependency')
+    )
+
+
+class TaskChange(Base):
+    """
+    Append-only log of task writes, read by GET /tasks/changes.
+
+    Written in the transaction of the change; deletes leave a row with
+    deleted set, so clients learn about them. No foreign key, entries
+    outlive their task until pruned after change_log_retention_days.
+    """
+    __tablename__ = "task_changes"
+
+    seq = Column(BigInteger().with_variant(Integer, "sqlite"), primary_key=True, autoincrement=True)
+    task_id = Column(Integer, nullable=False)
+    user_id = Column(Integer, nullable=True)
+    deleted = Column(Boolean, nullable=False, default=False)
+    changed_at = Column(DateTime(timezone=True), nullable=False)
+
+    __table_args__ = (
+        # A user's changes after a sequence number
+        Index("ix_task_changes_user_seq", "user_id", "seq"),
+        # Newest settled entry and pruning
+        Index("ix_task_changes_changed_at", "changed_at", "seq"),
+        # Never reuse sequence numbers of pruned entries
+        {"sqlite_autoincrement": True},
+    )
+
+
+class TaskIdSequence(Base):
+    """
+    Task id allocator of a sharded deployment, kept in the main database.
+
+    Shards take their task ids from it (see src.crud.shard), so ids are unique
+    across shards and a task keeps its id when it moves to another shard.
+    Only the highest allocated id is kept.
+    """
+    __tablename__ = "task_id_sequence"
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+
+    __table_args__ = (
+        # Never hand out an id twice, even after the table was emptied
+        {"sqlite_autoincrement": True},
+    )
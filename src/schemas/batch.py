@@ -0,0 +1,36 @@
+from pydantic import BaseModel, Field, validator
+from typing import Optional, List, Dict, Any
+from src.config import settings
+
+
+class BatchOperation(BaseModel):
+    method: str = Field(..., pattern="^(GET|POST|PUT|PATCH|DELETE)$")
+    path: str = Field(..., pattern="^/api/v1/", description="Path and query string, e.g. /api/v1/tasks/?limit=20")
+    body: Optional[Any] = None
+    headers: Dict[str, str] = Field(default_factory=dict)
+
+    @validator('path')
+    def validate_path(cls, v):
+        route = v.partition("?")[0].rstrip("/")
+        if route == "/api/v1/batch":
+            raise ValueError("Batches can't be nested")
+        if "/stream" in route:
+            raise ValueError("Streaming endpoints can't be batched")
+        return v
+
+
+class BatchRequest(BaseModel):
+    requests: List[BatchOperation] = Field(..., min_length=1, max_length=settings.batch_max_requests)
+    # All or nothing: run in one transaction, rolled back at the first failed request
+    atomic: bool = False
+
+
+class BatchOperationResult(BaseModel):
+    status: int
+    headers: Dict[str, str]
+    body: Any = None
+
+
+class BatchResponse(BaseModel):
+    responses: List[BatchOperationResult]
+    committed: bool  # False once an atomic batch was rolled back
@@ -0,0 +1,10 @@
+from pydantic import BaseModel
+from typing import Dict
+
+
+class TaskStatsResponse(BaseModel):
+    scope: str
+    total: int
+    by_status: Dict[str, int]
+    by_priority: Dict[str, int]
+    completions_per_day: Dict[str, int]
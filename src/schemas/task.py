@@ -26,6 +26,8 @@ class TaskCreate(TaskBase):
 
 
 class TaskUpdate(BaseModel):
+    # Apply the update only if the task is still at this version (like If-Match)
+    version: Optional[int] = Field(None, ge=1)
     title: Optional[str] = Field(None, min_length=1, max_length=255)
     description: Optional[str] = None
     status: Optional[TaskStatus] = None
@@ -38,6 +40,7 @@ class TaskInDB(TaskBase):
     created_at: datetime
     updated_at: Optional[datetime]
     user_id: Optional[int]
+    version: int = 1
 
     class Config:
         from_attributes = True
@@ -56,6 +59,42 @@ class TaskListResponse(BaseModel):
     total_pages: int
 
 
+# Fields selectable with ?fields= (description_preview is a truncated description)
+TASK_FIELDS = [
+    "id", "title", "description", "description_preview", "status", "priority",
+    "tags", "created_at", "updated_at", "user_id", "version"
+]
+
+
+class TaskPartial(BaseModel):
+    """Sparse task representation, only the requested fields are set"""
+    id: int
+    title: Optional[str] = None
+    description: Optional[str] = None
+    description_preview: Optional[str] = None
+    status: Optional[TaskStatus] = None
+    priority: Optional[TaskPriority] = None
+    tags: Optional[List[str]] = None
+    created_at: Optional[datetime] = None
+    updated_at: Optional[datetime] = None
+    user_id: Optional[int] = None
+    version: Optional[int] = None
+
+
+class TaskPartialListResponse(BaseModel):
+    tasks: List[TaskPartial]
+    total: int
+    page: int
+    page_size: int
+    total_pages: int
+
+
+class TaskLookupResponse(BaseModel):
+    """Tasks in the requested order; ids that don't exist (or aren't the user's) under missing"""
+    tasks: List[TaskInDB]
+    missing: List[int]
+
+
 class TaskDependencyCreate(BaseModel):
     depends_on_id: int
 
@@ -70,5 +109,70 @@ class TaskDependencyResponse(BaseModel):
         from_attributes = True
 
 
+class TaskDependencyEdge(BaseModel):
+    """task_id depends on depends_on_id"""
+    task_id: int
+    depends_on_id: int
+
+
+class DependencyBatchRequest(BaseModel):
+    """Removals are applied before additions; an edge in both ends up present"""
+    add: List[TaskDependencyEdge] = Field(default_factory=list, max_length=10000)
+    remove: List[TaskDependencyEdge] = Field(default_factory=list, max_length=10000)
+
+
+class DependencyBatchResponse(BaseModel):
+    added: List[TaskDependencyEdge]
+    removed: List[TaskDependencyEdge]
+
+
+class DependencyGraphNode(TaskInDB):
+    depth: int
+
+
+class DependencyGraphResponse(BaseModel):
+    """Dependencies of a task as a DAG: each reachable task appears once in nodes"""
+    root: int
+    nodes: List[DependencyGraphNode]
+    edges: List[TaskDependencyEdge]
+
+
+class TaskSuggestion(BaseModel):
+    id: int
+    title: str
+    tags: List[str]
+    priority: TaskPriority
+
+
+class TaskChangesResponse(BaseModel):
+    changed: List[TaskInDB]
+    deleted: List[int]
+    next_token: str
+    has_more: bool
+
+
+class TaskClaimRequest(BaseModel):
+    worker_id: str = Field(..., min_length=1, max_length=64)
+    lease_seconds: Optional[int] = Field(None, ge=1, description="Defaults to TASK_LEASE_SECONDS")
+
+
+class TaskClaimResponse(BaseModel):
+    """Claimed tasks are in_progress and leased to worker_id until lease_expires_at"""
+    worker_id: str
+    lease_expires_at: datetime
+    tasks: List[TaskInDB]
+
+
+class TaskHeartbeatRequest(BaseModel):
+    worker_id: str = Field(..., min_length=1, max_length=64)
+    lease_seconds: Optional[int] = Field(None, ge=1)
+
+
+class TaskLeaseResponse(BaseModel):
+    task_id: int
+    worker_id: str
+    lease_expires_at: datetime
+
+
 # Update forward reference
 TaskWithDependencies.update_forward_refs()
\ No newline at end of file
@@ -0,0 +1,244 @@
+from sqlalchemy.orm import Session
+from typing import List, Optional, Dict, Any, Set, Callable
+from src.config import settings
+from src.database import new_session, get_redis, get_redis_raw
+from src.crud.cache import CacheManager
+from src.crud.shard import ShardTransaction, get_shard_router
+from src.schemas.batch import BatchOperation, BatchOperationResult, BatchResponse
+from src.utils.metrics import metrics
+import asyncio
+import json
+import logging
+import re
+import time
+
+logger = logging.getLogger(__name__)
+
+TASK_PATH = re.compile(r"^/api/v1/tasks/(\d+)")
+# Headers of the batch request every sub-request inherits
+INHERITED_HEADERS = (b"authorization",)
+
+
+class BatchExecutor:
+    """
+    Runs the sub-requests of POST /batch through the application in-process.
+
+    Each sub-request goes through the normal routing, dependencies and
+    exception handlers. Writes run one after the other in the batch's
+    session; runs of consecutive GETs run concurrently, each in a worker
+    thread with its own session. An atomic batch runs everything in order
+    in one transaction (CRUD commits become savepoints) and rolls it back
+    at the first failed sub-request; its sub-requests bypass the cache, and
+    the caches of the tasks it touched are dropped again once it committed.
+    Their other Redis writes (stats counters, change events, suggest index)
+    are held back in after_commit and run only if the batch committed.
+    With sharding that transaction is on the shard of the first task
+    request, requests for another shard fail (see ShardTransaction).
+    """
+
+    def __init__(self, app, scope: Dict[str, Any]):
+        self.app = app
+        self.parent = scope
+        self.deadline = time.monotonic() + settings.batch_timeout_seconds
+        self.atomic = False
+        self.transaction: Optional[ShardTransaction] = None
+        self.after_commit: Optional[List[Callable[[], Any]]] = None
+
+    def _scope(self, operation: BatchOperation, db: Optional[Session], body: bytes) -> Dict[str, Any]:
+        path, _, query = operation.path.partition("?")
+        headers = [(name.lower().encode("latin-1"), value.encode("latin-1")) for name, value in operation.headers.items()]
+        own = {name for name, _ in headers}
+        headers += [
+            (name, value) for name, value in self.parent["headers"]
+            if name in INHERITED_HEADERS and name not in own
+        ]
+        if body:
+            headers += [(b"content-type", b"application/json"), (b"content-length", str(len(body)).encode())]
+        return {
+            "type": "http",
+            "asgi": {"version": "3.0"},
+            "http_version": "1.1",
+            "method": operation.method,
+            "scheme": self.parent.get("scheme", "http"),
+            "server": self.parent.get("server"),
+            "client": self.parent.get("client"),
+            "root_path": "",
+            "path": path,
+            "raw_path": path.encode(),
+            "query_string": query.encode(),
+            "headers": headers,
+            "db_session": db,
+            "shard_transaction": self.transaction,
+            "after_commit": self.after_commit,
+            "cache_bypass": self.atomic
+        }
+
+    async def _dispatch(self, operation: BatchOperation, db: Optional[Session]) -> BatchOperationResult:
+        body = json.dumps(operation.body).encode() if operation.body is not None else b""
+        request_sent = False
+        started: Dict[str, Any] = {}
+        chunks: List[bytes] = []
+
+        async def receive():
+            nonlocal request_sent
+            if request_sent:
+                return {"type": "http.disconnect"}
+            request_sent = True
+            return {"type": "http.request", "body": body, "more_body": False}
+
+        async def send(message):
+            if message["type"] == "http.response.start":
+                started.update(message)
+            elif message["type"] == "http.response.body":
+                chunks.append(message.get("body", b""))
+
+        try:
+            await self.app(self._scope(operation, db, body), receive, send)
+        except Exception:
+            # Unhandled errors are re-raised after the 500 response was sent
+            if "status" not in started:
+                raise
+
+        headers = {
+            name.decode("latin-1"): value.decode("latin-1")
+            for name, value in started.get("headers", []) if name != b"content-length"
+        }
+        content = b"".join(chunks)
+        if not content:
+            payload = None
+        elif headers.get("content-type", "").startswith("application/json"):
+            payload = json.loads(content)
+        else:
+            payload = content.decode("utf-8", errors="replace")
+        return BatchOperationResult(status=started.get("status", 500), headers=headers, body=payload)
+
+    def _dispatch_in_thread(self, operation: BatchOperation) -> BatchOperationResult:
+        return asyncio.run(self._dispatch(operation, None))
+
+    def _remaining(self) -> float:
+        return max(0.0, self.deadline - time.monotonic())
+
+    @staticmethod
+    def _failed(status_code: int, detail: str) -> BatchOperationResult:
+        return BatchOperationResult(status=status_code, headers={}, body={"detail": detail})
+
+    async def run(self, operations: List[BatchOperation], atomic: bool = False) -> BatchResponse:
+        metrics.inc("batch_requests")
+        metrics.inc("batch_operations", len(operations))
+        if atomic:
+            self.atomic = True
+            return await self._run_atomic(operations)
+
+        results: List[Optional[BatchOperationResult]] = [None] * len(operations)
+        db = new_session()
+        try:
+            position = 0
+            while position < len(operations) and self._remaining() > 0:
+                end = position + 1
+                if operations[position].method == "GET":
+                    while end < len(operations) and operations[end].method == "GET":
+                        end += 1
+                await self._run_group(operations, results, position, end, db)
+                position = end
+        finally:
+            db.close()
+
+        return BatchResponse(
+            responses=[result or self._failed(504, "Batch time limit exceeded") for result in results],
+            committed=True
+        )
+
+    async def _run_group(
+            self,
+            operations: List[BatchOperation],
+            results: List[Optional[BatchOperationResult]],
+            start: int,
+            end: int,
+            db: Session
+    ):
+        if end - start == 1:
+            jobs = {start: asyncio.ensure_future(self._dispatch(operations[start], db))}
+        else:
+            jobs = {
+                position: asyncio.ensure_future(asyncio.to_thread(self._dispatch_in_thread, operations[position]))
+                for position in range(start, end)
+            }
+        done, pending = await asyncio.wait(jobs.values(), timeout=self._remaining())
+        for job in pending:
+            job.cancel()
+        # A cancelled request finishes its current threadpool call first, wait
+        # for it before the session is used again
+        await asyncio.gather(*pending, return_exceptions=True)
+        if end - start == 1:
+            db.rollback()
+        for position, job in jobs.items():
+            if job in done:
+                if job.exception() is not None:
+                    logger.error("Batch sub-request failed", exc_info=job.exception())
+                    results[position] = self._failed(500, "Internal server error")
+                else:
+                    results[position] = job.result()
+
+    async def _run_atomic(self, operations: List[BatchOperation]) -> BatchResponse:
+        router = get_shard_router()
+        transaction = ShardTransaction(router)
+        if router is None:
+            # Every sub-request, authentication included, runs in the transaction
+            db = transaction.session()
+        else:
+            # Task requests join it on their shard (get_task_db), users are read as usual
+            db = None
+            self.transaction = transaction
+        self.after_commit = []
+        results: List[BatchOperationResult] = []
+        failed = False
+        try:
+            for operation in operations:
+                if failed:
+                    results.append(self._failed(424, "Not run, an earlier request of the atomic batch failed"))
+                    continue
+                try:
+                    result = await asyncio.wait_for(self._dispatch(operation, db), self._remaining())
+                except asyncio.TimeoutError:
+                    result = self._failed(504, "Batch time limit exceeded")
+                results.append(result)
+                failed = result.status >= 400
+            if failed:
+                transaction.rollback()
+            else:
+                transaction.commit()
+        finally:
+            transaction.close()
+
+        if failed:
+            metrics.inc("batch_rollbacks")
+            self._forget(operations, results)
+        else:
+            for write in self.after_commit:
+                write()
+            # Readers outside the batch may have cached the old rows between
+            # the batch's invalidations and its commit
+            CacheManager(get_redis(), get_redis_raw()).clear_tasks_cache(self._touched(operations, results))
+        return BatchResponse(responses=results, committed=not failed)
+
+    @staticmethod
+    def _touched(operations: List[BatchOperation], results: List[BatchOperationResult]) -> List[int]:
+        """Ids of the tasks the sub-requests addressed or returned"""
+        task_ids: Set[int] = set()
+        for operation, result in zip(operations, results):
+            match = TASK_PATH.match(operation.path)
+            if match:
+                task_ids.add(int(match.group(1)))
+            if isinstance(result.body, dict) and isinstance(result.body.get("id"), int):
+                task_ids.add(result.body["id"])
+        return sorted(task_ids)
+
+    @classmethod
+    def _forget(cls, operations: List[BatchOperation], results: List[BatchOperationResult]):
+        """
+        Clean up after a rolled back batch. Its stats, change event and
+        suggest index writes were held back and are dropped with
+        after_commit; its sub-requests bypassed the cache, the task caches
+        are cleared all the same.
+        """
+        CacheManager(get_redis(), get_redis_raw()).clear_tasks_cache(cls._touched(operations, results))
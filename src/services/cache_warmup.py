@@ -0,0 +1,252 @@
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Any, List, Optional, Tuple
+from src.config import settings
+from src.database import get_redis, get_redis_raw
+from src.crud.shard import get_shard_router, task_session
+from src.crud.cache import CacheManager
+from src.models.task import TaskStatus, TaskPriority
+from src.services.task_service import TaskService
+from src.utils.circuit_breaker import redis_guarded
+from src.utils.metrics import metrics
+import hashlib
+import json
+import logging
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class CountMinSketch:
+    """Approximate frequency counts in fixed memory"""
+
+    def __init__(self, width: int = 2048, depth: int = 4):
+        self.width = width
+        self.depth = depth
+        self.table = [[0] * width for _ in range(depth)]
+
+    def _indexes(self, key: str) -> List[int]:
+        digest = hashlib.blake2b(key.encode(), digest_size=4 * self.depth).digest()
+        return [
+            int.from_bytes(digest[row * 4:row * 4 + 4], "little") % self.width
+            for row in range(self.depth)
+        ]
+
+    def add(self, key: str) -> int:
+        """Count one occurrence, returns the new estimate"""
+        estimate = None
+        for row, index in enumerate(self._indexes(key)):
+            self.table[row][index] += 1
+            value = self.table[row][index]
+            estimate = value if estimate is None else min(estimate, value)
+        return estimate
+
+    def decay(self):
+        """Halve every counter so old popularity fades out"""
+        for row in self.table:
+            for index in range(self.width):
+                row[index] >>= 1
+
+
+class HotKeyTracker:
+    """Top-k most requested cache keys, estimated with a count-min sketch"""
+
+    def __init__(self, capacity: int, decay_every: int = 10000):
+        self.capacity = capacity
+        self.decay_every = decay_every
+        self.sketch = CountMinSketch()
+        self.top: Dict[str, Tuple[int, Dict[str, Any]]] = {}
+        self._seen = 0
+        self._lock = threading.Lock()
+
+    def record(self, key: str, payload: Dict[str, Any]):
+        with self._lock:
+            estimate = self.sketch.add(key)
+            self._seen += 1
+            if self._seen % self.decay_every == 0:
+                self.sketch.decay()
+                self.top = {k: (count >> 1, p) for k, (count, p) in self.top.items()}
+
+            if key in self.top or len(self.top) < self.capacity:
+                self.top[key] = (estimate, payload)
+                return
+
+            coldest = min(self.top, key=lambda k: self.top[k][0])
+            if self.top[coldest][0] < estimate:
+                del self.top[coldest]
+                self.top[key] = (estimate, payload)
+
+    def hottest(self) -> List[Tuple[str, Dict[str, Any]]]:
+        with self._lock:
+            ranked = sorted(self.top.items(), key=lambda item: item[1][0], reverse=True)
+        return [(key, payload) for key, (_, payload) in ranked]
+
+    def dump(self) -> List[Dict[str, Any]]:
+        with self._lock:
+            return [
+                {"key": key, "count": count, "payload": payload}
+                for key, (count, payload) in self.top.items()
+            ]
+
+    def load(self, entries: List[Dict[str, Any]]):
+        with self._lock:
+            for entry in entries:
+                self.top.setdefault(entry["key"], (entry["count"], entry["payload"]))
+
+
+class CacheWarmer:
+    """
+    Re-populates the hottest task: and tasks: cache entries, list pages
+    down to their finished tasks:resp responses.
+
+    Warm-ups run in a small thread pool (the concurrency cap) at startup and
+    shortly after cache invalidations, at most one every min_interval
+    seconds; invalidations in between collapse into one follow-up run.
+    """
+
+    STATE_KEY = "cache_warmup:hot"
+
+    def __init__(
+            self,
+            capacity: int,
+            concurrency: int,
+            delay: float,
+            min_interval: float = 0.0,
+            hit_rate_window: int = 1000
+    ):
+        self.tracker = HotKeyTracker(capacity)
+        self.concurrency = concurrency
+        self.delay = delay
+        self.min_interval = min_interval
+        self.hit_rate_window = hit_rate_window
+        self._lock = threading.Lock()
+        self._timer: Optional[threading.Timer] = None
+        self._running = False
+        self._rerun = False
+        self._last_started = float("-inf")
+        self._window_hits = 0
+        self._window_lookups = 0
+
+    def record_task(self, task_id: int, hit: bool):
+        self.tracker.record(f"task:{task_id}", {"task_id": task_id})
+        self._record_lookup(hit)
+
+    def record_query(self, cache_key: str, params: Dict[str, Any], hit: bool):
+        self.tracker.record(cache_key, {"query": params})
+        self._record_lookup(hit)
+
+    def _record_lookup(self, hit: bool):
+        metrics.inc("cache_hits" if hit else "cache_misses")
+        with self._lock:
+            if self._window_lookups >= self.hit_rate_window:
+                return
+            self._window_lookups += 1
+            self._window_hits += hit
+            metrics.set("cache_warmup_hit_rate", self._window_hits / self._window_lookups)
+
+    def start(self):
+        """Restore the hot set saved by the previous process and warm it"""
+        try:
+            self.load()
+        except Exception:
+            logger.exception("Failed to load the saved hot cache entries")
+        self.schedule()
+
+    def schedule(self):
+        """Warm the cache after a short delay and min_interval after the last warm-up"""
+        with self._lock:
+            if self._running:
+                self._rerun = True
+                return
+            if self._timer is None:
+                delay = max(self.delay, self._last_started + self.min_interval - time.monotonic())
+                self._timer = threading.Timer(delay, self.warm)
+                self._timer.daemon = True
+                self._timer.start()
+
+    def warm(self) -> int:
+        """Warm every hot key, returns the number of entries processed"""
+        with self._lock:
+            self._timer = None
+            if self._running:
+                self._rerun = True
+                return 0
+            self._running = True
+            self._last_started = time.monotonic()
+
+        try:
+            started = time.perf_counter()
+            hot = self.tracker.hottest()
+            with ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix="cache-warmup") as pool:
+                results = list(pool.map(self._warm_one, [payload for _, payload in hot]))
+            elapsed = time.perf_counter() - started
+
+            metrics.observe("cache_warmup_seconds", elapsed)
+            metrics.inc("cache_warmup_keys", sum(results))
+            logger.info("Warmed %d/%d hot cache entries in %.3fs", sum(results), len(hot), elapsed)
+
+            # Hit rate over the next window of lookups shows what the warm-up brought back
+            with self._lock:
+                self._window_hits = 0
+                self._window_lookups = 0
+            self.save()
+            return len(hot)
+        finally:
+            with self._lock:
+                self._running = False
+                rerun, self._rerun = self._rerun, False
+            if rerun:
+                self.schedule()
+
+    @staticmethod
+    def _warm_one(payload: Dict[str, Any]) -> bool:
+        try:
+            # Entries aren't tied to a user's shard, with sharding every shard is read
+            with task_session() as db:
+                service = TaskService(db, CacheManager(get_redis(), get_redis_raw()), shards=get_shard_router())
+                if "task_id" in payload:
+                    return service.get_task_json(payload["task_id"]) is not None
+
+                params = dict(payload["query"])
+                filters = dict(params.pop("filters") or {})
+                if "status" in filters:
+                    filters["status"] = TaskStatus(filters["status"])
+                if "priority" in filters:
+                    filters["priority"] = TaskPriority(filters["priority"])
+                # Lists are served from tasks:resp, which also fills tasks:ids and task:
+                service.get_tasks_encoded(None, filters=filters, **params)
+                return True
+        except Exception:
+            logger.exception("Failed to warm cache entry %s", payload)
+            return False
+
+    @redis_guarded()
+    def save(self):
+        get_redis().set(self.STATE_KEY, json.dumps(self.tracker.dump(), default=str))
+
+    @redis_guarded()
+    def load(self):
+        state = get_redis().get(self.STATE_KEY)
+        if state:
+            self.tracker.load(json.loads(state))
+
+    def close(self):
+        with self._lock:
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+
+
+_cache_warmer: Optional[CacheWarmer] = None
+
+
+def get_cache_warmer() -> CacheWarmer:
+    global _cache_warmer
+    if _cache_warmer is None:
+        _cache_warmer = CacheWarmer(
+            capacity=settings.cache_warmup_keys,
+            concurrency=settings.cache_warmup_concurrency,
+            delay=settings.cache_warmup_delay_ms / 1000,
+            min_interval=settings.cache_warmup_min_interval_ms / 1000
+        )
+    return _cache_warmer
@@ -0,0 +1,46 @@
+from sqlalchemy.orm import Session
+from typing import Optional
+from datetime import date, timedelta
+from src.crud.stats import TaskStats
+from src.schemas.stats import TaskStatsResponse
+from src.crud.shard import task_sessions
+from src.database import get_redis
+import asyncio
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class StatsService:
+    def __init__(self, db: Session, stats: TaskStats):
+        self.db = db
+        self.stats = stats
+
+    def get_stats(self, user_id: Optional[int] = None, days: Optional[int] = None) -> Optional[TaskStatsResponse]:
+        """Dashboard counters, None while Redis (where they are kept) is unavailable"""
+        data = self.stats.get(user_id)
+        if data is None:
+            return None
+        if days:
+            since = (date.today() - timedelta(days=days - 1)).isoformat()
+            data["completions_per_day"] = {
+                day: count for day, count in data["completions_per_day"].items() if day >= since
+            }
+        return TaskStatsResponse(**data)
+
+
+def reconcile_stats() -> int:
+    """Rebuild the dashboard counters with dedicated sessions, from every shard"""
+    with task_sessions() as dbs:
+        return TaskStats(get_redis()).reconcile(*dbs)
+
+
+async def run_stats_reconciliation(interval: int):
+    """Background job correcting counter drift every interval seconds"""
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            written = await asyncio.to_thread(reconcile_stats)
+            logger.info("Reconciled %d task stats hashes", written)
+        except Exception:
+            logger.exception("Task stats reconciliation failed")
@@ -0,0 +1,253 @@
+from redis import Redis
+from typing import Optional, Dict, Any, List, Set, Tuple, AsyncIterator
+from src.config import settings
+from src.utils.circuit_breaker import redis_guarded
+import asyncio
+import json
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class TaskEvent:
+    def __init__(self, event_id: str, fields: Dict[str, str]):
+        self.id = event_id
+        self.type = fields.get("type", "")
+        self.task_id = int(fields["task_id"]) if fields.get("task_id") else None
+        self.user_id = int(fields["user_id"]) if fields.get("user_id") else None
+        self.status = fields.get("status") or None
+        self.tags = json.loads(fields.get("tags") or "[]")
+        self.data = json.loads(fields.get("data") or "{}")
+
+    @staticmethod
+    def sort_key(event_id: str) -> Tuple[int, int]:
+        millis, _, sequence = event_id.partition("-")
+        return int(millis), int(sequence or 0)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {"id": self.id, "type": self.type, "data": self.data}
+
+    def to_sse(self) -> str:
+        message = f"event: {self.type}\ndata: {json.dumps(self.data)}\n\n"
+        return f"id: {self.id}\n{message}" if self.id else message
+
+
+class TaskEventPublisher:
+    """Appends task change events to the Redis Stream feeding the change feed"""
+
+    def __init__(self, redis_client: Redis):
+        self.redis = redis_client
+
+    @redis_guarded()
+    def publish(
+            self,
+            event_type: str,
+            data: Dict[str, Any],
+            task_id: Optional[int] = None,
+            user_id: Optional[int] = None,
+            status: Optional[Any] = None,
+            tags: Optional[List[str]] = None
+    ):
+        fields = {
+            "type": event_type,
+            "task_id": "" if task_id is None else task_id,
+            "user_id": "" if user_id is None else user_id,
+            "status": getattr(status, "value", status) or "",
+            "tags": json.dumps(tags or []),
+            "data": json.dumps(data, default=str)
+        }
+        self.redis.xadd(
+            settings.event_stream_key,
+            fields,
+            maxlen=settings.event_stream_maxlen,
+            approximate=True
+        )
+
+    def task_changed(self, event_type: str, task: Dict[str, Any]):
+        self.publish(
+            event_type,
+            task,
+            task_id=task["id"],
+            user_id=task["user_id"],
+            status=task.get("status"),
+            tags=task.get("tags")
+        )
+
+
+class Subscription:
+    """A subscriber's filters and bounded queue of pending events"""
+
+    LAGGED = object()
+
+    def __init__(
+            self,
+            user_id: Optional[int] = None,
+            status: Optional[str] = None,
+            tags: Optional[List[str]] = None,
+            queue_size: int = 1000
+    ):
+        self.user_id = user_id
+        self.status = status
+        self.tags = set(tags or [])
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=queue_size)
+
+    def matches(self, event: TaskEvent) -> bool:
+        if self.user_id is not None and event.user_id != self.user_id:
+            return False
+        if self.status and event.status != self.status:
+            return False
+        if self.tags and not self.tags.intersection(event.tags):
+            return False
+        return True
+
+    def offer(self, event: TaskEvent) -> bool:
+        """Queue a matching event, returns False if the subscriber fell behind"""
+        if not self.matches(event):
+            return True
+        try:
+            self.queue.put_nowait(event)
+            return True
+        except asyncio.QueueFull:
+            # Drop the backlog and tell the consumer to resume from the stream
+            while not self.queue.empty():
+                self.queue.get_nowait()
+            self.queue.put_nowait(self.LAGGED)
+            return False
+
+
+class TaskEventHub:
+    """
+    Fans the task event stream out to in-process subscribers.
+
+    A single XREAD loop serves every subscriber of the worker, so an idle
+    subscriber costs one queue and one parked coroutine, not a Redis
+    connection.
+    """
+
+    def __init__(self, stream: str, queue_size: int, block_ms: int = 5000):
+        self.stream = stream
+        self.queue_size = queue_size
+        self.block_ms = block_ms
+        self._redis = None
+        self._subscribers: Set[Subscription] = set()
+        self._reader: Optional[asyncio.Task] = None
+        self._ready = asyncio.Event()
+
+    @property
+    def redis(self):
+        if self._redis is None:
+            import redis.asyncio
+
+            self._redis = redis.asyncio.Redis.from_url(settings.redis_url, decode_responses=True)
+        return self._redis
+
+    async def _subscribe(self, subscription: Subscription):
+        self._subscribers.add(subscription)
+        if self._reader is None or self._reader.done():
+            self._ready = asyncio.Event()
+            self._reader = asyncio.create_task(self._read())
+        await self._ready.wait()
+
+    def _unsubscribe(self, subscription: Subscription):
+        self._subscribers.discard(subscription)
+
+    async def _read(self):
+        try:
+            latest = await self.redis.xrevrange(self.stream, count=1)
+            last_id = latest[0][0] if latest else "0-0"
+        finally:
+            self._ready.set()
+
+        while self._subscribers:
+            try:
+                response = await self.redis.xread({self.stream: last_id}, count=500, block=self.block_ms)
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception("Reading task event stream failed")
+                await asyncio.sleep(1)
+                continue
+
+            for _, entries in response or []:
+                for entry_id, fields in entries:
+                    last_id = entry_id
+                    event = TaskEvent(entry_id, fields)
+                    for subscription in list(self._subscribers):
+                        if not subscription.offer(event):
+                            self._unsubscribe(subscription)
+
+    async def _replay(self, subscription: Subscription, last_event_id: str, limit: int) -> Optional[List[TaskEvent]]:
+        entries = await self.redis.xrange(self.stream, min=f"({last_event_id}", max="+", count=limit + 1)
+        events = [TaskEvent(entry_id, fields) for entry_id, fields in entries]
+        return [event for event in events if subscription.matches(event)] if len(events) <= limit else None
+
+    async def listen(
+            self,
+            user_id: Optional[int] = None,
+            status: Optional[str] = None,
+            tags: Optional[List[str]] = None,
+            last_event_id: Optional[str] = None,
+            keepalive: float = 15.0
+    ) -> AsyncIterator[Optional[TaskEvent]]:
+        """
+        Yield matching events, None as a keepalive tick.
+
+        Events after last_event_id are replayed from the stream first. A
+        "reset" event ends the iteration when the subscriber cannot be
+        caught up (too far behind or too slow); the client should resume
+        from the last id it received or reload its data.
+        """
+        subscription = Subscription(user_id, status, tags, self.queue_size)
+        try:
+            await self._subscribe(subscription)
+            delivered = None
+            if last_event_id:
+                replayed = await self._replay(subscription, last_event_id, settings.event_replay_limit)
+                if replayed is None:
+                    yield self._reset(last_event_id)
+                    return
+                for event in replayed:
+                    delivered = event.id
+                    yield event
+
+            while True:
+                try:
+                    event = await asyncio.wait_for(subscription.queue.get(), keepalive)
+                except asyncio.TimeoutError:
+                    yield None
+                    continue
+
+                if event is Subscription.LAGGED:
+                    yield self._reset(delivered)
+                    return
+                if delivered and TaskEvent.sort_key(event.id) <= TaskEvent.sort_key(delivered):
+                    continue
+                delivered = event.id
+                yield event
+        finally:
+            self._unsubscribe(subscription)
+
+    @staticmethod
+    def _reset(last_event_id: Optional[str]) -> TaskEvent:
+        return TaskEvent(last_event_id or "", {
+            "type": "reset",
+            "data": json.dumps({"last_event_id": last_event_id})
+        })
+
+    async def close(self):
+        self._subscribers.clear()
+        if self._reader is not None:
+            self._reader.cancel()
+        if self._redis is not None:
+            await self._redis.close()
+            self._redis = None
+
+
+_event_hub: Optional[TaskEventHub] = None
+
+
+def get_event_hub() -> TaskEventHub:
+    global _event_hub
+    if _event_hub is None:
+        _event_hub = TaskEventHub(settings.event_stream_key, settings.event_subscriber_queue_size)
+    return _event_hub
@@ -1,32 +1,168 @@
 from sqlalchemy.orm import Session
-from typing import List, Optional, Dict, Any
+from typing import List, Optional, Dict, Any, Tuple, Union, Callable, Iterable, TYPE_CHECKING
 from src.crud.task import task_crud
-from src.crud.cache import CacheManager
-from src.schemas.task import TaskCreate, TaskUpdate, TaskInDB, TaskListResponse
+from src.crud.shard import ShardRouter, ShardedTaskCRUD, task_sessions
+from src.crud.cache import CacheManager, list_namespace
+from src.crud.stats import TaskStats
+from src.crud.suggest import TaskSuggestIndex
+from src.schemas.task import (
+    TaskCreate, TaskUpdate, TaskInDB, TaskListResponse, TaskPartial, TaskPartialListResponse,
+    DependencyGraphNode, TaskDependencyEdge, DependencyGraphResponse, DependencyBatchResponse,
+    TaskClaimResponse, TaskLeaseResponse, TaskChangesResponse
+)
+from src.config import settings
+from src.database import get_redis
+from src.services.write_coalescer import get_write_coalescer
+from src.services.task_events import TaskEventPublisher
+from src.models.task import TaskStatus
+from src.utils.circuit_breaker import redis_breaker
+from src.utils.tracing import trace_methods
+from src.utils.compression import available_encodings, encode
 from redis import Redis
+from datetime import datetime, timedelta
+import asyncio
+import functools
 import hashlib
+import logging
+import orjson
+import time
 
+logger = logging.getLogger(__name__)
 
+# Cached under task:{id} for ids that don't exist
+NOT_FOUND = b""
+
+
+class ChangeTokenExpiredError(Exception):
+    """A sync token older than the change log retention, the client has to resync"""
+
+
+def change_token(seq: int, shard: Optional[str] = None) -> str:
+    """
+    Opaque sync token: the change sequence number, when the token was issued
+    and, with sharding, the shard whose change log the number belongs to
+    """
+    return f"{seq}.{int(time.time())}" + (f".{shard}" if shard else "")
+
+
+def parse_change_token(token: str, shard: Optional[str] = None) -> int:
+    seq, issued, token_shard = (token.split(".", 2) + [None])[:3]
+    try:
+        seq, issued = int(seq), int(issued)
+    except (TypeError, ValueError):
+        raise ValueError("Invalid sync token")
+    if issued < time.time() - settings.change_log_retention_days * 86400:
+        raise ChangeTokenExpiredError("Sync token expired, list the tasks again and sync from a new token")
+    if token_shard != shard:
+        # The user's tasks moved to another shard, with a change log of its own
+        raise ChangeTokenExpiredError("Tasks were moved, list the tasks again and sync from a new token")
+    return seq
+
+
+if TYPE_CHECKING:
+    from src.services.cache_warmup import CacheWarmer
+
+
+class DeferredWrites:
+    """
+    Wraps a Redis writer (stats counters, change events, suggest index) so
+    calls of the given methods are queued instead of run; the other
+    attributes are the writer's own. Arguments must not change before the
+    queue runs, pass snapshots rather than ORM objects.
+    """
+
+    def __init__(self, target: Any, methods: Iterable[str], queue: List[Callable[[], Any]]):
+        self._target = target
+        self._methods = set(methods)
+        self._queue = queue
+
+    def __getattr__(self, name: str) -> Any:
+        attribute = getattr(self._target, name)
+        if name not in self._methods:
+            return attribute
+        return lambda *args, **kwargs: self._queue.append(functools.partial(attribute, *args, **kwargs))
+
+
+@trace_methods
 class TaskService:
-    def __init__(self, db: Session, cache_manager: CacheManager):
+    def __init__(
+            self,
+            db: Session,
+            cache_manager: CacheManager,
+            stats: Optional[TaskStats] = None,
+            warmer: Optional["CacheWarmer"] = None,
+            shards: Optional[ShardRouter] = None,
+            after_commit: Optional[List[Callable[[], Any]]] = None
+    ):
         self.db = db
+        # With shards, task reads (not writes) go to every shard instead of
+        # db, for callers that aren't scoped to one user (cache warm-up)
+        self.reads = ShardedTaskCRUD(shards) if shards else task_crud
         self.cache = cache_manager
+        self.warmer = warmer
+        self.stats = stats or TaskStats(cache_manager.redis)
+        self.events = TaskEventPublisher(cache_manager.redis)
+        self.suggestions = TaskSuggestIndex(cache_manager.redis)
+        if after_commit is not None:
+            # In an atomic batch, Redis writes wait for its commit and are dropped on rollback
+            self.stats = DeferredWrites(self.stats, ("record_create", "record_change", "record_delete"), after_commit)
+            self.events = DeferredWrites(self.events, ("publish", "task_changed"), after_commit)
+            self.suggestions = DeferredWrites(self.suggestions, ("index", "remove"), after_commit)
 
-    def get_task(self, task_id: int) -> Optional[TaskInDB]:
-        # Try cache first
+    def get_task(self, task_id: int, user_id: Optional[int] = None) -> Optional[TaskInDB]:
+        loaded = self.load_task(task_id, user_id)
+        return TaskInDB(**loaded[1]) if loaded else None
+
+    def get_task_json(self, task_id: int, user_id: Optional[int] = None) -> Optional[bytes]:
+        loaded = self.load_task(task_id, user_id)
+        return loaded[0] if loaded else None
+
+    def load_task(self, task_id: int, user_id: Optional[int] = None) -> Optional[Tuple[bytes, Dict[str, Any]]]:
+        """
+        Serialized task and its fields, parsed once; a cache hit is returned
+        as stored without re-validation.
+
+        With user_id, tasks of other users are treated as missing.
+        """
+        data = self._load_task_json(task_id)
+        if data is None:
+            return None
+        task = orjson.loads(data)
+        if not self._owned(task, user_id):
+            return None
+        return data, task
+
+    @staticmethod
+    def _owned(task: Dict[str, Any], user_id: Optional[int]) -> bool:
+        return user_id is None or task["user_id"] == user_id
+
+    def _load_task_json(self, task_id: int) -> Optional[bytes]:
         cache_key = f"task:{task_id}"
-        cached_task = self.cache.get(cache_key)
-        if cached_task:
-            return TaskInDB(**cached_task)
+        cached = self.cache.get_raw(cache_key)
+        if self.warmer:
+            self.warmer.record_task(task_id, cached is not None)
+        if cached is not None:
+            return cached if cached != NOT_FOUND else None
 
         # Get from database
-        task = task_crud.get_task(self.db, task_id)
-        if task:
-            task_dict = TaskInDB.from_orm(task).dict()
-            self.cache.set(cache_key, task_dict)
-            return TaskInDB(**task_dict)
+        task = self.reads.get_task(self.db, task_id)
+        if not task:
+            self.cache.set_raw(cache_key, NOT_FOUND, settings.cache_negative_ttl)
+            return None
 
-        return None
+        data = self._dump_task(task)
+        self.cache.set_raw(cache_key, data)
+        return data
+
+    @staticmethod
+    def _dump_task(task) -> bytes:
+        """Body stored under task:{id}, shared by single task reads and list pages"""
+        return orjson.dumps(TaskInDB.from_orm(task).model_dump(mode="json"))
+
+    @classmethod
+    def project_task(cls, task: Dict[str, Any], fields: List[str]) -> TaskPartial:
+        """Project a single task loaded from get_task_json, no per-projection cache entries"""
+        return TaskPartial(**cls._project(task, fields))
 
     def get_tasks(
             self,
@@ -34,63 +170,307 @@ class TaskService:
             limit: int = 100,
             filters: Optional[Dict[str, Any]] = None,
             sort_by: Optional[str] = None,
-            sort_order: str = "asc"
-    ) -> TaskListResponse:
-        # Create cache key based on query parameters
-        cache_params = {
-            "skip": skip,
-            "limit": limit,
-            "filters": filters or {},
-            "sort_by": sort_by,
-            "sort_order": sort_order
+            sort_order: str = "asc",
+            fields: Optional[List[str]] = None
+    ) -> Union[TaskListResponse, TaskPartialListResponse]:
+        data = self.get_tasks_json(skip, limit, filters, sort_by, sort_order, fields)
+        response_model = TaskPartialListResponse if fields else TaskListResponse
+        return response_model(**orjson.loads(data))
+
+    def get_tasks_json(
+            self,
+            skip: int = 0,
+            limit: int = 100,
+            filters: Optional[Dict[str, Any]] = None,
+            sort_by: Optional[str] = None,
+            sort_order: str = "asc",
+            fields: Optional[List[str]] = None
+    ) -> bytes:
+        """
+        Serialized task list page, assembled from two cache levels.
+
+        The ordered ids of a query are cached in fixed-size windows under a
+        canonical fingerprint (tasks:ids:{namespace}:{fingerprint}:{window},
+        namespaced by the user_id filter, see list_namespace), so any page
+        size and offset is a slice of one or more windows. The page is then
+        hydrated from the task:{id} bodies with one MGET, misses are loaded
+        with one IN query and cached for the next read.
+        """
+        canonical = self._canonical_filters(filters)
+        sort_order = sort_order.lower()
+        fingerprint = self._fingerprint(canonical, sort_by, sort_order)
+        namespace = list_namespace(canonical.get("user_id"))
+
+        window = settings.list_cache_window
+        indexes = range(skip // window, (skip + limit - 1) // window + 1)
+        keys = [f"tasks:ids:{namespace}:{fingerprint}:{index}" for index in indexes]
+        cached = self.cache.mget_raw(keys)
+        self._record_query(keys[0], skip, limit, canonical, sort_by, sort_order, fields,
+                           all(data is not None for data in cached))
+
+        task_ids: List[int] = []
+        total = None
+        loaded = {}
+        for index, key, data in zip(indexes, keys, cached):
+            if data is not None:
+                entry = orjson.loads(data)
+            else:
+                if total is None:
+                    total = self.reads.get_tasks_count(self.db, filters)
+                ids = self.reads.get_task_ids(
+                    self.db, index * window, window, filters, sort_by, sort_order
+                ) if index * window < total else []
+                entry = {"ids": ids, "total": total}
+                loaded[key] = orjson.dumps(entry)
+            task_ids.extend(entry["ids"])
+            total = entry["total"] if total is None else total
+        self.cache.set_many_raw(loaded)
+
+        offset = skip - indexes[0] * window
+        page_ids = task_ids[offset:offset + limit]
+
+        meta = {
+            "total": total,
+            "page": skip // limit + 1 if limit > 0 else 1,
+            "page_size": limit,
+            "total_pages": (total + limit - 1) // limit if limit > 0 else 1
         }
-        param_hash = hashlib.md5(str(cache_params).encode()).hexdigest()
-        cache_key = f"tasks:{param_hash}"
+        if fields:
+            return orjson.dumps({"tasks": self._hydrate_projected(page_ids, fields), **meta})
+        # Cached task bodies are spliced in without being parsed
+        bodies = self._hydrate(page_ids)
+        return b'{"tasks":[' + b",".join(bodies) + b"]," + orjson.dumps(meta)[1:]
 
-        # Try cache first
-        cached = self.cache.get(cache_key)
-        if cached:
-            return TaskListResponse(**cached)
+    def get_tasks_encoded(
+            self,
+            encoding: Optional[str],
+            skip: int = 0,
+            limit: int = 100,
+            filters: Optional[Dict[str, Any]] = None,
+            sort_by: Optional[str] = None,
+            sort_order: str = "asc",
+            fields: Optional[List[str]] = None
+    ) -> Tuple[bytes, Optional[str]]:
+        """
+        get_tasks_json page in a content encoding, as (body, encoding).
 
-        # Get from database
-        tasks = task_crud.get_tasks(
-            self.db, skip, limit, filters, sort_by, sort_order
-        )
-        total = task_crud.get_tasks_count(self.db, filters)
-
-        response = TaskListResponse(
-            tasks=[TaskInDB.from_orm(task) for task in tasks],
-            total=total,
-            page=skip // limit + 1 if limit > 0 else 1,
-            page_size=limit,
-            total_pages=(total + limit - 1) // limit if limit > 0 else 1
-        )
+        The finished page is cached under tasks:resp:{namespace}:{digest} next to its
+        encodings, which are compressed once when the page is cached, so a hit
+        is returned without being assembled or compressed. Bodies below
+        response_compress_min_size are returned plain (encoding None).
+        """
+        canonical = self._canonical_filters(filters)
+        sort_order = sort_order.lower()
+        fingerprint = self._fingerprint(canonical, sort_by, sort_order)
+        namespace = list_namespace(canonical.get("user_id"))
+        digest = hashlib.sha1(orjson.dumps([fingerprint, skip, limit, fields])).hexdigest()
+        cache_key = f"tasks:resp:{namespace}:{digest}"
 
-        # Cache the result
-        self.cache.set(cache_key, response.dict())
-        return response
+        body, encoded = self.cache.get_encoded(cache_key, encoding)
+        if body is not None or encoded is not None:
+            self._record_query(f"tasks:ids:{namespace}:{fingerprint}:{skip // settings.list_cache_window}",
+                               skip, limit, canonical, sort_by, sort_order, fields, True)
+        if encoded is not None:
+            return encoded, encoding
+
+        stored = {}
+        if body is None:
+            body = self.get_tasks_json(skip, limit, filters, sort_by, sort_order, fields)
+            # A fresh page is stored in every encoding, so other clients hit too
+            if len(body) >= settings.response_compress_min_size:
+                stored = {name: encode(body, name) for name in available_encodings()}
+            self.cache.set_encoded(cache_key, body, stored)
+        elif encoding is not None and len(body) >= settings.response_compress_min_size:
+            # The encoding expired or was evicted before the plain body
+            stored = {encoding: encode(body, encoding)}
+            self.cache.set_encoded(cache_key, None, stored)
+
+        if encoding in stored:
+            return stored[encoding], encoding
+        return body, None
+
+    @staticmethod
+    def _fingerprint(canonical: Dict[str, Any], sort_by: Optional[str], sort_order: str) -> str:
+        """Key part shared by every page of a query"""
+        return hashlib.sha1(orjson.dumps(
+            {"filters": canonical, "sort_by": sort_by, "sort_order": sort_order},
+            option=orjson.OPT_SORT_KEYS
+        )).hexdigest()
+
+    def _record_query(self, cache_key: str, skip: int, limit: int, canonical: Dict[str, Any],
+                      sort_by: Optional[str], sort_order: str, fields: Optional[List[str]], hit: bool):
+        if self.warmer:
+            params = {"skip": skip, "limit": limit, "filters": canonical, "sort_by": sort_by, "sort_order": sort_order}
+            if fields:
+                params["fields"] = fields
+            self.warmer.record_query(cache_key, params, hit)
+
+    @staticmethod
+    def _canonical_filters(filters: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+        """Filters as plain JSON values, so equal queries get equal fingerprints"""
+        canonical = {}
+        for key, value in (filters or {}).items():
+            if value is None:
+                continue
+            if key == "tags":
+                value = sorted(set(value))
+            elif hasattr(value, "value"):
+                value = value.value
+            canonical[key] = value
+        return canonical
+
+    def _load_bodies(self, task_ids: List[int]) -> Dict[int, bytes]:
+        """
+        Task bodies by id: one MGET of task:{id}, one IN query for the misses.
+
+        Loaded tasks are written back in one pipeline; ids that don't exist are
+        cached as NOT_FOUND for a short while and left out of the result.
+        """
+        bodies = dict(zip(task_ids, self.cache.mget_raw([f"task:{task_id}" for task_id in task_ids])))
+        missing = [task_id for task_id, body in bodies.items() if body is None]
+        if missing:
+            loaded = {}
+            for task in self.reads.get_tasks_by_ids(self.db, missing):
+                bodies[task.id] = loaded[f"task:{task.id}"] = self._dump_task(task)
+            self.cache.set_many_raw(loaded)
+            self.cache.set_many_raw(
+                {f"task:{task_id}": NOT_FOUND for task_id in missing if bodies[task_id] is None},
+                settings.cache_negative_ttl
+            )
+        return {task_id: body for task_id, body in bodies.items() if body}
+
+    def _hydrate(self, task_ids: List[int]) -> List[bytes]:
+        """Task bodies in task_ids order, ids of tasks deleted since their window was cached are skipped"""
+        bodies = self._load_bodies(task_ids)
+        return [bodies[task_id] for task_id in task_ids if task_id in bodies]
+
+    def _hydrate_projected(self, task_ids: List[int], fields: List[str]) -> List[Dict[str, Any]]:
+        """
+        Projected tasks in task_ids order. Cached task:{id} bodies are cut down
+        in Python, misses load only the requested columns (so e.g. descriptions
+        aren't transferred for a title listing). Partial rows can't fill the
+        full task:{id} entries, misses stay uncached until a full read.
+        """
+        cached = dict(zip(task_ids, self.cache.mget_raw([f"task:{task_id}" for task_id in task_ids])))
+        tasks = {
+            task_id: self._project(orjson.loads(body), fields)
+            for task_id, body in cached.items() if body  # neither missed nor NOT_FOUND
+        }
+        missing = [task_id for task_id, body in cached.items() if body is None]
+        tasks.update(self.reads.get_tasks_projected_by_ids(
+            self.db, missing, fields, preview_length=settings.description_preview_length
+        ))
+        return [tasks[task_id] for task_id in task_ids if task_id in tasks]
+
+    def get_tasks_by_ids_json(
+            self,
+            task_ids: List[int],
+            fields: Optional[List[str]] = None,
+            user_id: Optional[int] = None
+    ) -> bytes:
+        """Serialized {"tasks": [...], "missing": [...]}, tasks in the requested order"""
+        task_ids = list(dict.fromkeys(task_ids))
+        bodies = self._load_bodies(task_ids)
+        parsed = {}
+        if user_id is not None or fields:
+            parsed = {task_id: orjson.loads(body) for task_id, body in bodies.items()}
+        if user_id is not None:
+            bodies = {task_id: body for task_id, body in bodies.items() if self._owned(parsed[task_id], user_id)}
+        found = [task_id for task_id in task_ids if task_id in bodies]
+        missing = orjson.dumps([task_id for task_id in task_ids if task_id not in bodies])
+        if fields:
+            tasks = orjson.dumps([self._project(parsed[task_id], fields) for task_id in found])
+        else:
+            tasks = b"[" + b",".join(bodies[task_id] for task_id in found) + b"]"
+        return b'{"tasks":' + tasks + b',"missing":' + missing + b"}"
+
+    @staticmethod
+    def _project(task: Dict[str, Any], fields: List[str]) -> Dict[str, Any]:
+        data = {field: task[field] for field in fields if field != "description_preview"}
+        if "description_preview" in fields:
+            description = task["description"]
+            data["description_preview"] = description[:settings.description_preview_length] \
+                if description is not None else None
+        return data
 
     def create_task(self, task_data: TaskCreate, user_id: Optional[int] = None) -> TaskInDB:
         task = task_crud.create_task(self.db, task_data, user_id)
+        self.stats.record_create(self.stats.snapshot(task))
+        self.suggestions.index(TaskSuggestIndex.document(task), replace=False)
 
-        # Clear task list cache
-        self.cache.clear_task_cache()
+        # Clear the owner's list caches, and a cached not-found marker for the new id
+        self.cache.clear_task_cache(task.id, owners=[task.user_id])
 
-        return TaskInDB.from_orm(task)
+        result = TaskInDB.from_orm(task)
+        self.events.task_changed("created", result.model_dump(mode="json"))
+        return result
 
-    def update_task(self, task_id: int, task_data: TaskUpdate) -> Optional[TaskInDB]:
-        task = task_crud.update_task(self.db, task_id, task_data)
+    def update_task(
+            self,
+            task_id: int,
+            task_data: TaskUpdate,
+            user_id: Optional[int] = None,
+            expected_version: Optional[int] = None
+    ) -> Optional[TaskInDB]:
+        """Update a task; with expected_version only if it is still at that version"""
+        changes = task_data.dict(exclude_unset=True)
+        with get_write_coalescer().direct_update(task_id) as superseded:
+            # previous: the status and priority the stats counters move away from
+            task, previous = task_crud.update_task(self.db, task_id, task_data, expected_version, user_id)
+            if task:
+                superseded(changes)
         if task:
-            # Clear cache for this task and task lists
-            self.cache.clear_task_cache(task_id)
-            return TaskInDB.from_orm(task)
+            if previous:
+                self.stats.record_change(self.stats.snapshot(previous), self.stats.snapshot(task))
+            if changes.keys() & {"title", "tags", "priority"}:
+                self.suggestions.index(TaskSuggestIndex.document(task))
+            # Clear cache for this task and the owner's task lists
+            self.cache.clear_task_cache(task_id, owners=[task.user_id])
+            result = TaskInDB.from_orm(task)
+            self.events.task_changed("updated", result.model_dump(mode="json"))
+            return result
         return None
 
-    def delete_task(self, task_id: int) -> bool:
+    def suggest_tasks(self, q: str, user_id: Optional[int] = None, limit: int = 10) -> List[Dict[str, Any]]:
+        """Search-as-you-type over titles and tags, from the prefix index only (empty while Redis is down)"""
+        return redis_breaker.call(lambda: self.suggestions.suggest(q, user_id, limit), [])
+
+    def submit_update(self, task_id: int, task_data: TaskUpdate, user_id: Optional[int] = None) -> Optional[TaskInDB]:
+        """
+        Validate an update and hand it to the write coalescer.
+
+        Returns the accepted state right away; the write itself is flushed
+        in a batch with other updates of the same window.
+        """
+        task = self.get_task(task_id, user_id)
+        if not task:
+            return None
+
+        update_data = task_data.dict(exclude_unset=True)
+        if update_data.get("status") == TaskStatus.COMPLETED:
+            # Dependency-gated completions are still checked synchronously
+            task_crud.check_can_complete(self.db, task_crud.get_task(self.db, task_id))
+
+        pending = get_write_coalescer().submit(task_id, update_data)
+        return task.copy(update=pending)
+
+    def delete_task(self, task_id: int, user_id: Optional[int] = None) -> bool:
+        existing = task_crud.get_task(self.db, task_id)
+        if not existing or (user_id is not None and existing.user_id != user_id):
+            return False
+        old = self.stats.snapshot(existing)
+        tags = existing.tags
+
         result = task_crud.delete_task(self.db, task_id)
         if result:
+            self.stats.record_delete(old)
+            self.suggestions.remove(task_id)
+            self.events.publish(
+                "deleted", {"id": task_id},
+                task_id=task_id, user_id=old["user_id"], status=old["status"], tags=tags
+            )
             # Clear cache
-            self.cache.clear_task_cache(task_id)
+            self.cache.clear_task_cache(task_id, owners=[old["user_id"]])
         return result
 
     def get_dependency_tree(self, task_id: int) -> Dict[str, Any]:
@@ -101,18 +481,74 @@ class TaskService:
         if cached:
             return cached
 
-        tree = task_crud.get_dependency_tree(self.db, task_id)
+        tree = self._serialize_tree(task_crud.get_dependency_tree(self.db, task_id))
 
         # Cache the result
         self.cache.set(cache_key, tree)
         return tree
 
-    def add_dependency(self, task_id: int, depends_on_id: int) -> Optional[Dict[str, Any]]:
+    @classmethod
+    def _serialize_tree(cls, tree: Dict[str, Any]) -> Dict[str, Any]:
+        if not tree:
+            return tree
+        return {
+            "task": TaskInDB.from_orm(tree["task"]).model_dump(mode="json"),
+            "dependencies": [cls._serialize_tree(dependency) for dependency in tree["dependencies"]]
+        }
+
+    def get_dependency_graph_json(self, task_id: int) -> Optional[bytes]:
+        """Serialized DependencyGraphResponse for a task, None if the task does not exist"""
+        # Under tasks: so any task or dependency change invalidates it, a graph
+        # also holds the state of every task it reaches
+        cache_key = f"tasks:graph:{task_id}"
+        cached = self.cache.get_raw(cache_key)
+        if cached is not None:
+            return cached
+
+        graph = task_crud.get_dependency_graph(self.db, task_id)
+        if not graph:
+            return None
+
+        depth = graph["depth"]
+        response = DependencyGraphResponse(
+            root=task_id,
+            nodes=[
+                DependencyGraphNode(**TaskInDB.from_orm(task).model_dump(), depth=depth[task.id])
+                for task in sorted(graph["tasks"], key=lambda task: (depth[task.id], task.id))
+            ],
+            edges=[
+                TaskDependencyEdge(task_id=dependent_id, depends_on_id=depends_on_id)
+                for dependent_id, depends_on_id in graph["edges"]
+            ]
+        )
+        data = orjson.dumps(response.model_dump(mode="json"))
+        self.cache.set_raw(cache_key, data)
+        return data
+
+    def _dependency_owners(
+            self, task_id: int, depends_on_id: int, user_id: Optional[int]
+    ) -> Optional[Dict[int, Optional[int]]]:
+        """Owner of each of both tasks, None if either is missing or (with user_id) not the user's"""
+        owners = task_crud.get_task_owners(self.db, [task_id, depends_on_id])
+        if len(owners) < len({task_id, depends_on_id}):
+            return None
+        if user_id is not None and any(owner != user_id for owner in owners.values()):
+            return None
+        return owners
+
+    def add_dependency(self, task_id: int, depends_on_id: int, user_id: Optional[int] = None) -> Optional[Dict[str, Any]]:
+        owners = self._dependency_owners(task_id, depends_on_id, user_id)
+        if owners is None:
+            return None
         dependency = task_crud.add_dependency(self.db, task_id, depends_on_id)
         if dependency:
             # Clear cache for both tasks
-            self.cache.clear_task_cache(task_id)
-            self.cache.clear_task_cache(depends_on_id)
+            self.cache.clear_tasks_cache([task_id, depends_on_id], owners=owners.values())
+            self.events.publish(
+                "dependency_added",
+                {"task_id": task_id, "depends_on_id": depends_on_id},
+                task_id=task_id, user_id=owners[task_id]
+            )
             return {
                 "id": dependency.id,
                 "task_id": dependency.task_id,
@@ -121,10 +557,179 @@ class TaskService:
             }
         return None
 
-    def remove_dependency(self, task_id: int, depends_on_id: int) -> bool:
+    def remove_dependency(self, task_id: int, depends_on_id: int, user_id: Optional[int] = None) -> bool:
+        owners = self._dependency_owners(task_id, depends_on_id, user_id)
+        if owners is None:
+            return False
         result = task_crud.remove_dependency(self.db, task_id, depends_on_id)
         if result:
             # Clear cache for both tasks
-            self.cache.clear_task_cache(task_id)
-            self.cache.clear_task_cache(depends_on_id)
-        return result
\ No newline at end of file
+            self.cache.clear_tasks_cache([task_id, depends_on_id], owners=owners.values())
+            self.events.publish(
+                "dependency_removed",
+                {"task_id": task_id, "depends_on_id": depends_on_id},
+                task_id=task_id, user_id=owners[task_id]
+            )
+        return result
+
+    def apply_dependency_batch(
+            self,
+            add: List[TaskDependencyEdge],
+            remove: List[TaskDependencyEdge],
+            user_id: Optional[int] = None
+    ) -> DependencyBatchResponse:
+        result = task_crud.apply_dependency_batch(
+            self.db,
+            [(edge.task_id, edge.depends_on_id) for edge in add],
+            [(edge.task_id, edge.depends_on_id) for edge in remove],
+            user_id
+        )
+
+        changed = result["added"] + result["removed"]
+        if changed:
+            # One invalidation for the whole batch
+            task_ids = sorted({task_id for edge in changed for task_id in edge})
+            owners = (
+                dict.fromkeys(task_ids, user_id) if user_id is not None
+                else task_crud.get_task_owners(self.db, task_ids)
+            )
+            self.cache.clear_tasks_cache(task_ids, owners=set(owners.values()))
+        for event_type, edges in (("dependency_removed", result["removed"]), ("dependency_added", result["added"])):
+            for task_id, depends_on_id in edges:
+                self.events.publish(
+                    event_type,
+                    {"task_id": task_id, "depends_on_id": depends_on_id},
+                    task_id=task_id, user_id=owners.get(task_id)
+                )
+
+        return DependencyBatchResponse(**{
+            key: [TaskDependencyEdge(task_id=task_id, depends_on_id=depends_on_id) for task_id, depends_on_id in edges]
+            for key, edges in result.items()
+        })
+
+    def claim_tasks(
+            self,
+            worker_id: str,
+            n: int,
+            lease_seconds: Optional[int] = None,
+            user_id: Optional[int] = None
+    ) -> TaskClaimResponse:
+        lease_seconds = min(lease_seconds or settings.task_lease_seconds, settings.task_lease_max_seconds)
+        tasks, reclaimed = task_crud.claim_tasks(self.db, worker_id, n, lease_seconds, user_id)
+        claimed = []
+        for task in tasks:
+            new = self.stats.snapshot(task)
+            if task.id not in reclaimed:
+                self.stats.record_change({**new, "status": TaskStatus.PENDING}, new)
+            result = TaskInDB.from_orm(task)
+            self.events.task_changed("updated", result.model_dump(mode="json"))
+            claimed.append(result)
+        if tasks:
+            self.cache.clear_tasks_cache([task.id for task in tasks], owners={task.user_id for task in tasks})
+
+        return TaskClaimResponse(
+            worker_id=worker_id,
+            lease_expires_at=tasks[0].lease_expires_at if tasks else datetime.now() + timedelta(seconds=lease_seconds),
+            tasks=claimed
+        )
+
+    def renew_lease(
+            self,
+            task_id: int,
+            worker_id: str,
+            lease_seconds: Optional[int] = None,
+            user_id: Optional[int] = None
+    ) -> Optional[TaskLeaseResponse]:
+        """
+        Heartbeat of a worker; None if it lost the lease (expired and
+        reclaimed, or completed) or the task is not user_id's
+        """
+        lease_seconds = min(lease_seconds or settings.task_lease_seconds, settings.task_lease_max_seconds)
+        expires_at = task_crud.renew_lease(self.db, task_id, worker_id, lease_seconds, user_id)
+        if expires_at is None:
+            return None
+        return TaskLeaseResponse(task_id=task_id, worker_id=worker_id, lease_expires_at=expires_at)
+
+    def get_changes(self, token: Optional[str], limit: int, user_id: Optional[int] = None) -> TaskChangesResponse:
+        """
+        Tasks created or updated and ids deleted since token, in change order.
+
+        Without a token only a starting token is returned: take it first,
+        then list the tasks, then sync from it.
+        """
+        settle = settings.change_sync_settle_seconds
+        shard = self.db.info.get("shard")
+        if token is None:
+            return TaskChangesResponse(
+                changed=[], deleted=[],
+                next_token=change_token(task_crud.complete_change_seq(self.db, 0, settle), shard),
+                has_more=False
+            )
+
+        entries, complete = task_crud.get_changes(self.db, parse_change_token(token, shard), limit, user_id, settle)
+        has_more = len(entries) == limit
+        # Only the last change of a task in this chunk matters
+        latest: Dict[int, bool] = {}
+        for entry in entries:
+            latest.pop(entry.task_id, None)
+            latest[entry.task_id] = entry.deleted
+
+        tasks = {task.id: task for task in task_crud.get_tasks_by_ids(
+            self.db, [task_id for task_id, deleted in latest.items() if not deleted]
+        )}
+        return TaskChangesResponse(
+            changed=[TaskInDB.from_orm(tasks[task_id]) for task_id in latest if task_id in tasks],
+            # Updated tasks deleted since are reported deleted right away
+            deleted=[task_id for task_id in latest if task_id not in tasks],
+            next_token=change_token(entries[-1].seq if has_more else complete, shard),
+            has_more=has_more
+        )
+
+    def release_expired_leases(self) -> int:
+        expired = task_crud.release_expired_leases(self.db)
+        for task in expired:
+            old = self.stats.snapshot(task)
+            self.stats.record_change(old, {**old, "status": TaskStatus.PENDING})
+        # Events carry the released tasks as they are now, like every other update
+        for task in task_crud.get_tasks_by_ids(self.db, [task.id for task in expired]):
+            self.events.task_changed("updated", TaskInDB.from_orm(task).model_dump(mode="json"))
+        if expired:
+            self.cache.clear_tasks_cache([task.id for task in expired], owners={task.user_id for task in expired})
+        return len(expired)
+
+
+def release_expired_leases() -> int:
+    """Sweep expired work queue leases with dedicated sessions, on every shard"""
+    with task_sessions() as dbs:
+        return sum(TaskService(db, CacheManager(get_redis())).release_expired_leases() for db in dbs)
+
+
+async def run_lease_reclaim(interval: int):
+    """Background job returning tasks of dead workers to pending every interval seconds"""
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            released = await asyncio.to_thread(release_expired_leases)
+            if released:
+                logger.info("Released %d expired task leases", released)
+        except Exception:
+            logger.exception("Expired lease sweep failed")
+
+
+def prune_change_log() -> int:
+    """Delete change log entries past the retention with dedicated sessions, on every shard"""
+    cutoff = datetime.now() - timedelta(days=settings.change_log_retention_days)
+    with task_sessions() as dbs:
+        return sum(task_crud.prune_changes(db, cutoff) for db in dbs)
+
+
+async def run_change_log_pruning(interval: int):
+    """Background job keeping the change log within change_log_retention_days"""
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            pruned = await asyncio.to_thread(prune_change_log)
+            if pruned:
+                logger.info("Pruned %d change log entries", pruned)
+        except Exception:
+            logger.exception("Change log pruning failed")
@@ -0,0 +1,223 @@
+from contextlib import contextmanager
+from typing import Dict, Any, Optional, Callable, Iterable, Iterator, Set, List, ContextManager
+from sqlalchemy.orm import Session
+from redis import Redis
+from src.crud.task import task_crud
+from src.crud.cache import CacheManager
+from src.crud.stats import TaskStats
+from src.crud.suggest import TaskSuggestIndex
+from src.services.task_events import TaskEventPublisher
+from src.config import settings
+from src.utils.metrics import metrics
+from datetime import datetime
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+
+class WriteCoalescer:
+    """
+    Buffers high-frequency field updates and flushes them in batches.
+
+    Updates to the same task within the window are merged last-write-wins,
+    then every buffered task is written with one batched UPDATE followed by
+    a single cache invalidation. A failed flush puts its updates back (newer
+    ones win) and is retried with backoff, up to max_retries times.
+
+    Direct updates run inside direct_update(), so a buffered value never
+    overwrites a direct update of the same field that committed after it.
+    With sharding a batch is written to every shard; each updates the
+    buffered tasks it holds (task ids are unique across shards).
+    """
+
+    FIELDS = {"status", "priority"}
+
+    def __init__(
+            self,
+            session_factory: Callable[[], ContextManager[List[Session]]],
+            redis_factory: Callable[[], Redis],
+            window: float,
+            max_retries: int = 5
+    ):
+        self.session_factory = session_factory
+        self.redis_factory = redis_factory
+        self.window = window
+        self.max_retries = max_retries
+        self._pending: Dict[int, Dict[str, Any]] = {}
+        self._lock = threading.Lock()
+        self._timer: Optional[threading.Timer] = None
+        self._failures = 0  # flushes failed in a row
+        # Tasks with a direct update in progress (count) and the tasks of the
+        # running flush, see direct_update()
+        self._held: Dict[int, int] = {}
+        self._flushing: Set[int] = set()
+        self._flushed = threading.Condition(self._lock)
+        self._flush_lock = threading.Lock()
+
+    def accepts(self, update_data: Dict[str, Any]) -> bool:
+        return bool(update_data) and set(update_data) <= self.FIELDS
+
+    def submit(self, task_id: int, update_data: Dict[str, Any]) -> Dict[str, Any]:
+        """Buffer an already validated update, returns all pending fields of the task"""
+        with self._lock:
+            merged = self._pending.setdefault(task_id, {})
+            merged.update(update_data)
+            self._schedule(self.window)
+            return dict(merged)
+
+    def _schedule(self, delay: float):
+        # Called with the lock held
+        if self._timer is None:
+            self._timer = threading.Timer(delay, self.flush)
+            self._timer.daemon = True
+            self._timer.start()
+
+    @contextmanager
+    def direct_update(self, task_id: int) -> Iterator[Callable[[Iterable[str]], None]]:
+        """
+        Around a direct update of task_id: waits for a flush writing the task
+        and keeps later flushes from writing it meanwhile. Call the yielded
+        function with the written fields once the update committed, their
+        buffered values are older and get dropped.
+        """
+        with self._lock:
+            while task_id in self._flushing:
+                self._flushed.wait()
+            self._held[task_id] = self._held.get(task_id, 0) + 1
+
+        def superseded(fields: Iterable[str]):
+            with self._lock:
+                pending = self._pending.get(task_id)
+                if pending is not None:
+                    for field in fields:
+                        pending.pop(field, None)
+                    if not pending:
+                        del self._pending[task_id]
+
+        try:
+            yield superseded
+        finally:
+            with self._lock:
+                self._held[task_id] -= 1
+                if not self._held[task_id]:
+                    del self._held[task_id]
+                if self._pending:
+                    self._schedule(self.window)
+
+    def flush(self) -> int:
+        """Write all buffered updates, returns the number of updated tasks"""
+        with self._flush_lock:
+            with self._lock:
+                batch = {task_id: fields for task_id, fields in self._pending.items() if task_id not in self._held}
+                for task_id in batch:
+                    del self._pending[task_id]
+                self._flushing = set(batch)
+                self._timer = None
+            try:
+                written = self._write(batch) if batch else 0
+            finally:
+                with self._lock:
+                    self._flushing = set()
+                    self._flushed.notify_all()
+                    if self._pending:
+                        # Held back tasks, or a failed batch after its backoff
+                        self._schedule(min(self.window * 2 ** self._failures, 30.0))
+            return written
+
+    def _requeue(self, batch: Dict[int, Dict[str, Any]]):
+        """Put a failed batch back behind the updates buffered since, or drop it after max_retries"""
+        with self._lock:
+            self._failures += 1
+            if self._failures > self.max_retries:
+                logger.error(
+                    "Dropping coalesced updates of tasks %s after %d failed flushes",
+                    sorted(batch), self._failures
+                )
+                metrics.inc("write_coalesce_dropped", len(batch))
+                self._failures = 0
+                return
+            for task_id, fields in batch.items():
+                self._pending[task_id] = {**fields, **self._pending.get(task_id, {})}
+
+    def _write(self, batch: Dict[int, Dict[str, Any]]) -> int:
+        previous, rejected = [], []
+        with self.session_factory() as dbs:
+            for db in dbs:
+                done = {task.id for task in previous}.union(rejected)
+                remaining = {task_id: fields for task_id, fields in batch.items() if task_id not in done}
+                try:
+                    written, blocked = task_crud.bulk_update_fields(db, remaining)
+                    previous += written
+                    rejected += blocked
+                except Exception:
+                    logger.exception("Failed to flush %d coalesced task updates, will retry", len(remaining))
+                    metrics.inc("write_coalesce_failures")
+                    db.rollback()
+                    # Updates already written to other shards stay
+                    self._requeue(remaining)
+                    break
+            else:
+                with self._lock:
+                    self._failures = 0
+        if rejected:
+            # A dependency was reopened after the completion was accepted
+            logger.warning("Dropped coalesced completions of tasks %s, they have incomplete dependencies", rejected)
+            metrics.inc("write_coalesce_rejected", len(rejected))
+        if not previous:
+            return 0
+
+        redis = self.redis_factory()
+        stats = TaskStats(redis)
+        events = TaskEventPublisher(redis)
+        suggestions = TaskSuggestIndex(redis)
+        now = datetime.now()
+        for task in previous:
+            old = stats.snapshot(task)
+            stats.record_change(old, {**old, **batch[task.id], "updated_at": now})
+            if "priority" in batch[task.id]:
+                suggestions.index({
+                    **TaskSuggestIndex.document(task),
+                    "priority": batch[task.id]["priority"],
+                    "ts": now.timestamp()
+                })
+            events.publish(
+                "updated", {"id": task.id, **batch[task.id]},
+                task_id=task.id, user_id=task.user_id,
+                status=batch[task.id].get("status", task.status), tags=task.tags
+            )
+
+        CacheManager(redis).clear_tasks_cache(
+            [task.id for task in previous], owners={task.user_id for task in previous}
+        )
+        return len(previous)
+
+    def close(self):
+        with self._lock:
+            if self._timer is not None:
+                self._timer.cancel()
+        self.flush()
+        with self._lock:
+            if self._timer is not None:
+                # Retry of a failed flush, there is no later one
+                self._timer.cancel()
+            lost = sorted(self._pending)
+        if lost:
+            logger.error("Shutting down with unwritten coalesced updates of tasks %s", lost)
+            metrics.inc("write_coalesce_dropped", len(lost))
+
+
+_write_coalescer: Optional[WriteCoalescer] = None
+
+
+def get_write_coalescer() -> WriteCoalescer:
+    global _write_coalescer
+    if _write_coalescer is None:
+        from src.database import get_redis
+        from src.crud.shard import task_sessions
+
+        _write_coalescer = WriteCoalescer(
+            task_sessions, get_redis, settings.write_coalesce_window_ms / 1000,
+            settings.write_coalesce_max_retries
+        )
+    return _write_coalescer
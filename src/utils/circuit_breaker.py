@@ -0,0 +1,114 @@
+from typing import Any, Callable, Optional
+from redis.exceptions import RedisError
+from src.config import settings
+from src.utils.metrics import metrics
+import functools
+import logging
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+CLOSED, HALF_OPEN, OPEN = "closed", "half_open", "open"
+STATE_GAUGE = {CLOSED: 0, HALF_OPEN: 1, OPEN: 2}
+
+
+class CircuitBreaker:
+    """
+    Stops calling a dependency after consecutive failures.
+
+    closed:    calls go through; failure_threshold failures in a row open it
+    open:      calls are skipped (the caller's fallback is used) until the
+               reset timeout has passed
+    half_open: one probe call goes through; success closes the breaker,
+               failure opens it again with the timeout doubled (up to
+               max_reset_timeout)
+
+    The state is exposed as the {name}_breaker_state gauge (0 closed,
+    1 half open, 2 open) next to opened/short-circuited/error counters.
+    """
+
+    def __init__(self, name: str, failure_threshold: int, reset_timeout: float, max_reset_timeout: float):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.max_reset_timeout = max_reset_timeout
+        self.state = CLOSED
+        self._failures = 0
+        self._backoff = reset_timeout
+        self._retry_at = 0.0
+        self._lock = threading.Lock()
+        metrics.set(f"{name}_breaker_state", STATE_GAUGE[CLOSED])
+
+    def _set_state(self, state: str):
+        self.state = state
+        metrics.set(f"{self.name}_breaker_state", STATE_GAUGE[state])
+
+    def allow(self) -> bool:
+        """Whether a call may go to the dependency now"""
+        with self._lock:
+            if self.state == CLOSED:
+                return True
+            if self.state == OPEN and time.monotonic() >= self._retry_at:
+                # This caller is the probe, everyone else keeps skipping
+                self._set_state(HALF_OPEN)
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self._failures = 0
+            if self.state != CLOSED:
+                logger.info("%s is back, closing the circuit breaker", self.name)
+                self._backoff = self.reset_timeout
+                self._set_state(CLOSED)
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            if self.state == HALF_OPEN:
+                self._backoff = min(self._backoff * 2, self.max_reset_timeout)
+            elif self._failures < self.failure_threshold:
+                return
+            if self.state != OPEN:
+                logger.warning("%s unavailable, opening the circuit breaker for %.1fs", self.name, self._backoff)
+                metrics.inc(f"{self.name}_breaker_opened")
+            self._retry_at = time.monotonic() + self._backoff
+            self._set_state(OPEN)
+
+    def call(self, operation: Callable[[], Any], fallback: Any = None) -> Any:
+        """Result of operation, fallback when the breaker is open or the call fails"""
+        if not self.allow():
+            metrics.inc(f"{self.name}_short_circuited")
+            return fallback
+        try:
+            result = operation()
+        except (RedisError, OSError) as e:
+            metrics.inc(f"{self.name}_errors")
+            logger.debug("%s call failed: %r", self.name, e)
+            self.record_failure()
+            return fallback
+        except Exception:
+            # Not the dependency's fault, and a probe must not stay half open
+            self.record_success()
+            raise
+        self.record_success()
+        return result
+
+
+redis_breaker = CircuitBreaker(
+    "redis",
+    failure_threshold=settings.redis_breaker_failures,
+    reset_timeout=settings.redis_breaker_reset_seconds,
+    max_reset_timeout=settings.redis_breaker_max_reset_seconds
+)
+
+
+def redis_guarded(default: Optional[Any] = None):
+    """Decorator running a best-effort Redis side effect through redis_breaker"""
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            return redis_breaker.call(lambda: func(*args, **kwargs), default)
+        return wrapper
+    return decorator
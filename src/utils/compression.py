@@ -0,0 +1,59 @@
+from typing import Callable, Dict, List, Optional
+from src.config import settings
+import gzip
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+
+# Content-Encoding name -> compressor, None when the library is not installed.
+# Levels favour speed, since bodies are compressed once per cache fill.
+ENCODERS: Dict[str, Optional[Callable[[bytes], bytes]]] = {
+    "zstd": (lambda data: zstandard.ZstdCompressor(level=3).compress(data)) if zstandard else None,
+    "br": (lambda data: brotli.compress(data, quality=5)) if brotli else None,
+    "gzip": lambda data: gzip.compress(data, compresslevel=6, mtime=0),
+}
+
+
+def available_encodings() -> List[str]:
+    """Configured response encodings that can be produced, in server preference order"""
+    return [encoding for encoding in settings.response_encodings if ENCODERS.get(encoding)]
+
+
+def negotiate(accept_encoding: Optional[str]) -> Optional[str]:
+    """
+    Available encoding with the highest q the client gives it (q > 0), server
+    preference breaking ties; None for identity
+    """
+    if not accept_encoding:
+        return None
+
+    accepted = {}
+    for part in accept_encoding.split(","):
+        name, _, params = part.partition(";")
+        quality = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                quality = float(params[2:])
+            except ValueError:
+                quality = 0.0
+        accepted[name.strip().lower()] = quality
+
+    best, best_quality = None, 0.0
+    for encoding in available_encodings():
+        quality = accepted.get(encoding, accepted.get("*", 0.0))
+        if quality > best_quality:
+            best, best_quality = encoding, quality
+    return best
+
+
+def encode(data: bytes, encoding: str) -> bytes:
+    return ENCODERS[encoding](data)
@@ -0,0 +1,301 @@
+from collections import Counter
+from typing import Dict, Any, List, Optional
+from redis import Redis
+from src.config import settings
+from src.utils.tracing import current_trace_id
+import asyncio
+import json
+import logging
+import os
+import random
+import sys
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+# Files whose functions the continuous profiler aggregates
+CONTINUOUS_FOCUS = (
+    os.path.join("src", "services", "task_service.py"),
+    os.path.join("src", "crud", "task.py"),
+)
+
+
+def frame_label(code) -> str:
+    return f"{code.co_qualname} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+def collapse(frame) -> List[str]:
+    """Labels of a frame's stack, outermost first"""
+    labels = []
+    while frame is not None:
+        labels.append(frame_label(frame.f_code))
+        frame = frame.f_back
+    labels.reverse()
+    return labels
+
+
+def to_collapsed(stacks: Dict[str, int]) -> str:
+    """Brendan Gregg's collapsed format, input of flamegraph.pl and speedscope"""
+    return "".join(f"{stack} {count}\n" for stack, count in sorted(stacks.items()))
+
+
+class SamplingProfiler:
+    """Samples the stack of one thread at a fixed interval from a helper thread"""
+
+    def __init__(self, thread_id: int, interval: float):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks: Counter = Counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="request-profiler", daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is not None:
+                self.stacks[";".join(collapse(frame))] += 1
+
+    def stop(self) -> Dict[str, int]:
+        self._stop.set()
+        self._thread.join()
+        return dict(self.stacks)
+
+
+class DeterministicProfiler:
+    """
+    Records every call of the current thread with sys.setprofile.
+
+    Weights are self time in microseconds, so the collapsed output renders as
+    a time-proportional flamegraph. Much slower than sampling, meant for
+    single requests.
+    """
+
+    def __init__(self):
+        self.stacks: Counter = Counter()
+        self._stack: List[List[Any]] = []
+
+    def start(self):
+        sys.setprofile(self._hook)
+
+    def _hook(self, frame, event, arg):
+        now = time.perf_counter()
+        if event == "call":
+            self._stack.append([frame_label(frame.f_code), now, 0.0])
+        elif event == "c_call":
+            self._stack.append([f"{getattr(arg, '__qualname__', arg)} (builtin)", now, 0.0])
+        elif self._stack and event in ("return", "c_return", "c_exception"):
+            path = ";".join(entry[0] for entry in self._stack)
+            label, started, children = self._stack.pop()
+            total = now - started
+            self.stacks[path] += int((total - children) * 1e6)
+            if self._stack:
+                self._stack[-1][2] += total
+
+    def stop(self) -> Dict[str, int]:
+        sys.setprofile(None)
+        return {stack: weight for stack, weight in self.stacks.items() if weight > 0}
+
+
+class ProfileStore:
+    """Request profiles in Redis, shared by all workers and kept for profile_retention_seconds"""
+
+    INDEX_KEY = "profiles:index"
+    INDEX_SIZE = 500
+
+    def __init__(self, redis_client: Redis):
+        self.redis = redis_client
+
+    def save(self, meta: Dict[str, Any], stacks: Dict[str, int]):
+        pipe = self.redis.pipeline(transaction=False)
+        pipe.setex(f"profile:{meta['id']}", settings.profile_retention_seconds, to_collapsed(stacks))
+        pipe.lpush(self.INDEX_KEY, json.dumps(meta))
+        pipe.ltrim(self.INDEX_KEY, 0, self.INDEX_SIZE - 1)
+        pipe.execute()
+
+    def list(self, route: Optional[str] = None, limit: int = 100) -> List[Dict[str, Any]]:
+        profiles = []
+        for entry in self.redis.lrange(self.INDEX_KEY, 0, -1):
+            meta = json.loads(entry)
+            if meta["created_at"] < time.time() - settings.profile_retention_seconds:
+                break
+            if route is None or meta["route"] == route:
+                profiles.append(meta)
+                if len(profiles) >= limit:
+                    break
+        return profiles
+
+    def get(self, profile_id: str) -> Optional[str]:
+        return self.redis.get(f"profile:{profile_id}")
+
+
+class ContinuousProfiler:
+    """
+    Low-rate sampling of all threads, aggregating the TaskService and TaskCRUD
+    functions on the stack. Counts are flushed to Redis hashes periodically,
+    so they add up across workers and restarts.
+    """
+
+    FUNCTIONS_KEY = "profile:continuous:functions"
+    STACKS_KEY = "profile:continuous:stacks"
+
+    def __init__(self, redis_factory, interval: float, flush_interval: float = 30.0):
+        self.redis_factory = redis_factory
+        self.interval = interval
+        self.flush_interval = flush_interval
+        self.functions: Counter = Counter()
+        self.stacks: Counter = Counter()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="continuous-profiler", daemon=True)
+        self._thread.start()
+
+    def sample(self):
+        own = threading.get_ident()
+        for thread_id, frame in sys._current_frames().items():
+            if thread_id == own:
+                continue
+            focused = []
+            while frame is not None:
+                if frame.f_code.co_filename.endswith(CONTINUOUS_FOCUS):
+                    focused.append(frame_label(frame.f_code))
+                frame = frame.f_back
+            if focused:
+                focused.reverse()
+                for label in set(focused):
+                    self.functions[label] += 1
+                self.stacks[";".join(focused)] += 1
+
+    def _run(self):
+        last_flush = time.monotonic()
+        while not self._stop.wait(self.interval):
+            self.sample()
+            if time.monotonic() - last_flush >= self.flush_interval:
+                self.flush()
+                last_flush = time.monotonic()
+        self.flush()
+
+    def flush(self):
+        functions, self.functions = self.functions, Counter()
+        stacks, self.stacks = self.stacks, Counter()
+        if not functions:
+            return
+        try:
+            pipe = self.redis_factory().pipeline(transaction=False)
+            for label, count in functions.items():
+                pipe.hincrby(self.FUNCTIONS_KEY, label, count)
+            for stack, count in stacks.items():
+                pipe.hincrby(self.STACKS_KEY, stack, count)
+            pipe.execute()
+        except Exception:
+            logger.exception("Failed to flush continuous profile")
+
+    def close(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+            self._thread = None
+
+    @classmethod
+    def report(cls, redis_client: Redis, top: int = 50) -> Dict[str, Any]:
+        functions = {label: int(count) for label, count in redis_client.hgetall(cls.FUNCTIONS_KEY).items()}
+        return {
+            "samples": sum(int(count) for count in redis_client.hvals(cls.STACKS_KEY)),
+            "functions": [
+                {"function": label, "samples": count}
+                for label, count in sorted(functions.items(), key=lambda item: -item[1])[:top]
+            ]
+        }
+
+    @classmethod
+    def collapsed(cls, redis_client: Redis) -> str:
+        return to_collapsed({stack: int(count) for stack, count in redis_client.hgetall(cls.STACKS_KEY).items()})
+
+
+class ProfilingMiddleware:
+    """
+    Profiles a request when an admin sends X-Profile: sample|deterministic, or
+    for a profile_sample_rate fraction of requests (sampling profiler).
+
+    The profiler sees the whole event loop thread, so concurrent requests on
+    the same worker show up in each other's profiles.
+    """
+
+    def __init__(self, app, redis_factory, is_admin_token):
+        self.app = app
+        self.redis_factory = redis_factory
+        self.is_admin_token = is_admin_token
+
+    async def _mode(self, scope) -> Optional[str]:
+        headers = dict(scope["headers"])
+        requested = headers.get(b"x-profile")
+        if requested in (b"sample", b"deterministic"):
+            authorization = headers.get(b"authorization", b"").decode("latin-1")
+            token = authorization[7:] if authorization.lower().startswith("bearer ") else None
+            if token and await asyncio.to_thread(self.is_admin_token, token):
+                return requested.decode()
+        if settings.profile_sample_rate and random.random() < settings.profile_sample_rate:
+            return "sample"
+        return None
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        mode = await self._mode(scope)
+        if mode is None:
+            return await self.app(scope, receive, send)
+
+        profile_id = current_trace_id() or os.urandom(16).hex()
+        status_code = None
+
+        async def send_with_profile_id(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+                message = {
+                    **message,
+                    "headers": list(message.get("headers", [])) + [(b"x-profile-id", profile_id.encode())]
+                }
+            await send(message)
+
+        if mode == "deterministic":
+            profiler = DeterministicProfiler()
+        else:
+            profiler = SamplingProfiler(threading.get_ident(), settings.profile_interval_ms / 1000)
+        started = time.perf_counter()
+        profiler.start()
+        try:
+            await self.app(scope, receive, send_with_profile_id)
+        finally:
+            stacks = profiler.stop()
+            endpoint = scope.get("endpoint")
+            meta = {
+                "id": profile_id,
+                "route": f"{scope['method']} {getattr(endpoint, '__name__', scope['path'])}",
+                "path": scope["path"],
+                "mode": mode,
+                "status_code": status_code,
+                "duration_ms": round((time.perf_counter() - started) * 1000, 2),
+                "created_at": time.time()
+            }
+            try:
+                await asyncio.to_thread(ProfileStore(self.redis_factory()).save, meta, stacks)
+            except Exception:
+                logger.exception("Failed to store profile %s", profile_id)
+
+
+_continuous_profiler: Optional[ContinuousProfiler] = None
+
+
+def get_continuous_profiler() -> ContinuousProfiler:
+    global _continuous_profiler
+    if _continuous_profiler is None:
+        from src.database import get_redis
+
+        _continuous_profiler = ContinuousProfiler(get_redis, settings.profile_continuous_interval_ms / 1000)
+    return _continuous_profiler
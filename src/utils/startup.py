@@ -0,0 +1,59 @@
+from contextlib import contextmanager
+from typing import Dict, Any, List, Optional
+import logging
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class StartupTimer:
+    """Per-phase import and initialization cost up to the first served request"""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.phases: List[Dict[str, Any]] = []
+        self.ready_ms: Optional[float] = None
+        self.first_request_ms: Optional[float] = None
+
+    def _since_start(self) -> float:
+        return round((time.perf_counter() - self.started) * 1000, 2)
+
+    @contextmanager
+    def phase(self, name: str):
+        began = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.phases.append({"phase": name, "ms": round((time.perf_counter() - began) * 1000, 2)})
+
+    def mark_ready(self):
+        self.ready_ms = self._since_start()
+        logger.info("Application ready in %.1f ms: %s", self.ready_ms, self.phases)
+
+    def mark_request(self):
+        if self.first_request_ms is None:
+            self.first_request_ms = self._since_start()
+
+    def report(self, target_ms: float) -> Dict[str, Any]:
+        return {
+            "phases": self.phases,
+            "ready_ms": self.ready_ms,
+            "first_request_ms": self.first_request_ms,
+            "target_ms": target_ms,
+            "within_target": self.first_request_ms is not None and self.first_request_ms <= target_ms
+        }
+
+
+startup_timer = StartupTimer()
+
+
+class FirstRequestMiddleware:
+    """Records when the first HTTP request reaches the application"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "http" and startup_timer.first_request_ms is None:
+            startup_timer.mark_request()
+        await self.app(scope, receive, send)
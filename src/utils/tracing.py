@@ -0,0 +1,390 @@
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, Any, List, Optional
+from fastapi.routing import APIRoute
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from src.config import settings
+from src.utils.metrics import metrics
+import abc
+import asyncio
+import functools
+import inspect
+import json
+import logging
+import os
+import queue
+import random
+import re
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+TRACEPARENT = re.compile(r"^[0-9a-f]{2}-([0-9a-f]{32})-([0-9a-f]{16})-([0-9a-f]{2})$")
+MAX_SPANS_PER_TRACE = 1000
+
+# Span kinds, as in OpenTelemetry: the request span is the server side of a
+# remote call, database statements the client side, everything else internal
+SPAN_KIND_INTERNAL = "internal"
+SPAN_KIND_SERVER = "server"
+SPAN_KIND_CLIENT = "client"
+
+
+class Trace:
+    def __init__(self, trace_id: str):
+        self.trace_id = trace_id
+        self.spans: List["Span"] = []
+
+
+class Span:
+    __slots__ = ("trace", "name", "kind", "span_id", "parent_id", "attributes", "start_ns", "end_ns", "error")
+
+    def __init__(
+            self,
+            trace: Trace,
+            name: str,
+            parent_id: Optional[str],
+            attributes: Dict[str, Any],
+            kind: str = SPAN_KIND_INTERNAL
+    ):
+        self.trace = trace
+        self.name = name
+        self.kind = kind
+        self.span_id = os.urandom(8).hex()
+        self.parent_id = parent_id
+        self.attributes = attributes
+        self.start_ns = time.time_ns()
+        self.end_ns: Optional[int] = None
+        self.error: Optional[str] = None
+
+    def child(self, name: str, attributes: Dict[str, Any], kind: str = SPAN_KIND_INTERNAL) -> "Span":
+        return Span(self.trace, name, self.span_id, attributes, kind)
+
+    def finish(self):
+        self.end_ns = time.time_ns()
+        if len(self.trace.spans) < MAX_SPANS_PER_TRACE:
+            self.trace.spans.append(self)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "trace_id": self.trace.trace_id,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "name": self.name,
+            "kind": self.kind,
+            "start_ns": self.start_ns,
+            "end_ns": self.end_ns,
+            "duration_ms": round((self.end_ns - self.start_ns) / 1e6, 3),
+            "attributes": self.attributes,
+            "error": self.error
+        }
+
+
+# Span of the code currently running, None outside sampled requests
+_current_span: ContextVar[Optional[Span]] = ContextVar("current_span", default=None)
+
+
+class SpanExporter(abc.ABC):
+    """Exports finished traces in batches from a background thread, dropping them when backed up"""
+
+    def __init__(self, batch_size: int = 512, interval: float = 2.0, max_queue: int = 10000):
+        self.batch_size = batch_size
+        self.interval = interval
+        self._queue: "queue.Queue[Optional[List[Span]]]" = queue.Queue(max_queue)
+        self._thread = threading.Thread(target=self._run, name="trace-exporter", daemon=True)
+        self._thread.start()
+
+    def submit(self, spans: List[Span]):
+        try:
+            self._queue.put_nowait(spans)
+        except queue.Full:
+            metrics.inc("traces_dropped")
+
+    def _run(self):
+        while True:
+            batch: List[Span] = []
+            deadline = time.monotonic() + self.interval
+            stop = False
+            while len(batch) < self.batch_size:
+                try:
+                    spans = self._queue.get(timeout=max(0.0, deadline - time.monotonic()))
+                except queue.Empty:
+                    break
+                if spans is None:
+                    stop = True
+                    break
+                batch.extend(spans)
+            if batch:
+                try:
+                    self.write(batch)
+                except Exception:
+                    logger.exception("Failed to export %d spans", len(batch))
+            if stop:
+                return
+
+    @abc.abstractmethod
+    def write(self, spans: List[Span]):
+        """Send one batch of spans, called from the exporter thread"""
+
+    def close(self):
+        self._queue.put(None)
+        self._thread.join(timeout=5)
+
+
+class FileSpanExporter(SpanExporter):
+    """One JSON object per span and line"""
+
+    def __init__(self, path: str, **kwargs):
+        self.path = path
+        super().__init__(**kwargs)
+
+    def write(self, spans: List[Span]):
+        with open(self.path, "a") as f:
+            for span in spans:
+                f.write(json.dumps(span.to_dict(), default=str) + "\n")
+
+
+class OTLPSpanExporter(SpanExporter):
+    """OTLP/HTTP JSON, accepted by the OpenTelemetry collector and most tracing backends"""
+
+    KINDS = {SPAN_KIND_INTERNAL: 1, SPAN_KIND_SERVER: 2, SPAN_KIND_CLIENT: 3}
+
+    def __init__(self, endpoint: str, service_name: str, **kwargs):
+        self.endpoint = endpoint
+        self.service_name = service_name
+        super().__init__(**kwargs)
+
+    @staticmethod
+    def _attributes(attributes: Dict[str, Any]) -> List[Dict[str, Any]]:
+        converted = []
+        for key, value in attributes.items():
+            if isinstance(value, bool):
+                converted.append({"key": key, "value": {"boolValue": value}})
+            elif isinstance(value, int):
+                converted.append({"key": key, "value": {"intValue": str(value)}})
+            elif isinstance(value, float):
+                converted.append({"key": key, "value": {"doubleValue": value}})
+            else:
+                converted.append({"key": key, "value": {"stringValue": str(value)}})
+        return converted
+
+    def write(self, spans: List[Span]):
+        import httpx
+
+        payload = {"resourceSpans": [{
+            "resource": {"attributes": self._attributes({"service.name": self.service_name})},
+            "scopeSpans": [{
+                "scope": {"name": "src.utils.tracing"},
+                "spans": [{
+                    "traceId": span.trace.trace_id,
+                    "spanId": span.span_id,
+                    "parentSpanId": span.parent_id or "",
+                    "name": span.name,
+                    "kind": self.KINDS[span.kind],
+                    "startTimeUnixNano": str(span.start_ns),
+                    "endTimeUnixNano": str(span.end_ns),
+                    "attributes": self._attributes(span.attributes),
+                    "status": {"code": 2, "message": span.error} if span.error else {"code": 0}
+                } for span in spans]
+            }]
+        }]}
+        httpx.post(self.endpoint, json=payload, timeout=5).raise_for_status()
+
+
+class Tracer:
+    """
+    Request tracing with sampling.
+
+    A trace starts in TracingMiddleware when the request carries a sampled W3C
+    traceparent header or wins the trace_sample_rate draw; spans below it are
+    opened with span() or @traced. Outside a sampled request these are a single
+    context variable lookup.
+    """
+
+    def __init__(self):
+        self.exporter: Optional[SpanExporter] = None
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self) -> bool:
+        return self.exporter is not None
+
+    def configure(self):
+        with self._lock:
+            if self.exporter is not None or not settings.trace_exporter:
+                return
+            if settings.trace_exporter == "otlp":
+                self.exporter = OTLPSpanExporter(settings.trace_otlp_endpoint, settings.trace_service_name)
+            else:
+                self.exporter = FileSpanExporter(settings.trace_file)
+            if not event.contains(Engine, "before_cursor_execute", _before_cursor_execute):
+                event.listen(Engine, "before_cursor_execute", _before_cursor_execute)
+                event.listen(Engine, "after_cursor_execute", _after_cursor_execute)
+                event.listen(Engine, "handle_error", _handle_error)
+
+    def start_trace(self, traceparent: Optional[str], name: str, attributes: Dict[str, Any]) -> Optional[Span]:
+        """Root span of a new trace if this request is sampled, else None"""
+        if not self.enabled:
+            return None
+
+        match = TRACEPARENT.match(traceparent) if traceparent else None
+        if match:
+            # The caller already decided, keep its trace id and sampling
+            if not int(match.group(3), 16) & 1:
+                return None
+            trace_id, parent_id = match.group(1), match.group(2)
+        elif random.random() < settings.trace_sample_rate:
+            trace_id, parent_id = os.urandom(16).hex(), None
+        else:
+            return None
+        return Span(Trace(trace_id), name, parent_id, attributes, SPAN_KIND_SERVER)
+
+    def finish_trace(self, root: Span):
+        root.finish()
+        self.exporter.submit(root.trace.spans)
+
+    @contextmanager
+    def span(self, name: str, **attributes):
+        parent = _current_span.get()
+        if parent is None:
+            yield None
+            return
+
+        span = parent.child(name, attributes)
+        token = _current_span.set(span)
+        try:
+            yield span
+        except BaseException as e:
+            span.error = repr(e)
+            raise
+        finally:
+            _current_span.reset(token)
+            span.finish()
+
+    def close(self):
+        if self.exporter is not None:
+            self.exporter.close()
+            self.exporter = None
+
+
+tracer = Tracer()
+
+
+def current_trace_id() -> Optional[str]:
+    span = _current_span.get()
+    return span.trace.trace_id if span else None
+
+
+def traced(name: str):
+    """Decorator opening a span around every call of the function"""
+    def decorator(func):
+        if asyncio.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                if _current_span.get() is None:
+                    return await func(*args, **kwargs)
+                with tracer.span(name):
+                    return await func(*args, **kwargs)
+            return async_wrapper
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if _current_span.get() is None:
+                return func(*args, **kwargs)
+            with tracer.span(name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def trace_methods(cls):
+    """Class decorator: @traced("Class.method") on every public method"""
+    for attr, value in list(vars(cls).items()):
+        if attr.startswith("_"):
+            continue
+        name = f"{cls.__name__}.{attr}"
+        if isinstance(value, staticmethod):
+            setattr(cls, attr, staticmethod(traced(name)(value.__func__)))
+        elif isinstance(value, classmethod):
+            setattr(cls, attr, classmethod(traced(name)(value.__func__)))
+        elif inspect.isfunction(value):
+            setattr(cls, attr, traced(name)(value))
+    return cls
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    parent = _current_span.get()
+    if parent is not None and context is not None:
+        context._trace_span = parent.child("db.execute", {
+            "db.statement": statement[:500],
+            "db.executemany": executemany
+        }, SPAN_KIND_CLIENT)
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    span = getattr(context, "_trace_span", None)
+    if span is not None:
+        span.attributes["db.rowcount"] = cursor.rowcount
+        span.finish()
+
+
+def _handle_error(exception_context):
+    span = getattr(exception_context.execution_context, "_trace_span", None)
+    if span is not None:
+        span.error = repr(exception_context.original_exception)
+        span.finish()
+
+
+class TracedRoute(APIRoute):
+    """Route class opening a span named after the route template around the whole handler"""
+
+    def get_route_handler(self):
+        handler = super().get_route_handler()
+        name = f"route {','.join(sorted(self.methods))} {self.path_format}"
+
+        async def traced_handler(request):
+            with tracer.span(name):
+                return await handler(request)
+        return traced_handler
+
+
+class TracingMiddleware:
+    """Starts sampled traces, outermost so the time spent in other middleware (gzip) is included"""
+
+    def __init__(self, app):
+        self.app = app
+        tracer.configure()
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not tracer.enabled:
+            return await self.app(scope, receive, send)
+
+        headers = dict(scope["headers"])
+        traceparent = headers.get(b"traceparent")
+        root = tracer.start_trace(
+            traceparent.decode("latin-1") if traceparent else None,
+            f"{scope['method']} {scope['path']}",
+            {"http.method": scope["method"], "http.target": scope["path"]}
+        )
+        if root is None:
+            return await self.app(scope, receive, send)
+
+        async def send_with_trace_id(message):
+            if message["type"] == "http.response.start":
+                root.attributes["http.status_code"] = message["status"]
+                message = {
+                    **message,
+                    "headers": list(message.get("headers", [])) + [(b"x-trace-id", root.trace.trace_id.encode())]
+                }
+            await send(message)
+
+        token = _current_span.set(root)
+        try:
+            await self.app(scope, receive, send_with_trace_id)
+        except BaseException as e:
+            root.error = repr(e)
+            raise
+        finally:
+            _current_span.reset(token)
+            tracer.finish_trace(root)
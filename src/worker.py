@@ -0,0 +1,14 @@
+from uvicorn.workers import UvicornWorker
+from src.config import settings
+
+
+class TaskAppWorker(UvicornWorker):
+    """Uvicorn worker for gunicorn with uvloop, httptools and a bounded graceful shutdown"""
+
+    CONFIG_KWARGS = {
+        "loop": "uvloop",
+        "http": "httptools",
+        # Open requests and streams get this long to finish, leaving gunicorn's
+        # graceful_timeout a margin for the lifespan shutdown
+        "timeout_graceful_shutdown": max(1, settings.graceful_timeout - 5),
+    }
@@ -0,0 +1,61 @@
+import os
+import tempfile
+
+# Settings are read on import, point them at a scratch SQLite database first
+os.environ["DATABASE_URL"] = "sqlite:///" + os.path.join(tempfile.mkdtemp(), "test.db")
+
+import fakeredis
+import pytest
+import redis.asyncio
+from fastapi.testclient import TestClient
+
+import src.database as database
+from src.crud.cache import CacheManager, local_cache
+from src.database import Base, get_engine, new_session
+from src.main import app
+from src.models.user import User
+from src.services import cache_warmup, task_events, write_coalescer
+from src.utils.circuit_breaker import redis_breaker
+from src.utils.security import create_access_token
+
+
+@pytest.fixture
+def redis_server(monkeypatch):
+    """In-memory Redis behind get_redis, get_redis_raw and the event hub's async client"""
+    server = fakeredis.FakeServer()
+    monkeypatch.setattr(database, "_create_redis", lambda **kwargs: fakeredis.FakeRedis(server=server, **kwargs))
+    monkeypatch.setattr(database, "_redis_client", None)
+    monkeypatch.setattr(database, "_redis_raw_client", None)
+    monkeypatch.setattr(
+        redis.asyncio.Redis, "from_url",
+        staticmethod(lambda url, **kwargs: fakeredis.aioredis.FakeRedis(server=server, **kwargs))
+    )
+    return server
+
+
+@pytest.fixture
+def client(redis_server, monkeypatch):
+    """
+    Test client of the app on empty tables and an empty Redis, signed in as
+    "tester" (requests can override the Authorization header)
+    """
+    engine = get_engine()
+    Base.metadata.drop_all(bind=engine)
+    Base.metadata.create_all(bind=engine)
+    db = new_session()
+    db.add(User(username="tester", email="tester@example.com", hashed_password="!"))
+    db.commit()
+    db.close()
+
+    # Process-wide singletons start fresh for every test
+    monkeypatch.setattr(cache_warmup, "_cache_warmer", None)
+    monkeypatch.setattr(write_coalescer, "_write_coalescer", None)
+    monkeypatch.setattr(task_events, "_event_hub", None)
+    monkeypatch.setattr(CacheManager, "invalidation_listeners", [])
+    monkeypatch.setattr(CacheManager, "_missed_invalidations", False)
+    local_cache.clear()
+    redis_breaker.record_success()
+
+    with TestClient(app) as test_client:
+        test_client.headers["Authorization"] = f"Bearer {create_access_token(data={'sub': 'tester'})}"
+        yield test_client
@@ -0,0 +1,78 @@
+from fastapi.testclient import TestClient
+
+from src.config import settings
+from src.database import get_redis
+from src.services.batch_service import BatchExecutor
+
+
+def test_batch_runs_requests_in_order(client: TestClient):
+    """Test a mixed batch: writes in order, concurrent reads, per-request statuses."""
+    task = client.post("/api/v1/tasks/", json={"title": "Existing"}).json()
+
+    response = client.post("/api/v1/batch", json={"requests": [
+        {"method": "POST", "path": "/api/v1/tasks/", "body": {"title": "Created in batch"}},
+        {"method": "GET", "path": f"/api/v1/tasks/{task['id']}"},
+        {"method": "GET", "path": "/api/v1/tasks/?limit=10"},
+        {"method": "GET", "path": "/api/v1/tasks/999999"},
+        {"method": "PUT", "path": f"/api/v1/tasks/{task['id']}", "body": {"title": "Renamed"},
+         "headers": {"If-Match": '"1"'}}
+    ]})
+    assert response.status_code == 200
+    data = response.json()
+    assert data["committed"] is True
+    assert [item["status"] for item in data["responses"]] == [201, 200, 200, 404, 200]
+    assert data["responses"][1]["body"]["title"] == "Existing"
+    assert data["responses"][2]["body"]["total"] == 2
+    assert data["responses"][4]["headers"]["etag"] == '"2"'
+
+
+def test_atomic_batch_rolls_back(client: TestClient):
+    """Test that a failed request rolls back the whole atomic batch."""
+    task = client.post("/api/v1/tasks/", json={"title": "Keep"}).json()
+
+    data = client.post("/api/v1/batch", json={"atomic": True, "requests": [
+        {"method": "POST", "path": "/api/v1/tasks/", "body": {"title": "Rolled back"}},
+        {"method": "PUT", "path": f"/api/v1/tasks/{task['id']}", "body": {"title": "Changed"}},
+        {"method": "DELETE", "path": "/api/v1/tasks/999999"},
+        {"method": "GET", "path": f"/api/v1/tasks/{task['id']}"}
+    ]}).json()
+    assert data["committed"] is False
+    assert [item["status"] for item in data["responses"]] == [201, 200, 404, 424]
+
+    created = data["responses"][0]["body"]["id"]
+    assert client.get(f"/api/v1/tasks/{created}").status_code == 404
+    assert client.get(f"/api/v1/tasks/{task['id']}").json()["title"] == "Keep"
+    assert client.get("/api/v1/tasks/suggest?q=rolled").json() == []
+    # Its counters and change events were held back and dropped
+    assert client.get("/api/v1/stats").json()["total"] == 1
+    events = get_redis().xrange(settings.event_stream_key)
+    assert [event["type"] for _, event in events] == ["created"]
+
+    data = client.post("/api/v1/batch", json={"atomic": True, "requests": [
+        {"method": "POST", "path": "/api/v1/tasks/", "body": {"title": "Committed"}}
+    ]}).json()
+    assert data["committed"] is True
+    assert client.get("/api/v1/stats").json()["total"] == 2
+    assert [task["title"] for task in client.get("/api/v1/tasks/suggest?q=committed").json()] == ["Committed"]
+
+    assert client.post("/api/v1/batch", json={"requests": []}).status_code == 422
+    nested = {"method": "POST", "path": "/api/v1/batch", "body": {"requests": []}}
+    assert client.post("/api/v1/batch", json={"requests": [nested]}).status_code == 422
+
+
+def test_atomic_batch_bypasses_cache(client: TestClient, monkeypatch):
+    """Test that reads inside an atomic batch don't cache its uncommitted rows."""
+    task = client.post("/api/v1/tasks/", json={"title": "Before"}).json()
+    monkeypatch.setattr(BatchExecutor, "_forget", classmethod(lambda cls, operations, results: None))
+
+    data = client.post("/api/v1/batch", json={"atomic": True, "requests": [
+        {"method": "PUT", "path": f"/api/v1/tasks/{task['id']}", "body": {"title": "Uncommitted"}},
+        {"method": "GET", "path": f"/api/v1/tasks/{task['id']}"},
+        {"method": "GET", "path": "/api/v1/tasks/?limit=10"},
+        {"method": "DELETE", "path": "/api/v1/tasks/999999"}
+    ]}).json()
+    assert [item["status"] for item in data["responses"]] == [200, 200, 200, 404]
+    assert data["responses"][1]["body"]["title"] == "Uncommitted"
+    assert get_redis().keys("task:*") == []
+    assert get_redis().keys("tasks:*") == []
+    assert client.get(f"/api/v1/tasks/{task['id']}").json()["title"] == "Before"
@@ -0,0 +1,119 @@
+import pytest
+import redis
+import time
+from fastapi.testclient import TestClient
+from redis.client import Pipeline
+from src.config import settings
+from src.crud.cache import CacheManager, keyspace_of, local_cache
+from src.database import get_redis, get_redis_raw, new_session
+from src.models.user import User
+from src.services.cache_warmup import get_cache_warmer
+from src.utils.circuit_breaker import redis_breaker
+
+
+def test_large_values_are_compressed(client: TestClient):
+    """Test that values above the threshold are stored compressed and read back."""
+    cache = CacheManager(get_redis(), get_redis_raw())
+    value = {"task": {"description": "x" * 10000}}
+
+    cache.set("task_dependencies:1", value)
+    assert cache.get("task_dependencies:1") == value
+    assert get_redis_raw().strlen("task_dependencies:1") < 1000
+    assert 0 < get_redis_raw().ttl("task_dependencies:1") <= settings.cache_keyspace_ttl["task_dependencies"]
+
+    cache.set_raw("task:1", b'{"id": 1}')
+    assert get_redis_raw().get("task:1") == b'{"id": 1}'
+
+
+def test_oversized_values_are_not_cached(client: TestClient, monkeypatch):
+    """Test that values above the keyspace limit are skipped."""
+    monkeypatch.setitem(settings.cache_keyspace_max_bytes, "task", 100)
+    monkeypatch.setattr(settings, "cache_compress_threshold", 1000000)
+    cache = CacheManager(get_redis(), get_redis_raw())
+
+    cache.set_raw("task:1", b"x" * 200)
+    assert cache.get_raw("task:1") is None
+    assert keyspace_of("tasks:ids:abc:0") == "tasks:ids"
+    assert keyspace_of("task:1") == "task"
+
+
+def test_cache_report_requires_admin(client: TestClient):
+    """Test the per-keyspace cache report."""
+    client.post("/api/v1/users/", json={"username": "admin", "email": "admin@example.com", "password": "secret123"})
+    token = client.post(
+        "/api/v1/users/login", data={"username": "admin", "password": "secret123"}
+    ).json()["access_token"]
+    headers = {"Authorization": f"Bearer {token}"}
+
+    assert client.get("/api/v1/admin/cache", headers=headers).status_code == 403
+
+    db = new_session()
+    db.query(User).filter(User.username == "admin").update({"is_admin": True})
+    db.commit()
+    db.close()
+
+    task_id = client.post("/api/v1/tasks/", json={"title": "Cached"}).json()["id"]
+    client.get(f"/api/v1/tasks/{task_id}")
+    client.get("/api/v1/tasks/")
+
+    response = client.get("/api/v1/admin/cache", headers=headers)
+    assert response.status_code == 200
+    report = response.json()
+    assert report["complete"]
+    assert report["keyspaces"]["task"]["keys"] == 1
+    assert report["keyspaces"]["tasks:ids"]["bytes"] > 0
+
+
+def test_requests_survive_redis_outage(client: TestClient, monkeypatch):
+    """Test that the circuit breaker skips a failing Redis and the cache recovers afterwards."""
+    task_id = client.post("/api/v1/tasks/", json={"title": "Before"}).json()["id"]
+    assert client.get(f"/api/v1/tasks/{task_id}").json()["title"] == "Before"
+
+    def down(*args, **kwargs):
+        raise redis.ConnectionError("Redis is down")
+
+    monkeypatch.setattr(redis_breaker, "reset_timeout", 0.05)
+    monkeypatch.setattr(redis_breaker, "max_reset_timeout", 0.05)
+    monkeypatch.setattr(redis_breaker, "_backoff", 0.05)
+    local_cache.clear()
+
+    with pytest.MonkeyPatch.context() as outage:
+        outage.setattr(redis.Redis, "execute_command", down)
+        outage.setattr(Pipeline, "execute", down)
+
+        # Writes and reads are served from the database while Redis is down
+        response = client.put(f"/api/v1/tasks/{task_id}", json={"title": "During"})
+        assert response.status_code == 200
+        for _ in range(settings.redis_breaker_failures):
+            assert client.get(f"/api/v1/tasks/{task_id}").json()["title"] == "During"
+        assert client.get("/api/v1/tasks/").status_code == 200
+        assert redis_breaker.state == "open"
+        # Redis-only views fail fast instead of erroring
+        assert client.get("/api/v1/stats/").status_code == 503
+        assert CacheManager(get_redis(), get_redis_raw()).keyspace_report() is None
+        assert client.get("/api/metrics").json()["gauges"]["redis_breaker_state"] == 2
+
+    time.sleep(0.06)
+
+    # The task:{id} entry cached before the outage missed its invalidation
+    assert client.get(f"/api/v1/tasks/{task_id}").json()["title"] == "During"
+    assert redis_breaker.state == "closed"
+    assert client.get("/api/metrics").json()["gauges"]["redis_breaker_state"] == 0
+
+
+def test_cache_warmup_refills_list_responses(client: TestClient):
+    """Test that a warm-up refills hot list responses and waits out the minimum interval."""
+    client.post("/api/v1/tasks/", json={"title": "Hot"})
+    client.get("/api/v1/tasks/")
+    warmer = get_cache_warmer()
+    warmer.close()
+
+    client.post("/api/v1/tasks/", json={"title": "Invalidates"})
+    assert get_redis().keys("tasks:resp:*") == []
+    assert warmer.warm() >= 1
+    assert get_redis().keys("tasks:resp:*")
+
+    # An invalidation right after a warm-up doesn't start another one before min_interval
+    warmer.schedule()
+    assert warmer._timer.interval > settings.cache_warmup_delay_ms / 1000
+    warmer.close()
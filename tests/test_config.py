@@ -0,0 +1,11 @@
+from src.config import Settings
+
+
+def test_settings_are_read_case_insensitively(monkeypatch):
+    """Test that upper-case variables (.env.example, docker-compose) and lower-case ones both apply."""
+    monkeypatch.setenv("CACHE_TTL", "42")
+    monkeypatch.setenv("web_concurrency", "3")
+
+    settings = Settings(_env_file=None)
+    assert settings.cache_ttl == 42
+    assert settings.web_concurrency == 3
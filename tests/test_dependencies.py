@@ -0,0 +1,53 @@
+from fastapi.testclient import TestClient
+
+
+def create_tasks(client: TestClient, count: int):
+    return [
+        client.post("/api/v1/tasks/", json={"title": f"Task {i}"}).json()["id"]
+        for i in range(count)
+    ]
+
+
+def test_dependency_batch(client: TestClient):
+    """Test adding and removing dependencies in one batch."""
+    a, b, c, d = create_tasks(client, 4)
+    client.post(f"/api/v1/tasks/{a}/dependencies", json={"depends_on_id": d})
+
+    response = client.post("/api/v1/dependencies/batch", json={
+        "add": [
+            {"task_id": a, "depends_on_id": b},
+            {"task_id": b, "depends_on_id": c},
+            {"task_id": a, "depends_on_id": b}
+        ],
+        "remove": [{"task_id": a, "depends_on_id": d}, {"task_id": c, "depends_on_id": d}]
+    })
+    assert response.status_code == 200
+    data = response.json()
+    assert data["added"] == [{"task_id": a, "depends_on_id": b}, {"task_id": b, "depends_on_id": c}]
+    assert data["removed"] == [{"task_id": a, "depends_on_id": d}]
+
+    graph = client.get(f"/api/v1/tasks/{a}/dependencies?format=graph").json()
+    assert {node["id"] for node in graph["nodes"]} == {a, b, c}
+
+    ready = {task["id"] for task in client.get("/api/v1/tasks/ready").json()["tasks"]}
+    assert ready == {c, d}
+
+
+def test_dependency_batch_rejects_cycles(client: TestClient):
+    """Test that a batch closing a cycle is rejected as a whole."""
+    a, b, c = create_tasks(client, 3)
+    client.post(f"/api/v1/tasks/{a}/dependencies", json={"depends_on_id": b})
+
+    response = client.post("/api/v1/dependencies/batch", json={
+        "add": [{"task_id": b, "depends_on_id": c}, {"task_id": c, "depends_on_id": a}]
+    })
+    assert response.status_code == 400
+    assert response.json()["detail"]["cycle"] in ([b, c, a, b], [c, a, b, c])
+
+    graph = client.get(f"/api/v1/tasks/{b}/dependencies?format=graph").json()
+    assert graph["edges"] == []
+
+    response = client.post("/api/v1/dependencies/batch", json={
+        "add": [{"task_id": a, "depends_on_id": 999}]
+    })
+    assert response.status_code == 404
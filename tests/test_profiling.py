@@ -0,0 +1,82 @@
+import threading
+from fastapi.testclient import TestClient
+from src.crud.task import TaskCRUD
+from src.database import get_redis, new_session
+from src.models.user import User
+from src.utils.profiling import ContinuousProfiler
+
+
+def admin_headers(client: TestClient) -> dict:
+    client.post("/api/v1/users/", json={"username": "admin", "email": "admin@example.com", "password": "secret123"})
+    db = new_session()
+    db.query(User).filter(User.username == "admin").update({"is_admin": True})
+    db.commit()
+    db.close()
+    token = client.post(
+        "/api/v1/users/login", data={"username": "admin", "password": "secret123"}
+    ).json()["access_token"]
+    return {"Authorization": f"Bearer {token}"}
+
+
+def test_admin_can_profile_a_request(client: TestClient):
+    """Test that X-Profile stores collapsed stacks downloadable by admins."""
+    headers = admin_headers(client)
+    client.post("/api/v1/tasks/", json={"title": "Profiled"})
+
+    # Ignored without an admin token
+    assert "x-profile-id" not in client.get("/api/v1/tasks/", headers={"X-Profile": "deterministic"}).headers
+
+    response = client.get("/api/v1/tasks/", headers={**headers, "X-Profile": "deterministic"})
+    assert response.status_code == 200
+    profile_id = response.headers["x-profile-id"]
+
+    profiles = client.get("/api/v1/admin/profiles", headers=headers).json()
+    assert profiles[0]["id"] == profile_id
+    assert profiles[0]["route"] == "GET list_tasks"
+    assert client.get("/api/v1/admin/profiles?route=GET get_task", headers=headers).json() == []
+
+    stacks = client.get(f"/api/v1/admin/profiles/{profile_id}", headers=headers)
+    assert stacks.status_code == 200
+    assert "TaskService.get_tasks_encoded" in stacks.text
+    stack, weight = stacks.text.splitlines()[0].rsplit(" ", 1)
+    assert int(weight) > 0
+
+    assert client.get("/api/v1/admin/profiles/" + "0" * 32, headers=headers).status_code == 404
+    assert client.get("/api/v1/admin/profiles", headers={"Authorization": ""}).status_code == 401
+
+
+def test_continuous_profiler_aggregates_task_functions(client: TestClient):
+    """Test that continuous sampling counts TaskCRUD frames of other threads."""
+    headers = admin_headers(client)
+    entered, release = threading.Event(), threading.Event()
+
+    class BlockingSession:
+        def query(self, model):
+            entered.set()
+            release.wait(5)
+            return self
+
+        def filter(self, *criteria):
+            return self
+
+        def first(self):
+            return None
+
+    worker = threading.Thread(target=lambda: TaskCRUD.get_task(BlockingSession(), 1))
+    worker.start()
+    entered.wait(5)
+
+    profiler = ContinuousProfiler(get_redis, interval=1)
+    try:
+        profiler.sample()
+        profiler.sample()
+    finally:
+        release.set()
+        worker.join()
+    profiler.flush()
+
+    report = client.get("/api/v1/admin/profiles/continuous", headers=headers).json()
+    assert report["samples"] == 2
+    assert report["functions"][0]["function"].startswith("TaskCRUD.get_task (task.py:")
+    collapsed = client.get("/api/v1/admin/profiles/continuous?format=collapsed", headers=headers)
+    assert collapsed.text.startswith("TaskCRUD.get_task (task.py:")
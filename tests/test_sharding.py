@@ -0,0 +1,189 @@
+import pytest
+from fastapi.testclient import TestClient
+
+from src.config import settings
+from src.crud import shard as shard_module
+from src.crud.cache import CacheManager
+from src.crud.shard import HashRing, ShardRouter, ShardedTaskCRUD, get_shard_router, task_sessions
+from src.crud.stats import TaskStats
+from src.crud.suggest import TaskSuggestIndex
+from src.database import get_redis, get_redis_raw, new_session
+from src.models.task import Task, TaskPriority
+from src.services.task_service import TaskService
+from src.services.write_coalescer import get_write_coalescer
+
+
+@pytest.fixture
+def use_shards(tmp_path, monkeypatch):
+    """Switches the app to count SQLite files acting as shards (shard0 ... shardN)."""
+    routers = []
+
+    def use(count: int) -> ShardRouter:
+        monkeypatch.setattr(settings, "shard_database_urls", [
+            f"sqlite:///{tmp_path / f'shard{index}.db'}" for index in range(count)
+        ])
+        monkeypatch.setattr(shard_module, "_shard_router", None)
+        router = get_shard_router()
+        router.create_all()
+        routers.append(router)
+        return router
+
+    yield use
+    for router in routers:
+        router.dispose()
+
+
+@pytest.fixture
+def shards(use_shards) -> ShardRouter:
+    """Three shards, requested before client so the app starts sharded."""
+    return use_shards(3)
+
+
+def _sign_up(client: TestClient, username: str):
+    """Register a user, returns (user id, auth headers)"""
+    client.post("/api/v1/users/", json={
+        "username": username, "email": f"{username}@example.com", "password": "secret123"
+    })
+    token = client.post(
+        "/api/v1/users/login", data={"username": username, "password": "secret123"}
+    ).json()["access_token"]
+    headers = {"Authorization": f"Bearer {token}"}
+    return client.get("/api/v1/users/me", headers=headers).json()["id"], headers
+
+
+def _users_on_distinct_shards(client: TestClient, router: ShardRouter):
+    """Two signed up users whose tasks live on different shards"""
+    seen = {}
+    for index in range(20):
+        user_id, headers = _sign_up(client, f"user{index}")
+        seen.setdefault(router.shard_for_user(user_id), (user_id, headers))
+        if len(seen) == 2:
+            return list(seen.values())
+
+
+def _task_ids_on(router: ShardRouter, shard: str):
+    with router.session(shard) as db:
+        return {row[0] for row in db.query(Task.id).all()}
+
+
+def test_hash_ring_is_stable_when_adding_a_node():
+    """Test that adding a shard only remaps a fraction of the keys."""
+    before = HashRing(["shard0", "shard1", "shard2"])
+    after = HashRing(["shard0", "shard1", "shard2", "shard3"])
+
+    keys = [f"user:{i}" for i in range(2000)]
+    moved = [key for key in keys if before.get_node(key) != after.get_node(key)]
+
+    assert all(after.get_node(key) == "shard3" for key in moved)
+    assert len(moved) < len(keys) / 2
+
+
+def test_task_requests_use_the_owners_shard(shards: ShardRouter, client: TestClient):
+    """Test that task requests, jobs and unscoped reads work on sharded tasks."""
+    (alice, alice_headers), (bob, bob_headers) = _users_on_distinct_shards(client, shards)
+    alice_shard, bob_shard = shards.shard_for_user(alice), shards.shard_for_user(bob)
+
+    first = client.post("/api/v1/tasks/", json={"title": "b first"}, headers=alice_headers).json()
+    second = client.post(
+        "/api/v1/tasks/", json={"title": "d second", "depends_on": [first["id"]]}, headers=alice_headers
+    ).json()
+    other = client.post("/api/v1/tasks/", json={"title": "c other"}, headers=bob_headers).json()
+
+    # Ids come from the main database's sequence, the rows live on the owner's shard
+    assert len({first["id"], second["id"], other["id"]}) == 3
+    assert _task_ids_on(shards, alice_shard) == {first["id"], second["id"]}
+    assert _task_ids_on(shards, bob_shard) == {other["id"]}
+    db = new_session()
+    try:
+        assert db.query(Task).count() == 0
+    finally:
+        db.close()
+
+    assert client.get(f"/api/v1/tasks/{first['id']}", headers=alice_headers).status_code == 200
+    assert client.get(f"/api/v1/tasks/{first['id']}", headers=bob_headers).status_code == 404
+    assert client.get("/api/v1/tasks/", headers=alice_headers).json()["total"] == 2
+    # Another shard's task can't become a dependency
+    response = client.post(
+        "/api/v1/tasks/", json={"title": "Cross", "depends_on": [other["id"]]}, headers=alice_headers
+    )
+    assert response.status_code == 400
+
+    token = client.get("/api/v1/tasks/changes", headers=alice_headers).json()["next_token"]
+    updated = client.put(f"/api/v1/tasks/{first['id']}", json={"status": "completed"}, headers=alice_headers)
+    assert updated.json()["version"] == 2
+    changes = client.get(f"/api/v1/tasks/changes?since={token}", headers=alice_headers).json()
+    assert [task["id"] for task in changes["changed"]] == [first["id"]]
+
+    assert client.put(
+        f"/api/v1/tasks/{other['id']}?coalesce=true", json={"priority": "high"}, headers=bob_headers
+    ).status_code == 202
+    assert get_write_coalescer().flush() == 1
+    with shards.session(bob_shard) as db:
+        assert db.query(Task).filter(Task.id == other["id"]).one().priority == TaskPriority.HIGH
+
+    # Jobs and rebuilds cover every shard
+    from src.services.stats_service import reconcile_stats
+    reconcile_stats()
+    assert TaskStats(get_redis()).get(None)["total"] == 3
+    with task_sessions() as dbs:
+        assert TaskSuggestIndex(get_redis()).rebuild(*dbs) == 3
+
+    # Unscoped reads (cache warm-up) scatter to every shard and merge in sort order
+    service = TaskService(None, CacheManager(get_redis(), get_redis_raw()), shards=shards)
+    page = service.get_tasks(skip=1, limit=2, sort_by="title", sort_order="asc")
+    assert [task.title for task in page.tasks] == ["c other", "d second"]
+    assert page.total == 3
+    assert service.get_task(other["id"]).title == "c other"
+
+
+def test_atomic_batch_stays_on_one_shard(shards: ShardRouter, client: TestClient):
+    """Test that an atomic batch commits on its shard and can't reach another one."""
+    (alice, alice_headers), (bob, bob_headers) = _users_on_distinct_shards(client, shards)
+
+    data = client.post("/api/v1/batch", headers=alice_headers, json={"atomic": True, "requests": [
+        {"method": "POST", "path": "/api/v1/tasks/", "body": {"title": "One"}},
+        {"method": "POST", "path": "/api/v1/tasks/", "body": {"title": "Two"}}
+    ]}).json()
+    assert data["committed"] is True
+    created = {item["body"]["id"] for item in data["responses"]}
+    assert _task_ids_on(shards, shards.shard_for_user(alice)) == created
+
+    data = client.post("/api/v1/batch", headers=alice_headers, json={"atomic": True, "requests": [
+        {"method": "POST", "path": "/api/v1/tasks/", "body": {"title": "Rolled back"}},
+        {"method": "POST", "path": "/api/v1/tasks/", "body": {"title": "Bob's"},
+         "headers": {"Authorization": bob_headers["Authorization"]}}
+    ]}).json()
+    assert data["committed"] is False
+    assert [item["status"] for item in data["responses"]] == [201, 409]
+    assert _task_ids_on(shards, shards.shard_for_user(alice)) == created
+    assert _task_ids_on(shards, shards.shard_for_user(bob)) == set()
+
+
+def test_rebalance_moves_users_with_their_ids(use_shards, client: TestClient):
+    """Test that adding a shard and rebalancing keeps tasks, ids and dependencies."""
+    use_shards(2)
+    wider = HashRing(["shard0", "shard1", "shard2"])
+    for index in range(50):
+        user_id, headers = _sign_up(client, f"user{index}")
+        if wider.get_node(f"user:{user_id}") == "shard2":
+            break
+
+    first = client.post("/api/v1/tasks/", json={"title": "First"}, headers=headers).json()
+    second = client.post(
+        "/api/v1/tasks/", json={"title": "Second", "depends_on": [first["id"]]}, headers=headers
+    ).json()
+    token = client.get("/api/v1/tasks/changes", headers=headers).json()["next_token"]
+    source = get_shard_router().shard_for_user(user_id)
+
+    router = use_shards(3)
+    assert ShardedTaskCRUD(router).rebalance() == {user_id: "shard2"}
+    assert _task_ids_on(router, source) == set()
+    assert _task_ids_on(router, "shard2") == {first["id"], second["id"]}
+
+    assert client.get(f"/api/v1/tasks/{second['id']}", headers=headers).json()["title"] == "Second"
+    graph = client.get(f"/api/v1/tasks/{second['id']}/dependencies?format=graph", headers=headers).json()
+    assert graph["edges"] == [{"task_id": second["id"], "depends_on_id": first["id"]}]
+    # The change log stayed behind, sync tokens of the old shard expire
+    assert client.get(f"/api/v1/tasks/changes?since={token}", headers=headers).status_code == 410
+    # New tasks don't reuse the moved ids
+    assert client.post("/api/v1/tasks/", json={"title": "Third"}, headers=headers).json()["id"] > second["id"]
@@ -0,0 +1,73 @@
+from fastapi.testclient import TestClient
+
+
+def test_stats_follow_task_writes(client: TestClient):
+    """Test that stats counters are updated on create, update and delete."""
+    first = client.post("/api/v1/tasks/", json={"title": "Task 1", "priority": "high"}).json()
+    second = client.post("/api/v1/tasks/", json={"title": "Task 2", "priority": "low"}).json()
+
+    client.put(f"/api/v1/tasks/{first['id']}", json={"status": "completed"})
+    client.delete(f"/api/v1/tasks/{second['id']}")
+
+    response = client.get("/api/v1/stats/")
+    assert response.status_code == 200
+    data = response.json()
+    assert data["total"] == 1
+    assert data["by_status"]["completed"] == 1
+    assert data["by_status"]["pending"] == 0
+    assert data["by_priority"]["high"] == 1
+    assert data["by_priority"]["low"] == 0
+    assert sum(data["completions_per_day"].values()) == 1
+
+
+def test_stats_are_scoped_to_the_user(client: TestClient):
+    """Test that users only see their own counters and admins see everyone's."""
+    from src.database import new_session
+    from src.models.user import User
+
+    client.post("/api/v1/tasks/", json={"title": "Mine"})
+    client.post("/api/v1/users/", json={"username": "other", "email": "other@example.com", "password": "secret123"})
+    token = client.post(
+        "/api/v1/users/login", data={"username": "other", "password": "secret123"}
+    ).json()["access_token"]
+    other = {"Authorization": f"Bearer {token}"}
+
+    assert client.get("/api/v1/stats/", headers={"Authorization": ""}).status_code == 401
+    assert client.get("/api/v1/stats/?user_id=1", headers=other).json()["total"] == 0
+    assert client.get("/api/v1/stats/all", headers=other).status_code == 403
+
+    db = new_session()
+    db.query(User).filter(User.username == "other").update({"is_admin": True})
+    db.commit()
+    db.close()
+    assert client.get("/api/v1/stats/all", headers=other).json()["total"] == 1
+
+
+def test_completions_stay_on_their_day(client: TestClient):
+    """Test that editing a completed task doesn't move its completion to another day."""
+    from datetime import datetime, timedelta
+    from src.crud.stats import TaskStats
+    from src.database import get_redis, new_session
+    from src.models.task import Task
+    from src.services.write_coalescer import get_write_coalescer
+
+    task = client.post("/api/v1/tasks/", json={"title": "Done", "priority": "low"}).json()
+    client.put(f"/api/v1/tasks/{task['id']}", json={"status": "completed"})
+    yesterday = datetime.now() - timedelta(days=1)
+    db = new_session()
+    try:
+        db.query(Task).filter(Task.id == task["id"]).update({"completed_at": yesterday})
+        db.commit()
+        TaskStats(get_redis()).reconcile(db)
+    finally:
+        db.close()
+
+    client.put(f"/api/v1/tasks/{task['id']}", json={"priority": "high", "title": "Done, renamed"})
+    client.put(f"/api/v1/tasks/{task['id']}?coalesce=true", json={"priority": "medium"})
+    get_write_coalescer().flush()
+    assert client.get("/api/v1/stats/").json()["completions_per_day"] == {yesterday.date().isoformat(): 1}
+
+    # Reopening and completing again counts it today
+    client.put(f"/api/v1/tasks/{task['id']}", json={"status": "pending"})
+    client.put(f"/api/v1/tasks/{task['id']}", json={"status": "completed"})
+    assert client.get("/api/v1/stats/").json()["completions_per_day"] == {datetime.now().date().isoformat(): 1}
@@ -1,5 +1,6 @@
 import pytest
 from fastapi.testclient import TestClient
+from starlette.websockets import WebSocketDisconnect
 from sqlalchemy.orm import Session
 from src.models.task import Task, TaskStatus, TaskPriority
 
@@ -175,4 +176,490 @@ def test_task_dependencies(client: TestClient):
         json={"status": "completed"}
     )
     assert response.status_code == 400
-    assert "Cannot mark task as completed" in response.json()["detail"]
\ No newline at end of file
+    assert "Cannot mark task as completed" in response.json()["detail"]
+
+    # Repeated dependency ids are created once
+    response = client.post(
+        "/api/v1/tasks/",
+        json={"title": "Task 3", "depends_on": [task1_id, task1_id]}
+    )
+    assert response.status_code == 201
+    task3_id = response.json()["id"]
+    response = client.get(f"/api/v1/tasks/{task3_id}/dependencies?format=graph")
+    assert response.json()["edges"] == [{"task_id": task3_id, "depends_on_id": task1_id}]
+    client.put(f"/api/v1/tasks/{task1_id}", json={"status": "completed"})
+    response = client.put(f"/api/v1/tasks/{task3_id}", json={"status": "completed"})
+    assert response.status_code == 200
+
+
+def test_coalesced_updates(client: TestClient, monkeypatch):
+    """Test coalesced status/priority updates."""
+    from unittest.mock import Mock
+    from sqlalchemy.exc import OperationalError
+    from src.crud.task import task_crud
+    from src.services.write_coalescer import get_write_coalescer
+
+    task1_id = client.post("/api/v1/tasks/", json={"title": "Task 1"}).json()["id"]
+    task2_id = client.post(
+        "/api/v1/tasks/",
+        json={"title": "Task 2", "depends_on": [task1_id]}
+    ).json()["id"]
+
+    # Bursts are merged last-write-wins and accepted immediately
+    client.put(f"/api/v1/tasks/{task1_id}?coalesce=true", json={"status": "in_progress"})
+    response = client.put(f"/api/v1/tasks/{task1_id}?coalesce=true", json={"priority": "high"})
+    assert response.status_code == 202
+    assert response.json()["status"] == "in_progress"
+    assert response.json()["priority"] == "high"
+
+    # Dependency-gated completions are still validated synchronously
+    response = client.put(f"/api/v1/tasks/{task2_id}?coalesce=true", json={"status": "completed"})
+    assert response.status_code == 400
+
+    get_write_coalescer().flush()
+    data = client.get(f"/api/v1/tasks/{task1_id}").json()
+    assert data["status"] == "in_progress"
+    assert data["priority"] == "high"
+
+    # A direct update wins over older buffered values of the same field
+    client.put(f"/api/v1/tasks/{task1_id}?coalesce=true", json={"priority": "low", "status": "pending"})
+    client.put(f"/api/v1/tasks/{task1_id}", json={"priority": "medium"})
+    get_write_coalescer().flush()
+    data = client.get(f"/api/v1/tasks/{task1_id}").json()
+    assert data["priority"] == "medium"
+    assert data["status"] == "pending"
+
+    # A failed flush keeps its updates for the retry
+    client.put(f"/api/v1/tasks/{task1_id}?coalesce=true", json={"status": "completed"})
+    with monkeypatch.context() as failing:
+        failing.setattr(task_crud, "bulk_update_fields", Mock(side_effect=OperationalError("UPDATE", {}, None)))
+        assert get_write_coalescer().flush() == 0
+    get_write_coalescer().flush()
+    assert client.get(f"/api/v1/tasks/{task1_id}").json()["status"] == "completed"
+
+    # A completion whose dependency was reopened after it was accepted isn't written
+    blocked_id = client.post("/api/v1/tasks/", json={"title": "Blocked", "depends_on": [task1_id]}).json()["id"]
+    response = client.put(f"/api/v1/tasks/{blocked_id}?coalesce=true", json={"status": "completed"})
+    assert response.status_code == 202
+    client.put(f"/api/v1/tasks/{task1_id}", json={"status": "pending"})
+    assert get_write_coalescer().flush() == 0
+    assert client.get(f"/api/v1/tasks/{blocked_id}").json()["status"] == "pending"
+
+
+def test_task_change_feed(client: TestClient):
+    """Test the WebSocket change feed with filters and resume."""
+    with client.websocket_connect("/api/v1/tasks/stream/ws?status=pending") as websocket:
+        client.post("/api/v1/tasks/", json={"title": "Task 1"})
+        client.post("/api/v1/tasks/", json={"title": "Task 2", "status": "completed"})
+        client.post("/api/v1/tasks/", json={"title": "Task 3"})
+
+        first = websocket.receive_json()
+        second = websocket.receive_json()
+        assert first["type"] == "created"
+        assert first["data"]["title"] == "Task 1"
+        assert second["data"]["title"] == "Task 3"
+
+    # Resuming replays everything after the last received event
+    with client.websocket_connect(f"/api/v1/tasks/stream/ws?last_event_id={first['id']}") as websocket:
+        assert websocket.receive_json()["data"]["title"] == "Task 2"
+
+
+def test_sparse_fieldsets(client: TestClient):
+    """Test selecting fields on list and single-task reads."""
+    task_id = client.post(
+        "/api/v1/tasks/",
+        json={"title": "Sparse", "description": "x" * 500, "priority": "high"}
+    ).json()["id"]
+
+    response = client.get("/api/v1/tasks/?fields=title,priority,description_preview")
+    assert response.status_code == 200
+    task = response.json()["tasks"][0]
+    assert set(task) == {"id", "title", "priority", "description_preview"}
+    assert task["priority"] == "high"
+    assert len(task["description_preview"]) < 500
+
+    # Only the projected columns were loaded, nothing to cache as task:{id}
+    from src.database import get_redis
+    assert not get_redis().exists(f"task:{task_id}")
+    client.get(f"/api/v1/tasks/{task_id}")
+    response = client.get("/api/v1/tasks/?fields=title,priority,description_preview&limit=50")
+    assert response.json()["tasks"] == [task]
+
+    response = client.get(f"/api/v1/tasks/{task_id}?fields=status")
+    assert response.json() == {"id": task_id, "status": "pending"}
+
+    response = client.get("/api/v1/tasks/?fields=title,secret")
+    assert response.status_code == 400
+
+
+def test_cached_reads_serve_stored_json(client: TestClient):
+    """Test that cache hits return the same body as the original miss."""
+    task_id = client.post("/api/v1/tasks/", json={"title": "Cached"}).json()["id"]
+
+    first = client.get("/api/v1/tasks/")
+    second = client.get("/api/v1/tasks/")
+    assert first.status_code == 200
+    assert first.headers["content-type"] == "application/json"
+    assert second.content == first.content
+    assert second.json()["tasks"][0]["id"] == task_id
+
+    first = client.get(f"/api/v1/tasks/{task_id}")
+    second = client.get(f"/api/v1/tasks/{task_id}")
+    assert second.content == first.content
+    assert second.json()["title"] == "Cached"
+
+
+def test_ready_and_blocked_tasks(client: TestClient):
+    """Test the pending dependency counts behind /ready and ?blocked=."""
+    first = client.post("/api/v1/tasks/", json={"title": "First"}).json()["id"]
+    second = client.post("/api/v1/tasks/", json={"title": "Second"}).json()["id"]
+    third = client.post(
+        "/api/v1/tasks/", json={"title": "Third", "depends_on": [first, second]}
+    ).json()["id"]
+
+    def ids(url):
+        return {task["id"] for task in client.get(url).json()["tasks"]}
+
+    assert ids("/api/v1/tasks/ready") == {first, second}
+    assert ids("/api/v1/tasks/?blocked=true") == {third}
+    assert ids("/api/v1/tasks/?blocked=false") == {first, second}
+
+    response = client.put(f"/api/v1/tasks/{third}", json={"status": "completed"})
+    assert response.status_code == 400
+    assert str(first) in response.json()["detail"]
+
+    client.put(f"/api/v1/tasks/{first}", json={"status": "completed"})
+    assert ids("/api/v1/tasks/ready") == {second}
+
+    # Removing the last incomplete dependency unblocks the task
+    client.delete(f"/api/v1/tasks/{third}/dependencies/{second}")
+    assert ids("/api/v1/tasks/ready") == {second, third}
+
+    # Reopening a dependency blocks its dependents again
+    client.put(f"/api/v1/tasks/{first}", json={"status": "pending"})
+    assert ids("/api/v1/tasks/?blocked=true") == {third}
+
+    client.post(f"/api/v1/tasks/{third}/dependencies", json={"depends_on_id": second})
+    client.delete(f"/api/v1/tasks/{first}")
+    client.delete(f"/api/v1/tasks/{second}")
+    assert ids("/api/v1/tasks/ready") == {third}
+
+
+def test_dependency_graph(client: TestClient):
+    """Test the deduplicated graph format of a diamond dependency."""
+    base = client.post("/api/v1/tasks/", json={"title": "Base"}).json()["id"]
+    left = client.post("/api/v1/tasks/", json={"title": "Left", "depends_on": [base]}).json()["id"]
+    right = client.post("/api/v1/tasks/", json={"title": "Right", "depends_on": [base]}).json()["id"]
+    top = client.post("/api/v1/tasks/", json={"title": "Top", "depends_on": [left, right]}).json()["id"]
+
+    response = client.get(f"/api/v1/tasks/{top}/dependencies?format=graph")
+    assert response.status_code == 200
+    graph = response.json()
+    assert graph["root"] == top
+    assert {node["id"]: node["depth"] for node in graph["nodes"]} == {top: 0, left: 1, right: 1, base: 2}
+    assert len(graph["edges"]) == 4
+
+    # Changing a shared dependency invalidates the cached graph
+    client.put(f"/api/v1/tasks/{base}", json={"title": "Renamed"})
+    graph = client.get(f"/api/v1/tasks/{top}/dependencies?format=graph").json()
+    assert [node["title"] for node in graph["nodes"] if node["id"] == base] == ["Renamed"]
+
+    tree = client.get(f"/api/v1/tasks/{top}/dependencies").json()
+    assert tree["task"]["id"] == top
+    assert len(tree["dependencies"]) == 2
+
+    assert client.get("/api/v1/tasks/999/dependencies?format=graph").status_code == 404
+
+
+def test_list_pages_share_id_windows(client: TestClient):
+    """Test that pages of one query are sliced from the same cached id window."""
+    from src.database import get_redis
+
+    task_ids = [
+        client.post("/api/v1/tasks/", json={"title": f"Task {i}", "priority": "high"}).json()["id"]
+        for i in range(5)
+    ]
+
+    full = client.get("/api/v1/tasks/?priority=high&sort_by=id").json()
+    assert [task["id"] for task in full["tasks"]] == task_ids
+    assert full["total"] == 5
+
+    # Other page sizes reuse the window instead of adding keys
+    page = client.get("/api/v1/tasks/?priority=high&sort_by=id&skip=2&limit=2").json()
+    assert [task["id"] for task in page["tasks"]] == task_ids[2:4]
+    assert page["page"] == 2 and page["total_pages"] == 3
+    assert len(get_redis().keys("tasks:ids:*")) == 1
+
+    # So does the same tag set in another order
+    client.get("/api/v1/tasks/?tags=a&tags=b")
+    client.get("/api/v1/tasks/?tags=b&tags=a&limit=10")
+    assert len(get_redis().keys("tasks:ids:*")) == 2
+
+    client.put(f"/api/v1/tasks/{task_ids[3]}", json={"title": "Renamed"})
+    page = client.get("/api/v1/tasks/?priority=high&sort_by=id&skip=3&limit=1&fields=title").json()
+    assert page["tasks"] == [{"id": task_ids[3], "title": "Renamed"}]
+
+
+def test_get_tasks_by_ids(client: TestClient):
+    """Test fetching specific tasks by id in request order."""
+    from src.database import get_redis
+
+    first = client.post("/api/v1/tasks/", json={"title": "First"}).json()["id"]
+    second = client.post("/api/v1/tasks/", json={"title": "Second"}).json()["id"]
+    client.get(f"/api/v1/tasks/{first}")
+
+    response = client.get(f"/api/v1/tasks/lookup?ids={second},999,{first}")
+    assert response.status_code == 200
+    data = response.json()
+    assert [task["id"] for task in data["tasks"]] == [second, first]
+    assert data["missing"] == [999]
+
+    # Missing ids are remembered briefly, found ones were backfilled
+    assert get_redis().get("task:999") == ""
+    assert get_redis().exists(f"task:{second}")
+    assert client.get("/api/v1/tasks/999").status_code == 404
+
+    response = client.get(f"/api/v1/tasks/lookup?ids={first}&fields=title")
+    assert response.json() == {"tasks": [{"id": first, "title": "First"}], "missing": []}
+    assert client.get("/api/v1/tasks/lookup?ids=1,x").status_code == 400
+    assert client.get("/api/v1/tasks/lookup").status_code == 422
+
+
+def test_list_pages_are_served_precompressed(client: TestClient, monkeypatch):
+    """Test that cached pages are stored in each encoding and served by Accept-Encoding."""
+    import zstandard
+    from src.database import get_redis
+    from src.services.task_service import TaskService
+
+    for i in range(5):
+        client.post("/api/v1/tasks/", json={"title": f"Task {i}", "description": "x" * 500})
+
+    plain = client.get("/api/v1/tasks/?sort_by=id", headers={"Accept-Encoding": "identity"})
+    assert "content-encoding" not in plain.headers
+    assert plain.headers["vary"] == "Accept-Encoding"
+    assert len(get_redis().keys("tasks:resp:*")) == 3  # body, zstd and gzip (brotli is optional)
+
+    # Hits are served from the stored encodings without assembling the page
+    def fail(*args, **kwargs):
+        raise AssertionError("page was rebuilt")
+    monkeypatch.setattr(TaskService, "get_tasks_json", fail)
+
+    response = client.get("/api/v1/tasks/?sort_by=id", headers={"Accept-Encoding": "gzip, zstd"})
+    assert response.headers["content-encoding"] == "zstd"
+    assert zstandard.ZstdDecompressor().decompress(response.content) == plain.content
+
+    # The client's q values decide, server preference only breaks ties
+    response = client.get("/api/v1/tasks/?sort_by=id", headers={"Accept-Encoding": "zstd;q=0.1, gzip;q=1"})
+    assert response.headers["content-encoding"] == "gzip"
+
+    response = client.get("/api/v1/tasks/?sort_by=id", headers={"Accept-Encoding": "gzip, zstd;q=0"})
+    assert response.headers["content-encoding"] == "gzip"
+    assert response.content == plain.content  # decoded by the client
+
+
+def test_user_scoped_tasks(client: TestClient):
+    """Test that authenticated users only see and change their own tasks and lists."""
+    from src.database import get_redis
+
+    headers = {}
+    for name in ("alice", "bob"):
+        client.post("/api/v1/users/", json={"username": name, "email": f"{name}@example.com", "password": "secret123"})
+        token = client.post(
+            "/api/v1/users/login", data={"username": name, "password": "secret123"}
+        ).json()["access_token"]
+        headers[name] = {"Authorization": f"Bearer {token}"}
+
+    alice_task = client.post("/api/v1/tasks/", json={"title": "Alice's"}, headers=headers["alice"]).json()
+    bob_task = client.post("/api/v1/tasks/", json={"title": "Bob's"}, headers=headers["bob"]).json()
+    assert alice_task["user_id"] != bob_task["user_id"]
+
+    listed = client.get("/api/v1/tasks/", headers=headers["alice"]).json()
+    assert [task["id"] for task in listed["tasks"]] == [alice_task["id"]]
+    assert client.get("/api/v1/tasks/", headers={"Authorization": ""}).status_code == 401
+
+    # Other users' tasks look missing
+    assert client.get(f"/api/v1/tasks/{bob_task['id']}", headers=headers["alice"]).status_code == 404
+    assert client.put(
+        f"/api/v1/tasks/{bob_task['id']}", json={"title": "Mine"}, headers=headers["alice"]
+    ).status_code == 404
+    assert client.delete(f"/api/v1/tasks/{bob_task['id']}", headers=headers["alice"]).status_code == 404
+    by_ids = client.get(f"/api/v1/tasks/lookup?ids={alice_task['id']},{bob_task['id']}", headers=headers["alice"]).json()
+    assert by_ids["missing"] == [bob_task["id"]]
+
+    # Bob's write leaves Alice's cached lists alone
+    client.get("/api/v1/tasks/", headers=headers["bob"])
+    namespace = f"u{alice_task['user_id']}"
+    alice_keys = set(get_redis().keys(f"tasks:*:{namespace}:*"))
+    assert alice_keys
+    client.put(f"/api/v1/tasks/{bob_task['id']}", json={"title": "Renamed"}, headers=headers["bob"])
+    assert set(get_redis().keys(f"tasks:*:{namespace}:*")) == alice_keys
+    assert not get_redis().keys(f"tasks:*:u{bob_task['user_id']}:*")
+
+    # The change feed only carries the user's own tasks
+    with pytest.raises(WebSocketDisconnect):
+        with client.websocket_connect("/api/v1/tasks/stream/ws", headers={"Authorization": ""}):
+            pass
+    token = headers["alice"]["Authorization"].split()[1]
+    with client.websocket_connect(f"/api/v1/tasks/stream/ws?token={token}", headers={"Authorization": ""}) as websocket:
+        bob_second = client.post("/api/v1/tasks/", json={"title": "Bob's second"}, headers=headers["bob"]).json()
+        client.post(
+            f"/api/v1/tasks/{bob_second['id']}/dependencies", json={"depends_on_id": bob_task["id"]},
+            headers=headers["bob"]
+        )
+        alice_second = client.post("/api/v1/tasks/", json={"title": "Alice's second"}, headers=headers["alice"]).json()
+        assert websocket.receive_json()["data"]["title"] == "Alice's second"
+        client.post(
+            f"/api/v1/tasks/{alice_task['id']}/dependencies", json={"depends_on_id": alice_second["id"]},
+            headers=headers["alice"]
+        )
+        event = websocket.receive_json()
+        assert event["type"] == "dependency_added"
+        assert event["data"] == {"task_id": alice_task["id"], "depends_on_id": alice_second["id"]}
+
+    # Other users' tasks can't be depended on, and edges to them (made by
+    # unscoped internal code) don't reveal them
+    response = client.post(
+        "/api/v1/tasks/", json={"title": "Sneaky", "depends_on": [bob_task["id"]]}, headers=headers["alice"]
+    )
+    assert response.status_code == 400
+    from src.crud.task import task_crud
+    from src.database import new_session
+    db = new_session()
+    try:
+        task_crud.add_dependency(db, alice_second["id"], bob_task["id"])
+    finally:
+        db.close()
+    tree = client.get(f"/api/v1/tasks/{alice_second['id']}/dependencies", headers=headers["alice"]).json()
+    assert tree["dependencies"] == []
+    graph = client.get(f"/api/v1/tasks/{alice_task['id']}/dependencies?format=graph", headers=headers["alice"]).json()
+    assert {node["id"] for node in graph["nodes"]} == {alice_task["id"], alice_second["id"]}
+    assert graph["edges"] == [{"task_id": alice_task["id"], "depends_on_id": alice_second["id"]}]
+
+    # Leases can only be renewed by their owner
+    claimed = client.post("/api/v1/tasks/claim", json={"worker_id": "w1"}, headers=headers["bob"]).json()["tasks"]
+    assert [task["id"] for task in claimed] == [bob_task["id"]]
+    heartbeat = {"worker_id": "w1"}
+    assert client.post(f"/api/v1/tasks/{bob_task['id']}/heartbeat", json=heartbeat, headers=headers["alice"]).status_code == 409
+    assert client.post(f"/api/v1/tasks/{bob_task['id']}/heartbeat", json=heartbeat, headers=headers["bob"]).status_code == 200
+
+
+def test_claim_tasks_with_leases(client: TestClient):
+    """Test claiming ready tasks by priority, heartbeats and reclaiming expired leases."""
+    from datetime import datetime, timedelta
+    from src.database import new_session
+    from src.services.task_service import release_expired_leases
+
+    low = client.post("/api/v1/tasks/", json={"title": "Low", "priority": "low"}).json()["id"]
+    high = client.post("/api/v1/tasks/", json={"title": "High", "priority": "high"}).json()["id"]
+    medium = client.post("/api/v1/tasks/", json={"title": "Medium", "priority": "medium"}).json()["id"]
+    client.post("/api/v1/tasks/", json={"title": "Blocked", "priority": "high", "depends_on": [low]})
+
+    first = client.post("/api/v1/tasks/claim?n=2", json={"worker_id": "w1", "lease_seconds": 60}).json()
+    assert [task["id"] for task in first["tasks"]] == [high, medium]
+    assert all(task["status"] == "in_progress" for task in first["tasks"])
+    second = client.post("/api/v1/tasks/claim?n=5", json={"worker_id": "w2"}).json()
+    assert [task["id"] for task in second["tasks"]] == [low]
+    assert client.post("/api/v1/tasks/claim", json={"worker_id": "w3"}).json()["tasks"] == []
+
+    assert client.post(f"/api/v1/tasks/{high}/heartbeat", json={"worker_id": "w2"}).status_code == 409
+    assert client.post(f"/api/v1/tasks/{high}/heartbeat", json={"worker_id": "w1"}).status_code == 200
+
+    # w1 dies: its expired leases are reclaimed by the next claim or the sweep
+    db = new_session()
+    db.query(Task).filter(Task.id.in_([high, medium])).update(
+        {"lease_expires_at": datetime.now() - timedelta(seconds=1)}, synchronize_session=False
+    )
+    db.commit()
+    db.close()
+    reclaimed = client.post("/api/v1/tasks/claim", json={"worker_id": "w3"}).json()
+    assert [task["id"] for task in reclaimed["tasks"]] == [high]
+    assert release_expired_leases() == 1
+    task = client.get(f"/api/v1/tasks/{medium}").json()
+    assert task["status"] == "pending"
+    # The sweep's event carries the whole task, like other updates
+    import json
+    from src.config import settings
+    from src.database import get_redis
+    [(_, event)] = get_redis().xrevrange(settings.event_stream_key, count=1)
+    assert json.loads(event["data"]) == task
+
+    # Completing ends the lease
+    client.put(f"/api/v1/tasks/{low}", json={"status": "completed"})
+    assert client.post(f"/api/v1/tasks/{low}/heartbeat", json={"worker_id": "w2"}).status_code == 409
+
+
+def test_conditional_updates(client: TestClient):
+    """Test If-Match / version updates and 412 on a stale version."""
+    task = client.post("/api/v1/tasks/", json={"title": "Versioned"}).json()
+    assert task["version"] == 1
+
+    response = client.put(f"/api/v1/tasks/{task['id']}", json={"title": "First"}, headers={"If-Match": '"1"'})
+    assert response.status_code == 200
+    assert response.json()["version"] == 2
+    assert response.headers["etag"] == '"2"'
+
+    # A writer still holding version 1 loses
+    stale = client.put(f"/api/v1/tasks/{task['id']}", json={"title": "Second", "version": 1})
+    assert stale.status_code == 412
+    assert stale.headers["etag"] == '"2"'
+    current = client.get(f"/api/v1/tasks/{task['id']}")
+    assert current.json()["title"] == "First"
+    # A read hands out the ETag to send back, also for sparse reads
+    assert current.headers["etag"] == '"2"'
+    assert client.get(f"/api/v1/tasks/{task['id']}?fields=title").headers["etag"] == '"2"'
+
+    done = client.put(f"/api/v1/tasks/{task['id']}", json={"status": "completed", "version": 2})
+    assert done.json()["status"] == "completed"
+    assert done.json()["version"] == 3
+    # Without a precondition the update always applies
+    assert client.put(f"/api/v1/tasks/{task['id']}", json={"priority": "high"}).json()["version"] == 4
+    assert client.put("/api/v1/tasks/999999", json={"title": "x"}, headers={"If-Match": '"1"'}).status_code == 404
+
+
+def test_suggest_tasks(client: TestClient):
+    """Test title/tag prefix suggestions ranked by priority and kept current by writes."""
+    low = client.post("/api/v1/tasks/", json={"title": "Report draft", "priority": "low"}).json()["id"]
+    high = client.post("/api/v1/tasks/", json={"title": "Quarterly report", "priority": "high"}).json()["id"]
+    tagged = client.post("/api/v1/tasks/", json={"title": "Email", "tags": ["reporting"]}).json()["id"]
+
+    suggestions = client.get("/api/v1/tasks/suggest?q=rep").json()
+    assert [task["id"] for task in suggestions] == [high, tagged, low]
+    assert [task["id"] for task in client.get("/api/v1/tasks/suggest?q=report dr").json()] == [low]
+
+    client.put(f"/api/v1/tasks/{low}", json={"title": "Budget"})
+    client.delete(f"/api/v1/tasks/{tagged}")
+    assert [task["id"] for task in client.get("/api/v1/tasks/suggest?q=rep").json()] == [high]
+    assert [task["id"] for task in client.get("/api/v1/tasks/suggest?q=bud").json()] == [low]
+
+
+def test_task_changes_delta_sync(client: TestClient):
+    """Test syncing creates, updates and deletes from a token, in bounded chunks."""
+    kept = client.post("/api/v1/tasks/", json={"title": "Before sync"}).json()["id"]
+    start = client.get("/api/v1/tasks/changes").json()
+    assert start["changed"] == [] and start["has_more"] is False
+
+    created = client.post("/api/v1/tasks/", json={"title": "New"}).json()["id"]
+    client.put(f"/api/v1/tasks/{kept}", json={"status": "completed"})
+    client.put(f"/api/v1/tasks/{created}", json={"title": "New, renamed"})
+    doomed = client.post("/api/v1/tasks/", json={"title": "Doomed"}).json()["id"]
+    client.delete(f"/api/v1/tasks/{doomed}")
+
+    full = client.get(f"/api/v1/tasks/changes?since={start['next_token']}").json()
+    assert [task["id"] for task in full["changed"]] == [kept, created]
+    assert full["changed"][1]["title"] == "New, renamed"
+    assert full["deleted"] == [doomed]
+    assert client.get(f"/api/v1/tasks/changes?since={full['next_token']}").json()["changed"] == []
+
+    # The same changes in chunks of two log entries
+    token, changed, deleted = start["next_token"], set(), set()
+    while True:
+        chunk = client.get(f"/api/v1/tasks/changes?since={token}&limit=2").json()
+        changed.update(task["id"] for task in chunk["changed"])
+        deleted.update(chunk["deleted"])
+        token = chunk["next_token"]
+        if not chunk["has_more"]:
+            break
+    assert changed == {kept, created} and deleted == {doomed}
+
+    assert client.get("/api/v1/tasks/changes?since=garbage").status_code == 400
+    assert client.get("/api/v1/tasks/changes?since=1.1000").status_code == 410
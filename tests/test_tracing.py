@@ -0,0 +1,43 @@
+import json
+from fastapi.testclient import TestClient
+from src.config import settings
+from src.main import app
+from src.utils.tracing import tracer, TracingMiddleware
+
+
+def test_sampled_request_is_traced(client: TestClient, tmp_path, monkeypatch):
+    """Test that a sampled traceparent produces spans from every layer."""
+    trace_file = tmp_path / "traces.jsonl"
+    monkeypatch.setattr(settings, "trace_exporter", "file")
+    monkeypatch.setattr(settings, "trace_file", str(trace_file))
+    monkeypatch.setattr(settings, "trace_sample_rate", 0.0)
+
+    client.post("/api/v1/tasks/", json={"title": "Traced"})
+
+    traced_client = TestClient(TracingMiddleware(app))
+    traced_client.headers["Authorization"] = client.headers["Authorization"]
+    trace_id = "0af7651916cd43dd8448eb211c80319c"
+    try:
+        response = traced_client.get(
+            "/api/v1/tasks/", headers={"traceparent": f"00-{trace_id}-b7ad6b7169203331-01"}
+        )
+        assert response.headers["x-trace-id"] == trace_id
+        # Not sampled: no header, no spans
+        assert "x-trace-id" not in traced_client.get("/api/v1/tasks/?limit=5").headers
+    finally:
+        tracer.close()
+
+    spans = [json.loads(line) for line in trace_file.read_text().splitlines()]
+    assert {span["trace_id"] for span in spans} == {trace_id}
+    names = {span["name"] for span in spans}
+    assert {
+        "GET /api/v1/tasks/", "route GET /api/v1/tasks/", "TaskService.get_tasks_json",
+        "TaskCRUD.get_task_ids", "CacheManager.mget_raw", "db.execute"
+    } <= names
+    root = next(span for span in spans if span["name"] == "GET /api/v1/tasks/")
+    assert root["parent_id"] == "b7ad6b7169203331"
+    # The request span is the server side even under a remote parent
+    assert root["kind"] == "server"
+    assert {span["kind"] for span in spans if span["name"] == "db.execute"} == {"client"}
+    assert {span["kind"] for span in spans if span["name"].startswith("route ")} == {"internal"}
+    assert root["attributes"]["http.status_code"] == 200